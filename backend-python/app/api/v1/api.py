@@ -2,6 +2,8 @@ from fastapi import APIRouter
 
 from .endpoints import cards
 from .endpoints import cards_langgraph
+from .endpoints import metrics
+from .endpoints import jobs
 
 api_router = APIRouter()
 
@@ -9,4 +11,10 @@ api_router = APIRouter()
 api_router.include_router(cards.router, prefix="/cards", tags=["cards"])
 
 # 添加新的LangGraph端点
-api_router.include_router(cards_langgraph.router, prefix="/cards-langgraph", tags=["cards-langgraph"])
\ No newline at end of file
+api_router.include_router(cards_langgraph.router, prefix="/cards-langgraph", tags=["cards-langgraph"])
+
+# 异步批量生成任务
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+
+# 运行时指标
+api_router.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
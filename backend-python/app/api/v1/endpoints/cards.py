@@ -2,7 +2,6 @@ from typing import List, Optional
 from uuid import uuid4
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Query, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-import asyncio
 
 from ....schemas.card import (
     AnkiCard,
@@ -12,18 +11,30 @@ from ....schemas.card import (
     ApiResponse,
     LLMResponse,
     ImproveCardRequest,
+    BatchSettings,
     Card, CardCreate, CardUpdate, CardList, CardDelete, BatchCardSave
 )
 from ....services.ai_service import AIService
 from ....services.card_service import CardService
+from ....services.idempotency import mark_degraded
+from ....services.packed_generation import PackedAnswerGenerator, resolve_pack_size
+from ....core.cache import normalize_question
+from ....core.concurrency import run_bounded
+from ....core.config import settings as app_settings
 from ....core.database import get_db
+from ....core.singleflight import collapse, expand, singleflight
+from ....core.usage import track_usage
+from ....utils.idempotency import idempotent
+from ....utils.sse import format_sse, sse_response
 
 
 router = APIRouter()
 ai_service = AIService()
+packed_generator = PackedAnswerGenerator()
 
 
 @router.post("/generate", response_model=ApiResponse[dict])
+@idempotent("cards/generate")
 async def generate_card(request: CardGenerationRequest):
     """
     生成单个卡片
@@ -35,33 +46,45 @@ async def generate_card(request: CardGenerationRequest):
                 detail="Question is required"
             )
 
-        # 生成回答
-        llm_response = await ai_service.generate_answer(request.question)
-
-        if not llm_response.success or not llm_response.answer:
-            raise HTTPException(
-                status_code=500,
-                detail=llm_response.error or "Failed to generate answer"
+        with track_usage() as usage:
+            # 生成回答
+            llm_response = await ai_service.generate_answer(
+                request.question,
+                use_cache=request.use_cache is not False
             )
 
-        # 创建卡片
-        card = AnkiCard(
-            id=uuid4(),
-            front=request.question,
-            back=llm_response.answer,
-            tags=request.tags or [],
-            deck_name=request.deck_name or "Default",
-            card_type=request.card_type or "basic"
-        )
+            if not llm_response.success or not llm_response.answer:
+                raise HTTPException(
+                    status_code=500,
+                    detail=llm_response.error or "Failed to generate answer"
+                )
 
-        # 质量检查
-        quality_check = await ai_service.quality_check(card)
+            # 创建卡片
+            card = AnkiCard(
+                id=uuid4(),
+                front=request.question,
+                back=llm_response.answer,
+                tags=request.tags or [],
+                deck_name=request.deck_name or "Default",
+                card_type=request.card_type or "basic"
+            )
+
+            # 质量检查
+            quality_check = await ai_service.quality_check(card)
 
         return ApiResponse(
             success=True,
             data={
                 "card": card.dict(),
-                "quality_check": quality_check.dict()
+                "quality_check": quality_check.dict(),
+                "tokens_used": usage.total.total_tokens,
+                "token_usage": usage.node_usage(),
+                "cached": llm_response.cached,
+                "model": llm_response.model,
+                "semantic_match": {
+                    "matched_question": llm_response.matched_question,
+                    "similarity": llm_response.similarity
+                } if llm_response.matched_question else None
             },
             message=f"Card generated successfully. Quality score: {quality_check.score}/100"
         )
@@ -75,7 +98,62 @@ async def generate_card(request: CardGenerationRequest):
         )
 
 
+@router.post("/generate/stream")
+async def generate_card_stream(request: CardGenerationRequest):
+    """
+    流式生成单个卡片（SSE）
+
+    事件顺序：token（答案片段，多次）→ card → quality_check → done；出错时发送 error
+    """
+    if not request.question or not request.question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Question is required"
+        )
+
+    async def event_stream():
+        try:
+            with track_usage() as usage:
+                parts = []
+                async for token in ai_service.stream_answer(
+                    request.question,
+                    use_cache=request.use_cache is not False
+                ):
+                    parts.append(token)
+                    yield format_sse("token", {"content": token})
+
+                answer = "".join(parts)
+                if not answer:
+                    yield format_sse("error", {"error": "Failed to generate answer"})
+                    return
+
+                card = AnkiCard(
+                    id=uuid4(),
+                    front=request.question,
+                    back=answer,
+                    tags=request.tags or [],
+                    deck_name=request.deck_name or "Default",
+                    card_type=request.card_type or "basic"
+                )
+                yield format_sse("card", card.model_dump(mode="json"))
+
+                quality_check = await ai_service.quality_check(card)
+                yield format_sse("quality_check", quality_check.model_dump(mode="json"))
+
+            yield format_sse("done", {
+                "message": f"Card generated successfully. Quality score: {quality_check.score}/100",
+                "tokens_used": usage.total.total_tokens,
+                "token_usage": usage.node_usage()
+            })
+
+        except Exception as error:
+            yield format_sse("error", {"error": f"Error generating card: {str(error)}"})
+
+    return sse_response(event_stream())
+
+
 @router.post("/generate-batch", response_model=ApiResponse[dict])
+@idempotent("cards/generate-batch")
 async def generate_cards(request: BatchGenerationRequest, background_tasks: BackgroundTasks):
     """
     批量生成卡片
@@ -100,45 +178,70 @@ async def generate_cards(request: BatchGenerationRequest, background_tasks: Back
             )
 
         # 设置
-        settings = request.settings or {}
+        settings = (request.settings or BatchSettings()).model_dump()
 
-        # 并发处理，限制并发数
-        concurrency_limit = 5
         cards = []
         errors = []
 
-        for i in range(0, len(request.questions), concurrency_limit):
-            batch = request.questions[i:i + concurrency_limit]
-            batch_tasks = []
+        with track_usage() as usage:
+            # 批次内的重复问题只生成一次，结果按原始顺序展开
+            questions, positions = collapse(request.questions, normalize_question)
+            singleflight.record_collapsed("batch", len(request.questions) - len(questions))
+
+            # 打包生成答案，解析失败的条目逐个生成
+            pack_size = resolve_pack_size(settings.get("pack_size"))
+            answers = [None] * len(questions)
+            if pack_size > 1:
+                answers, _ = await packed_generator.generate(
+                    questions,
+                    pack_size,
+                    use_cache=settings.get("use_cache", True) is not False
+                )
 
-            for j, question in enumerate(batch):
-                index = i + j
-                task = process_single_card(
+            # 滑动窗口并发处理，始终保持最多 batch_concurrency 个请求在执行
+            results = await run_bounded(
+                questions,
+                lambda index, question: process_single_card(
                     question,
                     settings,
-                    index
-                )
-                batch_tasks.append(task)
-
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
+                    index,
+                    answer=answers[index]
+                ),
+                app_settings.batch_concurrency
+            )
 
-            for result in batch_results:
+            emitted = set()
+            for index, (question, result) in enumerate(zip(request.questions, expand(results, positions))):
                 if isinstance(result, Exception):
                     errors.append({
-                        "index": len(cards) + len(errors),
+                        "index": index,
                         "error": str(result)
                     })
                 elif result["success"]:
-                    cards.append(result["data"])
+                    data = result["data"]
+                    if positions[index] in emitted:
+                        # 重复问题使用各自的卡片ID和原始写法
+                        data = {
+                            "card": {**data["card"], "id": uuid4(), "front": question},
+                            "quality_check": dict(data["quality_check"])
+                        }
+                    emitted.add(positions[index])
+                    cards.append(data)
                 else:
-                    errors.append(result["error"])
+                    errors.append({**result["error"], "index": index})
+
+        if errors:
+            # 部分问题生成失败时不保存响应，带相同幂等键的重试重新生成
+            mark_degraded(f"{len(errors)} questions failed")
 
         return ApiResponse(
             success=True,
             data={
                 "cards": [card["card"] for card in cards],
                 "quality_checks": [card["quality_check"] for card in cards],
-                "errors": errors
+                "errors": errors,
+                "tokens_used": usage.total.total_tokens,
+                "token_usage": usage.node_usage()
             },
             message=f"Generated {len(cards)} cards successfully{len(errors) > 0 and f' with {len(errors)} errors' or ''}"
         )
@@ -152,26 +255,31 @@ async def generate_cards(request: BatchGenerationRequest, background_tasks: Back
         )
 
 
-async def process_single_card(question: str, settings: dict, index: int) -> dict:
-    """处理单个卡片生成"""
+async def process_single_card(question: str, settings: dict, index: int, answer: Optional[str] = None) -> dict:
+    """处理单个卡片生成，answer 为预先生成（如打包生成）的答案"""
     try:
-        # 生成回答
-        llm_response = await ai_service.generate_answer(question)
-
-        if not llm_response.success or not llm_response.answer:
-            return {
-                "success": False,
-                "error": {
-                    "index": index,
-                    "error": llm_response.error or "Failed to generate answer"
+        if not answer:
+            # 生成回答
+            llm_response = await ai_service.generate_answer(
+                question,
+                use_cache=settings.get("use_cache", True) is not False
+            )
+
+            if not llm_response.success or not llm_response.answer:
+                return {
+                    "success": False,
+                    "error": {
+                        "index": index,
+                        "error": llm_response.error or "Failed to generate answer"
+                    }
                 }
-            }
+            answer = llm_response.answer
 
         # 创建卡片
         card = AnkiCard(
             id=uuid4(),
             front=question,
-            back=llm_response.answer,
+            back=answer,
             tags=settings.get("tags", []),
             deck_name=settings.get("deck_name", "Default"),
             card_type=settings.get("card_type", "basic")
@@ -199,6 +307,7 @@ async def process_single_card(question: str, settings: dict, index: int) -> dict
 
 
 @router.post("/quality-check", response_model=ApiResponse[QualityCheckResult])
+@idempotent("cards/quality-check", payload="card")
 async def check_quality(card: AnkiCard):
     """
     质量检查
@@ -228,6 +337,7 @@ async def check_quality(card: AnkiCard):
 
 
 @router.post("/improve", response_model=ApiResponse[dict])
+@idempotent("cards/improve")
 async def improve_card(request: ImproveCardRequest):
     """
     改进卡片
@@ -239,32 +349,35 @@ async def improve_card(request: ImproveCardRequest):
                 detail="Card with front and back content is required"
             )
 
-        # 改进卡片
-        improved_front, improved_back, improvement_summary = await ai_service.improve_card(
-            request.card,
-            request.issues,
-            request.suggestions
-        )
+        with track_usage() as usage:
+            # 改进卡片
+            improved_front, improved_back, improvement_summary = await ai_service.improve_card(
+                request.card,
+                request.issues,
+                request.suggestions
+            )
 
-        # 创建改进后的卡片
-        improved_card = AnkiCard(
-            id=uuid4(),
-            front=improved_front,
-            back=improved_back,
-            tags=request.card.tags,
-            deck_name=request.card.deck_name,
-            card_type=request.card.card_type
-        )
+            # 创建改进后的卡片
+            improved_card = AnkiCard(
+                id=uuid4(),
+                front=improved_front,
+                back=improved_back,
+                tags=request.card.tags,
+                deck_name=request.card.deck_name,
+                card_type=request.card.card_type
+            )
 
-        # 再次进行质量检查
-        quality_check = await ai_service.quality_check(improved_card)
+            # 再次进行质量检查
+            quality_check = await ai_service.quality_check(improved_card)
 
         return ApiResponse(
             success=True,
             data={
                 "card": improved_card.dict(),
                 "quality_check": quality_check.dict(),
-                "improvement_summary": improvement_summary
+                "improvement_summary": improvement_summary,
+                "tokens_used": usage.total.total_tokens,
+                "token_usage": usage.node_usage()
             },
             message=f"Card improved successfully. New quality score: {quality_check.score}/100"
         )
@@ -11,14 +11,17 @@ from ....schemas.card import (
     ImproveCardRequest,
     BatchSettings
 )
-from ....services.langgraph_service import LangGraphService
+from ....services.idempotency import mark_degraded
+from ....services.langgraph_service import langgraph_service
+from ....utils.idempotency import idempotent
+from ....utils.sse import format_sse, sse_response
 
 
 router = APIRouter()
-langgraph_service = LangGraphService()
 
 
 @router.post("/generate", response_model=ApiResponse[dict])
+@idempotent("cards-langgraph/generate")
 async def generate_card(request: CardGenerationRequest):
     """
     使用LangGraph生成单个卡片
@@ -34,9 +37,13 @@ async def generate_card(request: CardGenerationRequest):
         result = await langgraph_service.generate_card(request)
 
         if not result["success"]:
+            # 带上 thread_id，客户端可以用它从最后完成的节点重试
             raise HTTPException(
                 status_code=500,
-                detail=result.get("error", "Failed to generate card")
+                detail={
+                    "error": result.get("error", "Failed to generate card"),
+                    "thread_id": result.get("thread_id")
+                }
             )
 
         return ApiResponse(
@@ -44,7 +51,15 @@ async def generate_card(request: CardGenerationRequest):
             data={
                 "card": result["card"].dict() if result["card"] else None,
                 "quality_check": result["quality_check"].dict() if result["quality_check"] else None,
-                "tokens_used": result.get("tokens_used", 0)
+                "tokens_used": result.get("tokens_used", 0),
+                "token_usage": result.get("token_usage", {}),
+                "cached": result.get("cached", False),
+                "semantic_match": result.get("semantic_match"),
+                "model": result.get("model"),
+                "self_graded": result.get("self_graded", False),
+                "candidates": result.get("candidates"),
+                "improvement": result.get("improvement"),
+                "thread_id": result.get("thread_id")
             },
             message=f"Card generated successfully. Quality score: {result['quality_check'].score}/100"
         )
@@ -58,7 +73,31 @@ async def generate_card(request: CardGenerationRequest):
         )
 
 
+@router.post("/generate/stream")
+async def generate_card_stream(request: CardGenerationRequest):
+    """
+    使用LangGraph流式生成单个卡片（SSE）
+
+    事件顺序：token（答案片段，多次）→ card → quality_check → done；出错时发送 error
+    """
+    if not request.question or not request.question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Question is required"
+        )
+
+    async def event_stream():
+        try:
+            async for event, data in langgraph_service.stream_card(request):
+                yield format_sse(event, data)
+        except Exception as error:
+            yield format_sse("error", {"error": f"Error generating card: {str(error)}"})
+
+    return sse_response(event_stream())
+
+
 @router.post("/generate-batch", response_model=ApiResponse[dict])
+@idempotent("cards-langgraph/generate-batch")
 async def generate_cards(request: BatchGenerationRequest, background_tasks: BackgroundTasks):
     """
     使用LangGraph批量生成卡片
@@ -100,13 +139,18 @@ async def generate_cards(request: BatchGenerationRequest, background_tasks: Back
                 if "quality_check" in card_data:
                     quality_checks.append(card_data["quality_check"])
 
+        if result.get("errors"):
+            # 部分问题生成失败时不保存响应，带相同幂等键的重试重新生成
+            mark_degraded(f"{len(result['errors'])} questions failed")
+
         return ApiResponse(
             success=True,
             data={
                 "cards": cards,
                 "quality_checks": quality_checks,
                 "errors": result.get("errors", []),
-                "tokens_used": result.get("tokens_used", 0)
+                "tokens_used": result.get("tokens_used", 0),
+                "token_usage": result.get("token_usage", {})
             },
             message=f"Generated {len(cards)} cards successfully"
         )
@@ -121,6 +165,7 @@ async def generate_cards(request: BatchGenerationRequest, background_tasks: Back
 
 
 @router.post("/quality-check", response_model=ApiResponse[QualityCheckResult])
+@idempotent("cards-langgraph/quality-check", payload="card")
 async def check_quality(card: AnkiCard):
     """
     使用LangGraph进行质量检查
@@ -151,6 +196,7 @@ async def check_quality(card: AnkiCard):
 
 
 @router.post("/improve", response_model=ApiResponse[dict])
+@idempotent("cards-langgraph/improve")
 async def improve_card(request: ImproveCardRequest):
     """
     使用LangGraph改进卡片
@@ -177,7 +223,8 @@ async def improve_card(request: ImproveCardRequest):
                 "card": result["improved_card"].dict() if result["improved_card"] else None,
                 "quality_check": result["quality_check"].dict() if result["quality_check"] else None,
                 "improvement_summary": f"Card improved successfully",
-                "tokens_used": result.get("tokens_used", 0)
+                "tokens_used": result.get("tokens_used", 0),
+                "token_usage": result.get("token_usage", {})
             },
             message=f"Card improved successfully. New quality score: {result['quality_check'].score}/100"
         )
@@ -216,55 +263,21 @@ async def get_workflow_status():
 @router.post("/workflow/stream")
 async def stream_workflow(request: CardGenerationRequest):
     """
-    流式执行工作流（返回中间步骤）
-    """
-    try:
-        from ..graph.workflows import CardGenerationWorkflow
-
-        workflow = CardGenerationWorkflow()
-
-        # 初始化状态
-        initial_state = {
-            "question": request.question,
-            "tags": request.tags or [],
-            "deck_name": request.deck_name or "Default",
-            "card_type": request.card_type or "basic",
-            "improvement_count": 0,
-            "max_improvements": 2,
-            "tokens_used": 0,
-            "model_name": "gpt-3.5-turbo",
-            "messages": []
-        }
-
-        # 编译工作流用于流式输出
-        app = workflow.compile(use_memory=True)
-        config = {"configurable": {"thread_id": f"stream-{request.question[:10]}"}}
-
-        # 收集所有中间步骤
-        steps = []
-        async for event in app.astream(initial_state, config=config):
-            steps.append({
-                "step": list(event.keys())[0] if event else "completed",
-                "data": event,
-                "tokens_used": event.get("tokens_used", 0) if isinstance(event, dict) else 0
-            })
-
-        # 获取最终结果
-        final_result = await app.ainvoke(initial_state, config=config)
+    流式执行工作流（SSE，每个节点完成后推送中间步骤）
 
-        return ApiResponse(
-            success=True,
-            data={
-                "steps": steps,
-                "final_card": final_result.get("final_card").dict() if final_result.get("final_card") else None,
-                "final_quality_check": final_result.get("final_quality_check").dict() if final_result.get("final_quality_check") else None,
-                "total_tokens_used": final_result.get("tokens_used", 0)
-            },
-            message=f"Workflow completed with {len(steps)} steps"
+    事件：step（每个节点一次）→ final（最终卡片、质量检查和token总数）；出错时发送 error
+    """
+    if not request.question or not request.question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Question is required"
         )
 
-    except Exception as error:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error in streaming workflow: {str(error)}"
-        )
\ No newline at end of file
+    async def event_stream():
+        try:
+            async for event, data in langgraph_service.stream_workflow(request):
+                yield format_sse(event, data)
+        except Exception as error:
+            yield format_sse("error", {"error": f"Error in streaming workflow: {str(error)}"})
+
+    return sse_response(event_stream())
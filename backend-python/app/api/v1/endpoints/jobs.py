@@ -0,0 +1,106 @@
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
+
+from ....schemas.card import ApiResponse
+from ....schemas.job import JobCreateRequest, JobStatus, JobItemState
+from ....services.job_service import job_service
+from ....core.config import settings
+from ....utils.idempotency import idempotent
+
+
+router = APIRouter()
+
+
+@router.post("/", response_model=ApiResponse[JobStatus], status_code=202)
+@idempotent("jobs/create", status_code=202)
+async def create_job(request: JobCreateRequest):
+    """
+    创建异步批量生成任务，立即返回任务ID
+
+    带 Idempotency-Key 重试时返回原任务，不会重复创建
+    """
+    questions = [question.strip() for question in request.questions if question and question.strip()]
+    if not questions:
+        raise HTTPException(
+            status_code=400,
+            detail="At least one question is required"
+        )
+
+    if len(questions) > settings.job_max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {settings.job_max_questions} questions allowed per job"
+        )
+
+    try:
+        job = await job_service.create_job(questions, request.settings)
+        return ApiResponse(
+            success=True,
+            data=job,
+            message=f"Job created with {job.total} questions"
+        )
+    except Exception as error:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error creating job: {str(error)}"
+        )
+
+
+@router.get("/", response_model=ApiResponse[List[JobStatus]])
+async def list_jobs(
+    skip: int = Query(0, ge=0, description="跳过的记录数"),
+    limit: int = Query(20, ge=1, le=100, description="返回的记录数")
+):
+    """
+    列出任务
+    """
+    jobs = await job_service.list_jobs(skip=skip, limit=limit)
+    return ApiResponse(
+        success=True,
+        data=jobs,
+        message=f"Retrieved {len(jobs)} jobs"
+    )
+
+
+@router.get("/{job_id}", response_model=ApiResponse[JobStatus])
+async def get_job(
+    job_id: str,
+    include_items: bool = Query(True, description="是否返回条目结果"),
+    status: Optional[JobItemState] = Query(None, description="只返回指定状态的条目"),
+    offset: int = Query(0, ge=0, description="条目偏移"),
+    limit: int = Query(100, ge=1, le=1000, description="条目数量")
+):
+    """
+    获取任务进度和（部分）结果
+    """
+    job = await job_service.get_job(
+        job_id,
+        include_items=include_items,
+        offset=offset,
+        limit=limit,
+        status=status
+    )
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return ApiResponse(
+        success=True,
+        data=job,
+        message=f"Job {job.status}: {job.completed + job.failed}/{job.total} processed"
+    )
+
+
+@router.post("/{job_id}/cancel", response_model=ApiResponse[JobStatus])
+async def cancel_job(job_id: str):
+    """
+    取消任务，已生成的结果保留
+    """
+    job = await job_service.cancel_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return ApiResponse(
+        success=True,
+        data=job,
+        message=f"Job {job.status}"
+    )
@@ -0,0 +1,45 @@
+from fastapi import APIRouter
+
+from ....schemas.card import ApiResponse
+from ....core.breaker import circuit_breakers
+from ....core.hedging import hedging
+from ....core.limiter import llm_limiter
+from ....core.llm import llm_registry
+from ....core.resilience import retry_metrics
+from ....core.singleflight import singleflight
+from ....core.usage import usage_metrics
+from ....graph.checkpoint import checkpoint_manager
+from ....graph.convergence import improvement_metrics
+from ....services.answer_cache import answer_cache
+from ....services.idempotency import idempotency_store
+from ....services.prescorer import quality_prescorer
+from ....services.quality_cache import quality_cache
+
+
+router = APIRouter()
+
+
+@router.get("/", response_model=ApiResponse[dict])
+async def get_metrics():
+    """
+    获取运行时指标
+    """
+    return ApiResponse(
+        success=True,
+        data={
+            "llm_pool": llm_registry.stats(),
+            "llm_limiter": llm_limiter.stats(),
+            "llm_breakers": circuit_breakers.stats(),
+            "llm_retries": retry_metrics.stats(),
+            "llm_hedging": hedging.stats(),
+            "singleflight": singleflight.stats(),
+            "tokens": usage_metrics.stats(),
+            "answer_cache": answer_cache.stats(),
+            "quality_cache": quality_cache.stats(),
+            "quality_prescorer": quality_prescorer.stats(),
+            "improvement": improvement_metrics.stats(),
+            "checkpoints": checkpoint_manager.stats(),
+            "idempotency": idempotency_store.stats()
+        },
+        message="Metrics collected"
+    )
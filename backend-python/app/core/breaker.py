@@ -0,0 +1,174 @@
+"""
+按模型的熔断器
+
+每个模型统计最近若干次调用（每次尝试计一次）的结果，失败和过慢的调用占比超过阈值时熔断（open），
+过慢按调用所属节点的超时计算（见 slow_call_threshold），批量生成等耗时长的节点不会拖累同一模型的熔断器。
+熔断期间请求改用备用模型（settings.llm_fallback_model），不再等待主模型超时。
+熔断持续一段时间后进入半开（half_open），放行一个探测请求：成功则恢复（closed），失败则继续熔断。
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from .config import settings
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def slow_call_threshold(node: Optional[str] = None) -> float:
+    """节点的慢调用阈值（秒）：节点超时的 llm_breaker_slow_call_ratio 倍，未指定节点时按默认超时"""
+    timeout = settings.llm_node_timeouts.get(node, settings.llm_timeout) if node else settings.llm_timeout
+    return timeout * settings.llm_breaker_slow_call_ratio
+
+
+class CircuitBreaker:
+    """单个模型的熔断器"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._outcomes: Deque[bool] = deque(maxlen=settings.llm_breaker_window)
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self.counters: Dict[str, int] = {"opened": 0, "rejected": 0, "slow": 0}
+
+    def allow(self) -> bool:
+        """是否可以调用该模型；半开时只放行一个探测请求"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN and now - self._opened_at >= settings.llm_breaker_open_seconds:
+                self.state = HALF_OPEN
+                self._probe_started = None
+
+            # 探测请求没有结果（例如被取消）时，超过熔断时长后允许再次探测
+            if self.state == HALF_OPEN and (
+                self._probe_started is None
+                or now - self._probe_started >= settings.llm_breaker_open_seconds
+            ):
+                self._probe_started = now
+                return True
+
+            self.counters["rejected"] += 1
+            return False
+
+    def record(self, success: bool, latency: Optional[float] = None, node: Optional[str] = None):
+        """
+        记录一次调用结果
+
+        Args:
+            success: 是否成功；不可重试的客户端错误不应计入
+            latency: 成功调用的耗时（秒），超过节点的慢调用阈值计为失败
+            node: 调用所属的节点，用于确定慢调用阈值
+        """
+        if success and latency is not None and latency > slow_call_threshold(node):
+            success = False
+            self.counters["slow"] += 1
+
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if success:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            if self.state == OPEN:
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= settings.llm_breaker_min_calls
+                    and failures / len(self._outcomes) >= settings.llm_breaker_failure_rate):
+                self._open()
+
+    def _open(self):
+        """熔断，调用方需持有锁"""
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_started = None
+        self._outcomes.clear()
+        self.counters["opened"] += 1
+        print(f"Circuit breaker opened for model {self.model}")
+
+    def stats(self) -> Dict[str, Any]:
+        """熔断器统计信息"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": self._outcomes.count(False),
+                **self.counters,
+            }
+
+
+class CircuitBreakerRegistry:
+    """按模型名称管理熔断器，并选择实际调用的模型"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.fallbacks = 0
+
+    def get(self, model: str) -> CircuitBreaker:
+        """获取（或创建）模型的熔断器"""
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = CircuitBreaker(model)
+                self._breakers[model] = breaker
+            return breaker
+
+    def allow(self, model: str) -> bool:
+        """模型当前是否可用"""
+        return not settings.llm_breaker_enabled or self.get(model).allow()
+
+    def is_open(self, model: str) -> bool:
+        """模型是否处于熔断状态（不占用半开探测名额）"""
+        return settings.llm_breaker_enabled and self.get(model).state != CLOSED
+
+    def record(self, model: str, success: bool, latency: Optional[float] = None,
+               node: Optional[str] = None):
+        """记录一次调用结果"""
+        if settings.llm_breaker_enabled:
+            self.get(model).record(success, latency, node)
+
+    def select(self, model: str) -> Optional[str]:
+        """
+        选择实际调用的模型
+
+        Returns:
+            主模型可用时返回主模型，否则返回可用的备用模型；都不可用时返回 None
+        """
+        if self.allow(model):
+            return model
+
+        fallback = settings.llm_fallback_model
+        if fallback and fallback != model and self.allow(fallback):
+            with self._lock:
+                self.fallbacks += 1
+            return fallback
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """所有模型的熔断器状态"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+            fallbacks = self.fallbacks
+        return {
+            "enabled": settings.llm_breaker_enabled,
+            "fallback_model": settings.llm_fallback_model,
+            "fallbacks": fallbacks,
+            "models": {breaker.model: breaker.stats() for breaker in breakers},
+        }
+
+
+# 创建全局实例
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,87 @@
+"""
+内存缓存工具
+"""
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题文本：全角转半角、合并空白、小写、去掉结尾标点"""
+    text = unicodedata.normalize("NFKC", question or "")
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip("?？。.!！ ")
+
+
+class TTLCache:
+    """带过期时间的LRU缓存
+
+    超过 maxsize 时淘汰最久未使用的条目；ttl 为 None 时永不过期。
+    """
+
+    def __init__(self, maxsize: int = 1000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """获取缓存值，不存在或已过期返回 None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = item
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """写入缓存"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """删除并返回缓存值"""
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[1] if item else None
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,85 @@
+"""
+并发控制工具
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Sequence, TypeVar, Union
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def run_bounded(
+    items: Sequence[T],
+    worker: Callable[[int, T], Awaitable[R]],
+    limit: int
+) -> List[Union[R, BaseException]]:
+    """
+    以滑动窗口方式并发处理列表，始终保持最多 limit 个任务在执行
+
+    与按块 gather 不同，某个慢任务不会阻塞其余空闲槽位：
+    任一任务完成后立即开始下一个。
+
+    Args:
+        items: 待处理的条目
+        worker: 处理函数，参数为 (原始序号, 条目)
+        limit: 最大并发数
+
+    Returns:
+        与 items 顺序对齐的结果列表，失败的条目为对应的异常
+    """
+    results: List[Any] = [None] * len(items)
+    next_index = 0
+
+    async def run_worker():
+        nonlocal next_index
+        while next_index < len(items):
+            index = next_index
+            next_index += 1
+            try:
+                results[index] = await worker(index, items[index])
+            except Exception as error:
+                results[index] = error
+
+    workers = max(1, min(limit, len(items)))
+    await asyncio.gather(*[run_worker() for _ in range(workers)])
+    return results
+
+
+async def gather_within(
+    awaitables: Sequence[Awaitable[R]],
+    timeout: float
+) -> List[Union[R, BaseException, None]]:
+    """
+    并发执行，最多等待 timeout 秒，超时后取消未完成的任务
+
+    timeout 内没有任何任务成功时，继续等到第一个成功（或全部结束）为止，
+    保证有结果可用时不会空手返回。
+
+    Args:
+        awaitables: 待执行的协程
+        timeout: 等待时间（秒）
+
+    Returns:
+        与输入顺序对齐的结果列表：失败的为对应的异常，被取消的为 None
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    if not tasks:
+        return []
+
+    def succeeded(done) -> bool:
+        return any(not task.cancelled() and task.exception() is None for task in done)
+
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, timeout))
+        while pending and not succeeded(done):
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            done |= finished
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    return [
+        (task.exception() or task.result()) if task in done and not task.cancelled() else None
+        for task in tasks
+    ]
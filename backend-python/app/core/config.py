@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import ConfigDict
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -21,6 +21,120 @@ class Settings(BaseSettings):
     zhipu_base_url: str = "https://open.bigmodel.cn/api/paas/v4"
     zhipu_model: str = "glm-4"
 
+    # LLM连接池配置
+    llm_pool_max_connections: int = 20
+    llm_pool_max_keepalive_connections: int = 10
+    llm_pool_keepalive_expiry: float = 60.0  # 空闲连接保持时间（秒）
+    llm_http2: bool = True  # 需要安装 h2，未安装时自动回退到 HTTP/1.1
+
+    # LLM调用重试与超时配置
+    llm_timeout: float = 60.0  # 单次调用默认超时（秒）
+    llm_node_timeouts: Dict[str, float] = {  # 按节点覆盖超时，环境变量使用JSON格式
+        "generate_answer": 60.0,
+        "generate_graded": 60.0,
+        "generate_candidates": 60.0,
+        "check_quality": 30.0,
+        "improve_card": 60.0,
+        "generate_batch": 120.0,
+    }
+    llm_max_retries: int = 3  # 限流、服务端错误、超时和连接错误的最大重试次数
+    llm_retry_base_delay: float = 0.5  # 指数退避的基础等待时间（秒）
+    llm_retry_max_delay: float = 20.0  # 单次等待上限（秒），也用于截断 Retry-After
+
+    # LLM自适应并发限制（AIMD），所有LLM调用共享同一个并发窗口
+    llm_limiter_enabled: bool = True
+    llm_limiter_initial: int = 5  # 初始并发窗口
+    llm_limiter_min: int = 1
+    llm_limiter_max: int = 20  # 不超过 llm_pool_max_connections
+    llm_limiter_backoff: float = 0.5  # 限流、超时或延迟升高时窗口乘以该系数
+    llm_limiter_latency_factor: float = 3.0  # 延迟超过节点基线的该倍数视为过载
+    llm_limiter_cooldown: float = 5.0  # 两次减小窗口之间的最短间隔（秒）
+    llm_limiter_remaining_floor: int = 0  # x-ratelimit-remaining-requests 不高于该值时减小窗口
+
+    # 按模型熔断：失败或过慢的调用占比超过阈值时熔断，熔断期间改用备用模型
+    llm_fallback_model: Optional[str] = "glm-4-flash"  # 为空时熔断后直接失败
+    llm_breaker_enabled: bool = True
+    llm_breaker_window: int = 20  # 统计最近的调用次数
+    llm_breaker_min_calls: int = 5  # 调用次数不足时不熔断
+    llm_breaker_failure_rate: float = 0.5  # 失败（含过慢）占比阈值
+    llm_breaker_slow_call_ratio: float = 0.5  # 单次调用超过所属节点超时的该比例计为失败
+    llm_breaker_open_seconds: float = 30.0  # 熔断持续时间，之后放行一个探测请求
+
+    # LLM请求对冲配置：调用超过近期延迟分位数仍未返回时再发一个相同请求，取先返回的结果
+    llm_hedge_enabled: bool = False
+    llm_hedge_nodes: List[str] = ["generate_answer"]  # 启用对冲的节点，环境变量使用JSON格式
+    llm_hedge_percentile: float = 0.95  # 等待近期延迟的该分位数后发出对冲请求
+    llm_hedge_min_samples: int = 20  # 样本数不足时不对冲
+    llm_hedge_window: int = 200  # 每个节点保留的最近延迟样本数
+    llm_hedge_min_delay: float = 0.5  # 对冲等待时间下限（秒）
+    llm_hedge_budget_per_minute: int = 10  # 每分钟最多发出的对冲请求数
+
+    # 答案缓存配置
+    answer_cache_enabled: bool = True
+    answer_cache_persist: bool = True  # 是否持久化到 SQLite
+    answer_cache_max_entries: int = 1000  # 内存缓存条目上限
+    answer_cache_ttl: int = 7 * 24 * 3600  # 缓存有效期（秒）
+
+    # 语义近似问题缓存配置（需要安装 numpy）
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.85  # 余弦相似度阈值
+    semantic_cache_dim: int = 1024  # 哈希向量维度
+    semantic_cache_max_entries: int = 2000
+    semantic_cache_save_every: int = 20  # 每新增N条写一次磁盘
+    semantic_cache_path: str = "./semantic_cache.npz"
+
+    # 质量检查缓存配置
+    quality_cache_enabled: bool = True
+    quality_cache_max_entries: int = 2000  # 超过上限时按LRU淘汰
+    quality_cache_ttl: int = 24 * 3600  # 缓存有效期（秒）
+
+    # 生成接口的幂等键（Idempotency-Key 请求头）：完成的响应保存到 SQLite，有效期内的重试直接返回
+    idempotency_enabled: bool = True
+    idempotency_ttl: int = 24 * 3600  # 响应保存时间（秒）
+    idempotency_key_max_length: int = 255
+
+    # 相同请求合并：同时进行的相同生成和质检调用只执行一次
+    singleflight_enabled: bool = True
+
+    # 质量检查预评分：明显合格或明显有问题的卡片不调用LLM质检（校准见 scripts/calibrate_prescorer.py）
+    prescore_enabled: bool = False
+    prescore_min_confidence: float = 0.9  # 预评分把握不低于该值时直接采用
+    prescore_min_chars: int = 8  # 背面短于该长度视为过短（把握较低）
+    prescore_pass_min_chars: int = 30  # 直接通过的背面长度范围
+    prescore_pass_max_chars: int = 600
+    prescore_max_repetition: float = 0.5  # 重复程度不低于该值直接判为不通过
+    prescore_pass_max_repetition: float = 0.2  # 直接通过时允许的重复程度上限
+    prescore_echo_overlap: float = 0.8  # 背面与问题重合程度不低于该值视为重复问题
+    prescore_pass_max_overlap: float = 0.5  # 直接通过时允许的重合程度上限
+    prescore_pass_score: int = 80  # 直接通过时给出的分数
+
+    # 快速模式（mode=fast）：一次调用生成答案并自评，自评把握不足时再调用LLM质检
+    fast_mode_min_confidence: float = 0.7  # 自评 confidence 低于该值时不采用自评
+    fast_mode_score_margin: int = 10  # 自评分数距通过线（70分）小于该值时不采用自评
+
+    # 改进循环的提前停止：分数不再提升或卡片没有变化时不再继续改进
+    improvement_min_gain: int = 5  # 一轮改进后分数提升低于该值时停止
+
+    # 多候选模式（mode=best_of_n）：并发生成多个候选答案并并发质检，选分数最高的一个，不再串行改进
+    best_of_n_candidates: int = 3  # 候选答案数，token用量约为标准模式生成和质检的该倍数
+    best_of_n_latency_budget: float = 60.0  # 生成和质检的总等待时间（秒），超时后使用已完成的候选
+
+    # 批量生成配置
+    batch_pack_size: int = 1  # 每次LLM调用打包的问题数，1 表示不打包
+    batch_pack_size_max: int = 10
+    batch_concurrency: int = 20  # 同时进行的单卡生成数上限，实际LLM并发由自适应窗口控制
+
+    # 异步批量任务配置
+    job_max_questions: int = 5000  # 单个任务的问题数上限
+    job_concurrency: int = 20  # 每个任务同时进行的单卡生成数上限，实际LLM并发由自适应窗口控制
+
+    # 工作流检查点配置
+    checkpoint_backend: str = "memory"  # memory 或 sqlite（需要安装 langgraph-checkpoint-sqlite）
+    checkpoint_db_path: Optional[str] = None  # 默认与应用数据库共用同一个文件
+    checkpoint_ttl: int = 24 * 3600  # 超过该时间未更新的 thread 被清理（秒）
+    checkpoint_prune_interval: int = 3600  # 清理间隔（秒），0 表示只在启动时清理
+    checkpoint_memory_max_threads: int = 1000  # 内存检查点保留的 thread 数上限
+
     # CORS配置
     cors_origins: str = "http://localhost:3000,http://127.0.0.1:3000"
 
@@ -34,6 +34,9 @@ async def get_db() -> AsyncSession:
 
 async def init_db():
     """初始化数据库"""
+    # 导入所有模型，确保表已注册到 Base.metadata
+    from .. import models  # noqa: F401
+
     async with engine.begin() as conn:
         # 创建所有表
         await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
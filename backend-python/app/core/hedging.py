@@ -0,0 +1,174 @@
+"""
+LLM请求对冲（hedged requests）
+
+调用超过近期延迟的某个分位数仍未返回时，再发出一个相同的请求，
+取先成功返回的结果并取消另一个，以降低尾延迟。
+对冲请求受每分钟预算限制，控制额外成本。默认关闭，通过 LLM_HEDGE_ENABLED 开启。
+
+对冲请求占用自适应并发窗口（见 limiter）中自己的槽位，窗口已满时不对冲，
+避免在上游变慢、窗口收缩时再额外加压。延迟分位数和限流器的延迟基线都只按原请求计算：
+对冲胜出时原请求的延迟记为到拿到结果为止的时长，不记为胜出请求更短的延迟。
+
+流式输出时不对冲（两个请求的增量输出会交错），
+调用方通过 RunnableConfig 的 configurable.llm_hedging=False 关闭。
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from langchain_core.runnables import ensure_config
+
+from .config import settings
+from .limiter import CallSlot, llm_limiter, response_headers
+from .resilience import RATE_LIMIT, TIMEOUT, classify_error
+
+T = TypeVar("T")
+
+
+class HedgingController:
+    """按节点统计延迟并决定何时发出对冲请求"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._hedge_times: Deque[float] = deque()
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def enabled_for(self, node: str) -> bool:
+        """当前调用是否允许对冲"""
+        if not settings.llm_hedge_enabled or node not in settings.llm_hedge_nodes:
+            return False
+        configurable = ensure_config().get("configurable") or {}
+        return configurable.get("llm_hedging", True) is not False
+
+    def record_latency(self, node: str, seconds: float):
+        """记录一次成功调用的延迟"""
+        with self._lock:
+            latencies = self._latencies.get(node)
+            if latencies is None or latencies.maxlen != settings.llm_hedge_window:
+                latencies = deque(latencies or (), maxlen=settings.llm_hedge_window)
+                self._latencies[node] = latencies
+            latencies.append(seconds)
+
+    def hedge_delay(self, node: str) -> Optional[float]:
+        """发出对冲请求前的等待时间：近期延迟的分位数；样本不足时返回 None（不对冲）"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(node) or ())
+        if len(latencies) < settings.llm_hedge_min_samples:
+            return None
+
+        index = min(len(latencies) - 1, math.ceil(settings.llm_hedge_percentile * len(latencies)) - 1)
+        return max(settings.llm_hedge_min_delay, latencies[max(0, index)])
+
+    def _take_budget(self) -> bool:
+        """占用一次对冲预算（滑动的一分钟窗口）"""
+        now = time.monotonic()
+        with self._lock:
+            while self._hedge_times and self._hedge_times[0] <= now - 60:
+                self._hedge_times.popleft()
+            if len(self._hedge_times) >= settings.llm_hedge_budget_per_minute:
+                return False
+            self._hedge_times.append(now)
+            return True
+
+    def _count(self, node: str, event: str):
+        with self._lock:
+            counters = self.counters.setdefault(node, {})
+            counters[event] = counters.get(event, 0) + 1
+
+    async def run(self, call: Callable[[], Awaitable[T]], node: str) -> T:
+        """
+        执行调用，必要时发出对冲请求
+
+        Args:
+            call: 每次调用返回新的协程
+            node: 调用所属的节点/操作名
+        """
+        if not self.enabled_for(node):
+            return await call()
+
+        self._count(node, "calls")
+        delay = self.hedge_delay(node)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(call())
+        tasks = {primary: started}
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done:
+                    hedge = self._start_hedge(call, node)
+                    if hedge is not None:
+                        tasks[hedge] = time.monotonic()
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count(node, "hedge_wins")
+                        # 原请求的延迟（对冲胜出时原请求至少已经等待了这么久）
+                        self.record_latency(node, time.monotonic() - started)
+                        return task.result()
+                    if error is None or task is primary:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _start_hedge(self, call: Callable[[], Awaitable[T]], node: str) -> Optional[asyncio.Future]:
+        """占用并发槽位和预算后发出对冲请求，任一不足时返回 None"""
+        slot = llm_limiter.try_acquire()
+        if slot is None:
+            self._count(node, "no_slot")
+            return None
+        if not self._take_budget():
+            llm_limiter.release(node, slot)
+            self._count(node, "budget_exhausted")
+            return None
+
+        self._count(node, "hedged")
+        return asyncio.ensure_future(self._hedge(call, node, slot))
+
+    @staticmethod
+    async def _hedge(call: Callable[[], Awaitable[T]], node: str, slot: CallSlot) -> T:
+        """执行对冲请求，结束后归还槽位；成功时不报告延迟，被取消时不调整窗口"""
+        try:
+            result = await call()
+            slot.success(None, response_headers(result))
+            return result
+        except Exception as error:
+            kind = classify_error(error)
+            if kind in (RATE_LIMIT, TIMEOUT):
+                slot.overloaded(kind, response_headers(error))
+            raise
+        finally:
+            llm_limiter.release(node, slot)
+
+    def stats(self) -> Dict[str, Any]:
+        """对冲统计信息"""
+        with self._lock:
+            counters = {node: dict(values) for node, values in self.counters.items()}
+            nodes = list(self._latencies)
+            budget_used = len(self._hedge_times)
+
+        return {
+            "enabled": settings.llm_hedge_enabled,
+            "nodes": settings.llm_hedge_nodes,
+            "percentile": settings.llm_hedge_percentile,
+            "budget_per_minute": settings.llm_hedge_budget_per_minute,
+            "budget_used": budget_used,
+            "hedge_delay": {node: self.hedge_delay(node) for node in nodes},
+            "by_node": counters,
+        }
+
+
+# 创建全局实例
+hedging = HedgingController()
@@ -0,0 +1,228 @@
+"""
+LLM调用的自适应并发限制（AIMD）
+
+进程内所有LLM调用（旧接口、LangGraph 节点、批量任务、流式输出）共享同一个并发窗口：
+- 调用成功时加性增长：每完成约一个窗口的调用，窗口加 1
+- 遇到限流（429）、超时、延迟明显高于基线或响应头显示配额即将耗尽时乘性减小，
+  冷却时间内最多减小一次，避免同一波 429 把窗口压到最低
+- 超出窗口的调用按先来先服务排队
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Mapping, Optional
+
+from .config import settings
+
+
+def response_headers(source: Any) -> Optional[Mapping[str, str]]:
+    """读取响应头：模型回复的 response_metadata["headers"]，或 SDK 错误的 response.headers"""
+    metadata = getattr(source, "response_metadata", None)
+    if isinstance(metadata, dict) and metadata.get("headers"):
+        return metadata["headers"]
+    return getattr(getattr(source, "response", None), "headers", None)
+
+
+def _header_int(headers: Mapping[str, str], name: str) -> Optional[int]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class CallSlot:
+    """一次占用的并发槽位，调用结束后由 AdaptiveLimiter.slot 归还"""
+
+    def __init__(self):
+        self.succeeded = False
+        self.overload: Optional[str] = None
+        self.latency: Optional[float] = None
+        self.headers: Optional[Mapping[str, str]] = None
+        self.held = False
+
+    def success(self, latency: Optional[float] = None, headers: Optional[Mapping[str, str]] = None):
+        """标记调用成功，latency 为空时不参与延迟判断"""
+        self.succeeded = True
+        self.latency = latency
+        self.headers = headers
+
+    def overloaded(self, reason: str, headers: Optional[Mapping[str, str]] = None):
+        """标记上游过载（限流、超时），reason 用于统计"""
+        self.overload = reason
+        self.headers = headers
+
+
+class AdaptiveLimiter:
+    """AIMD 并发窗口"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.limit = float(settings.llm_limiter_initial)
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._baselines: Dict[str, float] = {}
+        self._last_decrease = 0.0
+        self.counters: Dict[str, int] = {"increases": 0, "decreases": 0, "slow": 0}
+        self.last_headers: Dict[str, int] = {}
+
+    @property
+    def window(self) -> int:
+        """当前允许的并发数"""
+        return max(1, int(self.limit))
+
+    @asynccontextmanager
+    async def slot(self, node: str) -> AsyncIterator[CallSlot]:
+        """
+        占用一个并发槽位，调用结束后根据结果调整窗口
+
+        Args:
+            node: 调用所属的节点/操作名，延迟基线按节点分别统计
+        """
+        if not settings.llm_limiter_enabled:
+            yield CallSlot()
+            return
+
+        await self._acquire()
+        slot = CallSlot()
+        try:
+            yield slot
+        finally:
+            self._release(node, slot)
+
+    def try_acquire(self) -> Optional[CallSlot]:
+        """
+        不排队地占用一个槽位，窗口已满或已有调用在排队时返回 None
+
+        用于可有可无的额外请求（如对冲请求），用完后调用 release 归还。
+        """
+        slot = CallSlot()
+        if not settings.llm_limiter_enabled:
+            return slot
+
+        with self._lock:
+            if self._waiters or self.inflight >= self.window:
+                return None
+            self.inflight += 1
+        slot.held = True
+        return slot
+
+    def release(self, node: Optional[str], slot: CallSlot):
+        """归还 try_acquire 占用的槽位，并根据调用结果调整窗口"""
+        if slot.held:
+            slot.held = False
+            self._release(node, slot)
+
+    async def _acquire(self):
+        with self._lock:
+            if not self._waiters and self.inflight < self.window:
+                self.inflight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    raise
+            # 已经分配到槽位后被取消，归还槽位
+            self._release(None, CallSlot())
+            raise
+
+    def _release(self, node: Optional[str], slot: CallSlot):
+        with self._lock:
+            self.inflight -= 1
+            self._adjust(node, slot)
+            while self._waiters and self.inflight < self.window:
+                # 已取消的等待者也分配槽位，由其取消处理归还
+                waiter = self._waiters.popleft()
+                self.inflight += 1
+                waiter.get_loop().call_soon_threadsafe(self._grant, waiter)
+
+    @staticmethod
+    def _grant(waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def _adjust(self, node: Optional[str], slot: CallSlot):
+        """根据调用结果调整窗口，调用方需持有锁"""
+        if slot.headers:
+            self._observe_headers(slot.headers)
+
+        if slot.overload:
+            self.counters[slot.overload] = self.counters.get(slot.overload, 0) + 1
+            self._decrease()
+            return
+        if not slot.succeeded:
+            return
+
+        slow = False
+        if node is not None and slot.latency is not None:
+            baseline = self._baselines.get(node)
+            if baseline is None:
+                self._baselines[node] = slot.latency
+            else:
+                slow = slot.latency > baseline * settings.llm_limiter_latency_factor
+                # 基线取延迟的慢速指数平均，延迟变快时更快跟上；持续变慢时也会逐渐上移
+                alpha = 0.5 if slot.latency < baseline else 0.05
+                self._baselines[node] = baseline + alpha * (slot.latency - baseline)
+
+        remaining = _header_int(slot.headers, "x-ratelimit-remaining-requests") if slot.headers else None
+        if slow or (remaining is not None and remaining <= settings.llm_limiter_remaining_floor):
+            if slow:
+                self.counters["slow"] += 1
+            self._decrease()
+            return
+
+        if self.limit < settings.llm_limiter_max:
+            previous = self.window
+            self.limit = min(float(settings.llm_limiter_max), self.limit + 1.0 / self.window)
+            if self.window > previous:
+                self.counters["increases"] += 1
+
+    def _observe_headers(self, headers: Mapping[str, str]):
+        """记录 x-ratelimit-* 响应头"""
+        for name, key in (
+            ("x-ratelimit-limit-requests", "limit_requests"),
+            ("x-ratelimit-remaining-requests", "remaining_requests"),
+            ("x-ratelimit-remaining-tokens", "remaining_tokens"),
+        ):
+            value = _header_int(headers, name)
+            if value is not None:
+                self.last_headers[key] = value
+
+    def _decrease(self):
+        """乘性减小窗口，冷却时间内只减小一次"""
+        now = time.monotonic()
+        if now - self._last_decrease < settings.llm_limiter_cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(settings.llm_limiter_min), math.floor(self.limit * settings.llm_limiter_backoff))
+        self.counters["decreases"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """限流器统计信息"""
+        with self._lock:
+            return {
+                "enabled": settings.llm_limiter_enabled,
+                "window": self.window,
+                "inflight": self.inflight,
+                "queued": len(self._waiters),
+                "min": settings.llm_limiter_min,
+                "max": settings.llm_limiter_max,
+                "latency_baselines": {node: round(value, 3) for node, value in self._baselines.items()},
+                "rate_limit_headers": dict(self.last_headers),
+                **self.counters,
+            }
+
+
+# 创建全局实例
+llm_limiter = AdaptiveLimiter()
@@ -0,0 +1,327 @@
+"""
+LLM客户端注册表
+
+进程内共享的 ChatOpenAI 实例与 HTTP 连接池管理。
+"""
+import importlib.util
+import threading
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel, ConfigDict
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+
+from .breaker import circuit_breakers
+from .config import settings
+from .hedging import hedging
+from .resilience import CIRCUIT_OPEN, RETRYABLE_ERRORS, LLMCallError, call_with_retry, stream_with_retry
+from .usage import TokenUsage, record_usage
+
+
+class SamplingProfile(BaseModel):
+    """采样参数配置（不可变），按调用绑定到共享客户端"""
+    model_config = ConfigDict(frozen=True)
+
+    name: str
+    temperature: float
+    max_tokens: int
+    stop: Optional[Tuple[str, ...]] = None
+    json_mode: bool = False  # 要求模型返回 JSON 对象（response_format=json_object）
+
+    def bind(self, llm: ChatOpenAI) -> Runnable:
+        """返回绑定了本配置的客户端，不修改共享实例"""
+        kwargs: Dict[str, Any] = {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        if self.stop:
+            kwargs["stop"] = list(self.stop)
+        if self.json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        return llm.bind(**kwargs)
+
+    def scaled(self, count: int) -> "SamplingProfile":
+        """按条目数放大 max_tokens，用于一次生成多个条目的配置（max_tokens 为单个条目的预算）"""
+        return self.model_copy(update={"max_tokens": self.max_tokens * max(1, count)})
+
+
+class SamplingProfiles:
+    """
+    预定义的采样配置
+
+    只在回复格式有明确结尾标记、且标记之后的内容不被使用时设置停止序列。
+    生成答案的回复以必须保留的"[由AI生成]"结尾，JSON回复由 max_tokens 和 json_mode 约束，
+    质量评估的最后一节（改进建议）需要完整保留，这些配置不设置停止序列。
+    """
+
+    # 生成答案
+    GENERATION = SamplingProfile(name="generation", temperature=0.7, max_tokens=800)
+    # 打包生成多个答案：max_tokens 为每个答案的预算，调用时用 scaled(问题数) 放大
+    BATCH_GENERATION = SamplingProfile(name="batch_generation", temperature=0.7, max_tokens=800)
+    # 多候选生成：较高温度让候选答案之间有差异
+    CANDIDATE_GENERATION = SamplingProfile(name="candidate_generation", temperature=0.9, max_tokens=800)
+    # 生成答案并自评（快速模式），需要容纳JSON格式的答案和评分
+    GRADED_GENERATION = SamplingProfile(name="graded_generation", temperature=0.5, max_tokens=1200, json_mode=True)
+    # 质量评估：低温度以获得更稳定的评分
+    GRADING = SamplingProfile(name="grading", temperature=0.3, max_tokens=800)
+    # 改进卡片（工作流）：只使用改进后的正面和背面，在"改进说明"处停止
+    IMPROVEMENT = SamplingProfile(name="improvement", temperature=0.3, max_tokens=800, stop=("改进说明",))
+    # 改进卡片（旧接口）：返回改进说明，不设置停止序列
+    IMPROVEMENT_WITH_SUMMARY = SamplingProfile(name="improvement_with_summary", temperature=0.3, max_tokens=800)
+
+
+class LLMClientRegistry:
+    """进程级LLM客户端注册表
+
+    每个 provider（base_url）共享一个长连接的 httpx 连接池，
+    每个 (provider, model) 共享一个 ChatOpenAI 实例。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._http_clients: Dict[str, httpx.AsyncClient] = {}
+        self._llms: Dict[Tuple[str, str], ChatOpenAI] = {}
+        self._request_counts: Dict[str, int] = {}
+
+    def get_llm(self, model: Optional[str] = None, base_url: Optional[str] = None) -> ChatOpenAI:
+        """
+        获取共享的LLM客户端
+
+        Args:
+            model: 模型名称，默认为 settings.zhipu_model
+            base_url: API地址，默认为 settings.zhipu_base_url
+
+        Returns:
+            ChatOpenAI: 共享实例（不要修改其属性，用 SamplingProfile.bind 按调用绑定参数）
+        """
+        model = model or settings.zhipu_model
+        base_url = base_url or settings.zhipu_base_url
+        key = (base_url, model)
+
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                llm = ChatOpenAI(
+                    model=model,
+                    openai_api_key=settings.zhipu_api_key,
+                    openai_api_base=base_url,
+                    temperature=0.7,
+                    max_tokens=800,
+                    stream_usage=True,  # 流式输出时也返回token用量
+                    max_retries=0,  # 重试由 invoke_llm 统一处理，避免与SDK内置重试叠加
+                    include_response_headers=True,  # 自适应并发限制读取 x-ratelimit-* 响应头
+                    http_async_client=self._get_http_client(base_url),
+                )
+                self._llms[key] = llm
+            return llm
+
+    def _get_http_client(self, base_url: str) -> httpx.AsyncClient:
+        """获取（或创建）某个provider的连接池，调用方需持有锁"""
+        client = self._http_clients.get(base_url)
+        if client is None or client.is_closed:
+            limits = httpx.Limits(
+                max_connections=settings.llm_pool_max_connections,
+                max_keepalive_connections=settings.llm_pool_max_keepalive_connections,
+                keepalive_expiry=settings.llm_pool_keepalive_expiry,
+            )
+
+            async def count_request(request: httpx.Request):
+                self._request_counts[base_url] = self._request_counts.get(base_url, 0) + 1
+
+            client = httpx.AsyncClient(
+                limits=limits,
+                http2=self._http2_enabled(),
+                event_hooks={"request": [count_request]},
+            )
+            self._http_clients[base_url] = client
+        return client
+
+    @staticmethod
+    def _http2_enabled() -> bool:
+        """HTTP/2 需要可选依赖 h2，未安装时回退到 HTTP/1.1 keep-alive"""
+        return settings.llm_http2 and importlib.util.find_spec("h2") is not None
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息"""
+        pools = {}
+        with self._lock:
+            for base_url, client in self._http_clients.items():
+                connections = getattr(getattr(client._transport, "_pool", None), "connections", [])
+                idle = sum(1 for conn in connections if conn.is_idle())
+                pools[base_url] = {
+                    "closed": client.is_closed,
+                    "http2": self._http2_enabled(),
+                    "connections": len(connections),
+                    "idle_connections": idle,
+                    "active_connections": len(connections) - idle,
+                    "requests": self._request_counts.get(base_url, 0),
+                }
+            models = [model for _, model in self._llms]
+
+        return {
+            "models": models,
+            "pools": pools,
+            "limits": {
+                "max_connections": settings.llm_pool_max_connections,
+                "max_keepalive_connections": settings.llm_pool_max_keepalive_connections,
+                "keepalive_expiry": settings.llm_pool_keepalive_expiry,
+            }
+        }
+
+    async def aclose(self):
+        """关闭所有连接池"""
+        with self._lock:
+            clients = list(self._http_clients.values())
+            self._http_clients.clear()
+            self._llms.clear()
+
+        for client in clients:
+            await client.aclose()
+
+
+# 创建全局实例
+llm_registry = LLMClientRegistry()
+
+
+async def invoke_llm(
+    llm: ChatOpenAI,
+    messages: List[BaseMessage],
+    profile: SamplingProfile,
+    node: str
+) -> Tuple[AIMessage, TokenUsage]:
+    """
+    按采样配置调用LLM并记录真实token用量
+
+    每次尝试按节点配置超时，可重试的错误（限流、服务端错误、超时、连接错误）
+    按带抖动的指数退避重试，见 resilience.call_with_retry。
+    开启对冲时，每次尝试内部可能再发出一个相同请求，见 hedging.HedgingController。
+    主模型熔断或重试后仍然失败时改用备用模型（settings.llm_fallback_model），
+    实际使用的模型见 served_model(response)。
+
+    Args:
+        llm: 共享的LLM客户端
+        messages: 消息列表
+        profile: 采样配置
+        node: 调用所属的节点/操作名，用于用量统计
+
+    Returns:
+        (模型回复, 本次调用的token用量)
+
+    Raises:
+        LLMCallError: 不可重试的错误、重试次数用尽，或主模型和备用模型都已熔断
+    """
+    model = getattr(llm, "model_name", None)
+    if not model:
+        response = await _invoke_model(llm, messages, profile, node, None)
+        return response, record_usage(node, response)
+
+    served = circuit_breakers.select(model)
+    if served is None:
+        raise LLMCallError(node, CIRCUIT_OPEN, 0, RuntimeError(f"Circuit open for model {model}"))
+
+    try:
+        response = await _invoke_model(_model_llm(llm, served), messages, profile, node, served)
+    except LLMCallError as error:
+        fallback = settings.llm_fallback_model
+        if (served != model or not fallback or fallback == model
+                or error.kind not in RETRYABLE_ERRORS or not circuit_breakers.allow(fallback)):
+            raise
+        print(f"LLM call for {node} failed on {model} ({error.kind}), falling back to {fallback}")
+        served = fallback
+        response = await _invoke_model(_model_llm(llm, served), messages, profile, node, served)
+
+    response.response_metadata["served_model"] = served
+    response.response_metadata.setdefault("model_name", served)
+    return response, record_usage(node, response)
+
+
+async def stream_llm(
+    llm: ChatOpenAI,
+    messages: List[BaseMessage],
+    profile: SamplingProfile,
+    node: str
+) -> AsyncIterator[AIMessageChunk]:
+    """
+    按采样配置流式调用LLM
+
+    片段间空闲超时、重试和熔断统计见 resilience.stream_with_retry，不对冲。
+    主模型熔断，或在输出第一个片段前重试后仍然失败时改用备用模型；
+    第一个片段的 response_metadata 带 served_model，合并后的消息可以用 served_model() 读取。
+    用量由调用方在合并所有片段后记录。
+
+    Raises:
+        LLMCallError: 不可重试的错误、重试次数用尽、已经输出片段后出错，或主模型和备用模型都已熔断
+    """
+    model = getattr(llm, "model_name", None)
+    served = None
+    if model:
+        served = circuit_breakers.select(model)
+        if served is None:
+            raise LLMCallError(node, CIRCUIT_OPEN, 0, RuntimeError(f"Circuit open for model {model}"))
+
+    started = False
+    try:
+        async for chunk in _stream_model(_model_llm(llm, served) if served else llm, messages, profile, node, served):
+            if not started and served:
+                chunk.response_metadata["served_model"] = served
+            started = True
+            yield chunk
+        return
+    except LLMCallError as error:
+        fallback = settings.llm_fallback_model
+        if (started or not served or served != model or not fallback or fallback == model
+                or error.kind not in RETRYABLE_ERRORS or not circuit_breakers.allow(fallback)):
+            raise
+        print(f"LLM stream for {node} failed on {model} ({error.kind}), falling back to {fallback}")
+
+    async for chunk in _stream_model(_model_llm(llm, fallback), messages, profile, node, fallback):
+        if not started:
+            chunk.response_metadata["served_model"] = fallback
+        started = True
+        yield chunk
+
+
+def served_model(response: AIMessage) -> str:
+    """
+    实际处理该回复的模型（配置中的模型名称，而不是provider返回的版本名）
+
+    缓存按该名称写入，熔断期间备用模型的结果不会被当作主模型的结果。
+    """
+    return response.response_metadata.get("served_model") or settings.zhipu_model
+
+
+def _model_llm(llm: ChatOpenAI, model: str) -> ChatOpenAI:
+    """同一 provider 下指定模型的共享客户端"""
+    if model == llm.model_name:
+        return llm
+    return llm_registry.get_llm(model, base_url=getattr(llm, "openai_api_base", None))
+
+
+async def _invoke_model(
+    llm: ChatOpenAI,
+    messages: List[BaseMessage],
+    profile: SamplingProfile,
+    node: str,
+    model: Optional[str]
+) -> AIMessage:
+    """带重试、对冲和熔断统计地调用一个模型"""
+    bound = profile.bind(llm)
+    return await call_with_retry(
+        lambda: hedging.run(lambda: bound.ainvoke(messages), node),
+        node,
+        model=model
+    )
+
+
+def _stream_model(
+    llm: ChatOpenAI,
+    messages: List[BaseMessage],
+    profile: SamplingProfile,
+    node: str,
+    model: Optional[str]
+) -> AsyncIterator[AIMessageChunk]:
+    """带空闲超时、重试和熔断统计地流式调用一个模型"""
+    bound = profile.bind(llm)
+    return stream_with_retry(lambda: bound.astream(messages), node, model=model)
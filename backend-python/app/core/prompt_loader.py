@@ -1,5 +1,6 @@
 import os
 import json
+import hashlib
 from pathlib import Path
 from typing import Dict, Any
 from jinja2 import Environment, FileSystemLoader, Template
@@ -46,6 +47,9 @@ class PromptLoader:
         # 缓存已加载的模板
         self._template_cache: Dict[str, Template] = {}
 
+        # 缓存模板内容哈希：category -> (文件状态签名, 哈希)
+        self._hash_cache: Dict[str, tuple] = {}
+
     def get_prompt(self, category: str, prompt_name: str, **kwargs) -> str:
         """
         获取提示词
@@ -73,7 +77,8 @@ class PromptLoader:
 
             # 使用缓存
             cache_key = f"{category}/{prompt_name}"
-            if cache_key not in self._template_cache:
+            cached = self._template_cache.get(cache_key)
+            if cached is None or not cached.is_up_to_date:  # 模板文件修改后重新加载
                 template = self.jinja_env.get_template(prompt_path)
                 self._template_cache[cache_key] = template
             else:
@@ -119,6 +124,41 @@ class PromptLoader:
         # 默认路径规则
         return f"{category}/{prompt_name}.txt"
 
+    def get_category_hash(self, category: str) -> str:
+        """
+        获取某类提示词模板内容的哈希（提示词版本）
+
+        模板文件被修改后哈希会随之改变，可用于缓存失效。
+
+        Args:
+            category: 提示词类别
+
+        Returns:
+            模板内容的 sha256 十六进制摘要（前16位）
+        """
+        paths = sorted(self.list_prompts().get(category, {}).items())
+
+        # 文件状态未变化时直接复用哈希，避免每次读取文件
+        signature = []
+        for name, path in paths:
+            stat = os.stat(path)
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        signature = tuple(signature)
+
+        cached = self._hash_cache.get(category)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        digest = hashlib.sha256()
+        for name, path in paths:
+            digest.update(name.encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+
+        version = digest.hexdigest()[:16]
+        self._hash_cache[category] = (signature, version)
+        return version
+
     def reload_config(self):
         """重新加载配置文件"""
         config_path = self.prompts_dir / "prompts_config.json"
@@ -128,6 +168,7 @@ class PromptLoader:
 
         # 清空模板缓存
         self._template_cache.clear()
+        self._hash_cache.clear()
 
     def list_prompts(self) -> Dict[str, Dict[str, str]]:
         """列出所有可用的提示词"""
@@ -12,5 +12,7 @@ class Prompts:
     # 名称
     SYSTEM = "system"
     GENERATE_ANSWER = "generate_answer"
+    GENERATE_BATCH = "generate_batch"
+    GENERATE_GRADED = "generate_graded"
     CHECK_QUALITY = "check_quality"
     IMPROVE_CARD = "improve_card"
\ No newline at end of file
@@ -0,0 +1,270 @@
+"""
+LLM调用的重试与超时
+
+- 每次尝试按节点配置超时，避免挂起的连接长期占用并发槽位
+- 按错误类型决定是否重试：限流（429）、服务端错误（5xx）、超时和连接错误重试，
+  其他客户端错误（4xx）直接失败
+- 退避时间为带抖动的指数退避，服务端返回 Retry-After 时至少等待该时长
+- 每次尝试占用自适应并发窗口的一个槽位（见 limiter），退避等待期间不占用
+- 指定模型时每次尝试的结果计入该模型的熔断器（见 breaker），熔断后不再重试
+- 流式调用（stream_with_retry）按片段间的空闲时间超时，只在输出第一个片段前重试
+"""
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+import openai
+
+from .breaker import circuit_breakers
+from .config import settings
+from .limiter import llm_limiter, response_headers
+
+T = TypeVar("T")
+
+# 错误类型
+RATE_LIMIT = "rate_limit"
+SERVER_ERROR = "server_error"
+TIMEOUT = "timeout"
+CONNECTION = "connection"
+CLIENT_ERROR = "client_error"
+CIRCUIT_OPEN = "circuit_open"
+
+RETRYABLE_ERRORS = (RATE_LIMIT, SERVER_ERROR, TIMEOUT, CONNECTION)
+
+
+class LLMCallError(Exception):
+    """重试后仍然失败的LLM调用"""
+
+    def __init__(self, node: str, kind: str, attempts: int, error: BaseException):
+        self.node = node
+        self.kind = kind
+        self.attempts = attempts
+        self.error = error
+        super().__init__(f"{kind} after {attempts} attempt(s): {error}")
+
+
+def classify_error(error: BaseException) -> str:
+    """判断错误类型"""
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, httpx.TimeoutException)):
+        return TIMEOUT
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return CONNECTION
+
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code == 429:
+        return RATE_LIMIT
+    if status_code in (408, 409) or (status_code is not None and status_code >= 500):
+        return SERVER_ERROR
+    return CLIENT_ERROR
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """读取响应头中的 Retry-After（秒），不存在或无法解析时返回 None"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: Optional[BaseException] = None) -> float:
+    """第 attempt 次重试前的等待时间：全抖动指数退避，且不少于 Retry-After"""
+    ceiling = min(settings.llm_retry_max_delay, settings.llm_retry_base_delay * (2 ** attempt))
+    delay = random.uniform(0, ceiling)
+    server_delay = retry_after(error) if error is not None else None
+    if server_delay is not None:
+        delay = max(delay, min(server_delay, settings.llm_retry_max_delay))
+    return delay
+
+
+def node_timeout(node: str) -> float:
+    """节点的单次调用超时（秒）"""
+    return settings.llm_node_timeouts.get(node, settings.llm_timeout)
+
+
+class RetryMetrics:
+    """进程级重试统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_node: Dict[str, Dict[str, int]] = {}
+
+    def record(self, node: str, event: str):
+        """记录一次事件：calls、retries、failures 或具体的错误类型"""
+        with self._lock:
+            counters = self.by_node.setdefault(node, {})
+            counters[event] = counters.get(event, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        with self._lock:
+            by_node = {node: dict(counters) for node, counters in self.by_node.items()}
+
+        totals: Dict[str, int] = {}
+        for counters in by_node.values():
+            for event, count in counters.items():
+                totals[event] = totals.get(event, 0) + count
+        return {"total": totals, "by_node": by_node}
+
+
+# 创建全局实例
+retry_metrics = RetryMetrics()
+
+
+async def call_with_retry(
+    call: Callable[[], Awaitable[T]],
+    node: str,
+    timeout: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    model: Optional[str] = None
+) -> T:
+    """
+    带超时和重试地执行一次LLM调用
+
+    Args:
+        call: 每次尝试时调用，返回新的协程
+        node: 调用所属的节点/操作名，用于选择超时和统计
+        timeout: 单次尝试超时（秒），默认按节点配置
+        max_retries: 最大重试次数，默认 settings.llm_max_retries
+        model: 调用的模型，结果计入该模型的熔断器
+
+    Raises:
+        LLMCallError: 不可重试的错误或重试次数用尽
+    """
+    timeout = node_timeout(node) if timeout is None else timeout
+    max_retries = settings.llm_max_retries if max_retries is None else max_retries
+
+    attempt = 0
+    while True:
+        retry_metrics.record(node, "calls")
+        try:
+            async with llm_limiter.slot(node) as slot:
+                started = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(call(), timeout=timeout)
+                except Exception as error:
+                    kind = classify_error(error)
+                    if kind in (RATE_LIMIT, TIMEOUT):
+                        slot.overloaded(kind, response_headers(error))
+                    raise
+                # 开启对冲时 call 内部可能另发一个请求（占用自己的槽位），这里记录的是原请求的延迟
+                latency = time.monotonic() - started
+                slot.success(latency, response_headers(result))
+            if model:
+                circuit_breakers.record(model, True, latency, node)
+            return result
+        except Exception as error:
+            kind = classify_error(error)
+            retry_metrics.record(node, kind)
+            if model and kind in RETRYABLE_ERRORS:
+                circuit_breakers.record(model, False, node=node)
+
+            if (kind not in RETRYABLE_ERRORS or attempt >= max_retries
+                    or (model and circuit_breakers.is_open(model))):
+                retry_metrics.record(node, "failures")
+                raise LLMCallError(node, kind, attempt + 1, error) from error
+
+            delay = backoff_delay(attempt, error)
+            attempt += 1
+            retry_metrics.record(node, "retries")
+            print(f"LLM call for {node} failed ({kind}), retry {attempt}/{max_retries} in {delay:.2f}s: {error}")
+            await asyncio.sleep(delay)
+
+
+async def stream_with_retry(
+    stream: Callable[[], AsyncIterator[T]],
+    node: str,
+    timeout: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    model: Optional[str] = None
+) -> AsyncIterator[T]:
+    """
+    带空闲超时和重试地执行一次流式LLM调用
+
+    与 call_with_retry 一样占用并发槽位、按错误类型重试并计入熔断器，区别在于：
+    - 超时按相邻两个片段之间的等待时间计算，生成长答案不会被整体超时打断
+    - 只在输出第一个片段前重试，已经输出的片段无法撤回，之后的错误直接抛出
+    - 耗时取决于输出长度，不参与限流器和熔断器的延迟判断
+
+    Args:
+        stream: 每次尝试时调用，返回新的异步迭代器
+        node: 调用所属的节点/操作名，用于选择超时和统计
+        timeout: 片段之间的最长等待时间（秒），默认按节点配置
+        max_retries: 最大重试次数，默认 settings.llm_max_retries
+        model: 调用的模型，结果计入该模型的熔断器
+
+    Raises:
+        LLMCallError: 不可重试的错误、重试次数用尽，或已经输出片段后出错
+    """
+    timeout = node_timeout(node) if timeout is None else timeout
+    max_retries = settings.llm_max_retries if max_retries is None else max_retries
+
+    attempt = 0
+    while True:
+        retry_metrics.record(node, "calls")
+        started = False
+        try:
+            async with llm_limiter.slot(node) as slot:
+                iterator = stream().__aiter__()
+                headers = None
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), timeout=timeout)
+                        except StopAsyncIteration:
+                            break
+                        headers = headers or response_headers(chunk)
+                        started = True
+                        yield chunk
+                except Exception as error:
+                    kind = classify_error(error)
+                    if kind in (RATE_LIMIT, TIMEOUT):
+                        slot.overloaded(kind, response_headers(error))
+                    raise
+                finally:
+                    aclose = getattr(iterator, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+                slot.success(headers=headers)
+            if model:
+                circuit_breakers.record(model, True, node=node)
+            return
+        except Exception as error:
+            kind = classify_error(error)
+            retry_metrics.record(node, kind)
+            if model and kind in RETRYABLE_ERRORS:
+                circuit_breakers.record(model, False, node=node)
+
+            if (started or kind not in RETRYABLE_ERRORS or attempt >= max_retries
+                    or (model and circuit_breakers.is_open(model))):
+                retry_metrics.record(node, "failures")
+                raise LLMCallError(node, kind, attempt + 1, error) from error
+
+            delay = backoff_delay(attempt, error)
+            attempt += 1
+            retry_metrics.record(node, "retries")
+            print(f"LLM stream for {node} failed ({kind}), retry {attempt}/{max_retries} in {delay:.2f}s: {error}")
+            await asyncio.sleep(delay)
@@ -0,0 +1,124 @@
+"""
+相同请求合并（single-flight）
+
+同一时刻多个相同的调用（如多个用户同时问同一个问题，或同一批次中的重复问题）
+只执行一次，其余调用等待同一个进行中的结果，不再重复调用LLM。
+调用完成后立即移除，之后的相同请求由答案缓存和质量检查缓存处理。
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Sequence, Tuple, TypeVar
+
+from .config import settings
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class _Flight:
+    """进行中的调用"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """按键合并进行中的相同调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[Tuple[str, str], _Flight] = {}
+        self.by_namespace: Dict[str, Dict[str, int]] = {}
+
+    async def do(self, namespace: str, key: str, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        执行调用；已有相同键的调用在进行中时等待它的结果
+
+        调用在独立的任务中执行，某个等待者被取消不影响其他等待者；
+        所有等待者都取消后才取消调用本身。
+
+        Args:
+            namespace: 调用类型（如 generate_answer），用于分别统计
+            key: 规范化后的输入
+            call: 实际调用
+
+        Returns:
+            (结果, 是否复用了其他请求的调用)
+        """
+        if not settings.singleflight_enabled:
+            return await call(), False
+
+        flight_key = (namespace, key)
+        flight = self._flights.get(flight_key)
+        # 其他事件循环留下的调用（如测试之间）不能复用
+        if flight is not None and flight.task.get_loop() is not asyncio.get_running_loop():
+            flight = None
+
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[flight_key] = flight
+            flight.task.add_done_callback(lambda _, done=flight: self._remove(flight_key, done))
+        self._record(namespace, "shared" if shared else "executions")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _remove(self, flight_key: Tuple[str, str], flight: _Flight):
+        if self._flights.get(flight_key) is flight:
+            del self._flights[flight_key]
+
+    def _record(self, namespace: str, event: str, count: int = 1):
+        with self._lock:
+            counters = self.by_namespace.setdefault(namespace, {"executions": 0, "shared": 0, "collapsed": 0})
+            counters[event] += count
+
+    def record_collapsed(self, namespace: str, count: int):
+        """记录批次内在调度前合并掉的重复条目数"""
+        if count:
+            self._record(namespace, "collapsed", count)
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息：shared 为等待进行中调用的请求数，collapsed 为批次内合并的重复条目数"""
+        with self._lock:
+            by_namespace = {namespace: dict(counters) for namespace, counters in self.by_namespace.items()}
+        return {
+            "enabled": settings.singleflight_enabled,
+            "in_flight": len(self._flights),
+            "calls_avoided": sum(counters["shared"] + counters["collapsed"] for counters in by_namespace.values()),
+            "by_namespace": by_namespace,
+        }
+
+
+def collapse(items: Sequence[T], key: Callable[[T], Hashable]) -> Tuple[List[T], List[int]]:
+    """
+    合并重复条目
+
+    Returns:
+        (去重后的条目（保持首次出现的顺序）, 每个原始条目对应的去重后下标)
+    """
+    unique: List[T] = []
+    positions: List[int] = []
+    seen: Dict[Hashable, int] = {}
+    for item in items:
+        item_key = key(item)
+        if item_key not in seen:
+            seen[item_key] = len(unique)
+            unique.append(item)
+        positions.append(seen[item_key])
+    return unique, positions
+
+
+def expand(results: Sequence[R], positions: Sequence[int]) -> List[R]:
+    """把去重后的结果按原始顺序展开"""
+    return [results[position] for position in positions]
+
+
+# 创建全局实例
+singleflight = SingleFlight()
@@ -0,0 +1,148 @@
+"""
+Token用量统计
+
+从模型返回的 usage_metadata 读取真实的 prompt/completion token 数，
+按节点、按请求（UsageTracker）和进程全局（usage_metrics）汇总。
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from pydantic import BaseModel
+
+
+class TokenUsage(BaseModel):
+    """Token用量"""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    calls: int = 0
+
+    def add(self, other: "TokenUsage") -> "TokenUsage":
+        """累加另一份用量（原地修改并返回自身）"""
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.total_tokens += other.total_tokens
+        self.calls += other.calls
+        return self
+
+    @classmethod
+    def from_message(cls, message: Any) -> "TokenUsage":
+        """从模型返回的消息中读取用量"""
+        metadata = getattr(message, "usage_metadata", None) or {}
+        prompt_tokens = metadata.get("input_tokens", 0) or 0
+        completion_tokens = metadata.get("output_tokens", 0) or 0
+        return cls(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=metadata.get("total_tokens") or prompt_tokens + completion_tokens,
+            calls=1
+        )
+
+
+def merge_token_usage(left: Optional[Dict[str, dict]], right: Optional[Dict[str, dict]]) -> Dict[str, dict]:
+    """按节点合并用量字典（用作 LangGraph 状态的 reducer）"""
+    merged = {node: dict(usage) for node, usage in (left or {}).items()}
+    for node, usage in (right or {}).items():
+        current = TokenUsage(**merged.get(node, {}))
+        merged[node] = current.add(TokenUsage(**usage)).model_dump()
+    return merged
+
+
+def sum_token_usage(by_node: Optional[Dict[str, dict]]) -> TokenUsage:
+    """汇总所有节点的用量"""
+    total = TokenUsage()
+    for usage in (by_node or {}).values():
+        total.add(TokenUsage(**usage))
+    return total
+
+
+class UsageTracker:
+    """单个请求（或批次）的用量汇总，支持嵌套：子跟踪器的记录同时计入父跟踪器"""
+
+    def __init__(self, parent: Optional["UsageTracker"] = None):
+        self.parent = parent
+        self.by_node: Dict[str, TokenUsage] = {}
+
+    def record(self, node: str, usage: TokenUsage):
+        """记录一次调用的用量"""
+        self.by_node.setdefault(node, TokenUsage()).add(usage)
+        if self.parent:
+            self.parent.record(node, usage)
+
+    @property
+    def total(self) -> TokenUsage:
+        return sum_token_usage(self.node_usage())
+
+    def node_usage(self) -> Dict[str, dict]:
+        """按节点的用量字典"""
+        return {node: usage.model_dump() for node, usage in self.by_node.items()}
+
+
+_current_tracker: ContextVar[Optional[UsageTracker]] = ContextVar("usage_tracker", default=None)
+
+
+@contextmanager
+def track_usage() -> Iterator[UsageTracker]:
+    """在当前上下文（及其创建的异步任务）中统计token用量"""
+    tracker = UsageTracker(parent=_current_tracker.get())
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+
+class UsageMetrics:
+    """进程级token用量统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_node: Dict[str, TokenUsage] = {}
+        self.by_model: Dict[str, TokenUsage] = {}
+        self.total = TokenUsage()
+
+    def record(self, node: str, model: str, usage: TokenUsage):
+        """记录一次调用的用量"""
+        with self._lock:
+            self.total.add(usage)
+            self.by_node.setdefault(node, TokenUsage()).add(usage)
+            self.by_model.setdefault(model, TokenUsage()).add(usage)
+
+    def stats(self) -> Dict[str, Any]:
+        """用量统计信息"""
+        with self._lock:
+            return {
+                "total": self.total.model_dump(),
+                "by_node": {node: usage.model_dump() for node, usage in self.by_node.items()},
+                "by_model": {model: usage.model_dump() for model, usage in self.by_model.items()}
+            }
+
+
+# 创建全局实例
+usage_metrics = UsageMetrics()
+
+
+def record_usage(node: str, message: Any, model: Optional[str] = None) -> TokenUsage:
+    """
+    记录一次LLM调用的真实用量
+
+    同时计入当前请求的 UsageTracker（如有）和进程级统计。
+
+    Args:
+        node: 调用所属的节点/操作名，如 generate_answer
+        message: 模型返回的消息（含 usage_metadata）
+        model: 模型名称，默认从响应元数据读取
+
+    Returns:
+        TokenUsage: 本次调用的用量
+    """
+    usage = TokenUsage.from_message(message)
+    model = model or (getattr(message, "response_metadata", None) or {}).get("model_name") or "unknown"
+
+    usage_metrics.record(node, model, usage)
+    tracker = _current_tracker.get()
+    if tracker:
+        tracker.record(node, usage)
+    return usage
@@ -0,0 +1,235 @@
+"""
+工作流检查点存储
+
+后端可选：
+- memory：进程内 BoundedMemorySaver（默认），限制 thread 数量和存活时间
+- sqlite：持久化到 SQLite（默认与应用数据库共用同一个文件），进程重启后可以
+  使用相同的 thread_id 从最后完成的节点继续执行。依赖 langgraph-checkpoint-sqlite
+  （见 requirements.txt），配置了 sqlite 但未安装时启动失败，不会悄悄回退到 memory。
+
+检查点按 thread 的最后更新时间做 TTL 清理。
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.base.id import UUID as CheckpointUUID
+from langgraph.checkpoint.memory import MemorySaver
+
+try:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+except ImportError:  # langgraph-checkpoint-sqlite 为可选依赖
+    aiosqlite = None
+    AsyncSqliteSaver = None
+
+from ..core.config import settings
+from ..core.database import DATABASE_URL
+
+# UUID 纪元（1582-10-15）与 Unix 纪元之间的 100 纳秒间隔数
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def checkpoint_timestamp(checkpoint_id: str) -> float:
+    """从检查点ID（UUIDv6）中读取创建时间（Unix 时间戳）"""
+    return (CheckpointUUID(checkpoint_id).time - _UUID_EPOCH_OFFSET) / 1e7
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    有界的内存检查点存储
+
+    记录每个 thread 最后写入的时间，写入时淘汰超过 ttl 未更新的 thread，
+    thread 数量超过 max_threads 时淘汰最久未更新的 thread。
+    """
+
+    def __init__(self, max_threads: int = 1000, ttl: Optional[float] = None):
+        super().__init__()
+        self.max_threads = max(1, max_threads)
+        self.ttl = ttl
+        self._touched: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _has_thread(self, config) -> bool:
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        return thread_id is None or thread_id in self.storage
+
+    def get_tuple(self, config):
+        # 查询不存在的 thread 时不在 defaultdict 中留下空条目
+        if not self._has_thread(config):
+            return None
+        return super().get_tuple(config)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        if not self._has_thread(config):
+            return iter(())
+        return super().list(config, filter=filter, before=before, limit=limit)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+        self._touch(config["configurable"]["thread_id"])
+        return result
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._touched.pop(thread_id, None)
+            super().delete_thread(thread_id)
+
+    def _touch(self, thread_id: str):
+        """记录写入时间，并淘汰过期和超出数量上限的 thread"""
+        now = time.monotonic()
+        with self._lock:
+            self._touched[thread_id] = now
+            self._touched.move_to_end(thread_id)
+
+            evicted = []
+            while len(self._touched) > self.max_threads:
+                evicted.append(self._touched.popitem(last=False)[0])
+            if self.ttl is not None:
+                while self._touched:
+                    oldest, touched_at = next(iter(self._touched.items()))
+                    if oldest == thread_id or touched_at >= now - self.ttl:
+                        break
+                    evicted.append(self._touched.popitem(last=False)[0])
+
+            for evicted_thread in evicted:
+                super().delete_thread(evicted_thread)
+            self.evictions += len(evicted)
+
+    def footprint(self) -> Dict[str, int]:
+        """当前占用：thread 数、检查点数和序列化数据的字节数"""
+        with self._lock:
+            checkpoints = [
+                saved for namespaces in list(self.storage.values())
+                for checkpoints in namespaces.values() for saved in checkpoints.values()
+            ]
+            size = sum(len(saved[0][1]) + len(saved[1][1]) for saved in checkpoints)
+            size += sum(len(blob[1]) for blob in list(self.blobs.values()))
+            size += sum(
+                len(write[2][1]) for writes in list(self.writes.values()) for write in writes.values()
+            )
+            return {
+                "threads": len(self.storage),
+                "checkpoints": len(checkpoints),
+                "bytes": size,
+            }
+
+
+class CheckpointManager:
+    """管理工作流检查点存储的创建、关闭和清理"""
+
+    def __init__(self):
+        self.saver: BaseCheckpointSaver = BoundedMemorySaver(
+            max_threads=settings.checkpoint_memory_max_threads,
+            ttl=settings.checkpoint_ttl
+        )
+        self.backend = "memory"
+        self._conn = None
+        self._prune_task: Optional[asyncio.Task] = None
+        self.pruned = 0
+
+    @property
+    def db_path(self) -> str:
+        """SQLite 检查点文件路径"""
+        return settings.checkpoint_db_path or DATABASE_URL.split("///", 1)[-1]
+
+    async def open(self):
+        """
+        按配置创建检查点存储，并启动定期清理（应用启动时调用）
+
+        配置了 sqlite 后端但无法打开数据库时启动失败，不回退到内存：
+        回退后检查点在重启后丢失，与配置持久化检查点的本意不符。
+        """
+        if settings.checkpoint_backend == "sqlite":
+            if AsyncSqliteSaver is None:
+                raise RuntimeError(
+                    "CHECKPOINT_BACKEND=sqlite requires langgraph-checkpoint-sqlite: "
+                    "pip install langgraph-checkpoint-sqlite"
+                )
+            try:
+                self._conn = await aiosqlite.connect(self.db_path)
+                saver = AsyncSqliteSaver(self._conn)
+                await saver.setup()
+                self.saver = saver
+                self.backend = "sqlite"
+            except Exception as error:
+                await self._close_conn()
+                raise RuntimeError(f"Error opening checkpoint database {self.db_path}: {error}") from error
+
+        await self.prune()
+        if settings.checkpoint_prune_interval > 0:
+            self._prune_task = asyncio.create_task(self._prune_periodically())
+
+    async def close(self):
+        """停止清理任务并关闭数据库连接"""
+        if self._prune_task:
+            self._prune_task.cancel()
+            await asyncio.gather(self._prune_task, return_exceptions=True)
+            self._prune_task = None
+        await self._close_conn()
+
+    async def _close_conn(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def _prune_periodically(self):
+        while True:
+            await asyncio.sleep(settings.checkpoint_prune_interval)
+            try:
+                await self.prune()
+            except Exception as error:
+                print(f"Error pruning checkpoints: {error}")
+
+    async def prune(self, ttl: Optional[float] = None) -> int:
+        """删除最后更新时间超过 ttl 秒的 thread，返回删除的 thread 数"""
+        ttl = settings.checkpoint_ttl if ttl is None else ttl
+        cutoff = time.time() - ttl
+
+        expired = [
+            thread_id for thread_id, checkpoint_id in (await self._latest_checkpoints()).items()
+            if checkpoint_timestamp(checkpoint_id) < cutoff
+        ]
+        for thread_id in expired:
+            await self.saver.adelete_thread(thread_id)
+
+        self.pruned += len(expired)
+        return len(expired)
+
+    async def _latest_checkpoints(self) -> Dict[str, str]:
+        """每个 thread 最新的检查点ID（UUIDv6 按时间有序）"""
+        if self.backend == "sqlite":
+            async with self._conn.execute(
+                "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id"
+            ) as cursor:
+                return {thread_id: checkpoint_id for thread_id, checkpoint_id in await cursor.fetchall()}
+
+        latest = {}
+        for thread_id, namespaces in list(self.saver.storage.items()):
+            checkpoint_ids: List[str] = [cid for checkpoints in namespaces.values() for cid in checkpoints]
+            if checkpoint_ids:
+                latest[thread_id] = max(checkpoint_ids)
+        return latest
+
+    def stats(self) -> Dict[str, Any]:
+        """检查点存储统计信息"""
+        stats = {
+            "backend": self.backend,
+            "ttl": settings.checkpoint_ttl,
+            "pruned": self.pruned,
+        }
+        if isinstance(self.saver, BoundedMemorySaver):
+            stats.update(
+                max_threads=self.saver.max_threads,
+                evictions=self.saver.evictions,
+                **self.saver.footprint()
+            )
+        return stats
+
+
+# 创建全局实例
+checkpoint_manager = CheckpointManager()
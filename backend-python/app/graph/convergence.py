@@ -0,0 +1,107 @@
+"""
+改进循环的收敛判断
+
+记录每轮质量检查的分数和改进前后卡片文本的变化：分数达标、达到次数上限、
+上一轮改进没有带来足够的分数提升（stalled）或改进后的卡片没有变化（unchanged）时停止，
+后两种情况省下的轮数计入 improvement_metrics。
+"""
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from ..core.config import settings
+from ..schemas.card import AnkiCard
+
+# 停止原因
+PASSED = "passed"
+MAX_ROUNDS = "max_rounds"
+STALLED = "stalled"
+UNCHANGED = "unchanged"
+
+PASS_SCORE = 70
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def same_text(before: AnkiCard, after: AnkiCard) -> bool:
+    """
+    改进前后卡片内容是否相同（只忽略空白差异）
+
+    改进回复无法解析时 _parse_improvement_response 返回原卡片，也视为相同。
+    不使用相似度阈值：一个词的修正（如 O(n) 改为 O(log n)）也是有效的改进。
+    """
+    return (_normalize(before.front) == _normalize(after.front)
+            and _normalize(before.back) == _normalize(after.back))
+
+
+def stop_reason(state: Dict[str, Any]) -> Optional[str]:
+    """
+    根据质量检查结果和分数轨迹判断是否停止改进，需要继续改进时返回 None
+
+    Args:
+        state: 卡片生成工作流状态
+    """
+    if state.get("card_unchanged"):
+        return UNCHANGED
+
+    quality_check = state.get("quality_check")
+    if quality_check is None or quality_check.score >= PASS_SCORE:
+        return PASSED
+    if state.get("improvement_count", 0) >= state.get("max_improvements", 2):
+        return MAX_ROUNDS
+
+    # 上一轮改进后分数提升不足，继续改进大概率也没有效果
+    history: List[int] = state.get("score_history") or []
+    if (state.get("improvement_count", 0) > 0 and len(history) >= 2
+            and history[-1] - history[-2] < settings.improvement_min_gain):
+        return STALLED
+    return None
+
+
+def summarize(state: Dict[str, Any]) -> Dict[str, Any]:
+    """改进循环结束时的摘要：停止原因、改进轮数、省下的轮数和分数轨迹"""
+    reason = stop_reason(state) or MAX_ROUNDS
+    rounds = state.get("improvement_count", 0)
+    saved = max(0, state.get("max_improvements", 2) - rounds) if reason in (STALLED, UNCHANGED) else 0
+    return {
+        "reason": reason,
+        "rounds": rounds,
+        "rounds_saved": saved,
+        "score_history": list(state.get("score_history") or [])
+    }
+
+
+class ImprovementMetrics:
+    """进程级改进循环统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loops = 0
+        self.rounds = 0
+        self.rounds_saved = 0
+        self.by_reason: Dict[str, int] = {}
+
+    def record(self, summary: Dict[str, Any]):
+        """记录一次改进循环的摘要"""
+        with self._lock:
+            self.loops += 1
+            self.rounds += summary["rounds"]
+            self.rounds_saved += summary["rounds_saved"]
+            self.by_reason[summary["reason"]] = self.by_reason.get(summary["reason"], 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息"""
+        with self._lock:
+            return {
+                "min_gain": settings.improvement_min_gain,
+                "loops": self.loops,
+                "rounds": self.rounds,
+                "rounds_saved": self.rounds_saved,
+                "by_reason": dict(self.by_reason)
+            }
+
+
+# 创建全局实例
+improvement_metrics = ImprovementMetrics()
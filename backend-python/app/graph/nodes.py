@@ -1,31 +1,54 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
 import re
-from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, Field, ValidationError
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langgraph.constants import START, END
 
+from ..core.concurrency import gather_within, run_bounded
 from ..core.config import settings
+from ..core.cache import normalize_question
+from ..core.llm import llm_registry, SamplingProfiles, invoke_llm, served_model
+from ..core.singleflight import collapse, expand, singleflight
+from ..core.usage import TokenUsage, merge_token_usage
 from ..schemas.card import AnkiCard, QualityCheckResult, LLMResponse
 from ..core.prompt_loader import prompt_loader
 from ..core.prompts import Prompts
+from ..services.answer_cache import answer_cache
+from ..services.idempotency import mark_degraded, shared_call
+from ..services.quality_cache import quality_cache
+from ..services.prescorer import quality_prescorer
+from ..services.packed_generation import PackedAnswerGenerator, resolve_pack_size
+from .convergence import improvement_metrics, same_text, stop_reason, summarize
 from .states import CardGenerationState, BatchGenerationState
 
 
+class SelfGradedAnswer(BaseModel):
+    """快速模式的回复：答案及其自评"""
+    answer: str
+    score: int = Field(ge=0, le=100)
+    confidence: float = 0.0
+    issues: List[str] = []
+    suggestions: List[str] = []
+
+
 class CardGenerationNodes:
     """卡片生成工作流节点"""
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=settings.zhipu_model,
-            openai_api_key=settings.zhipu_api_key,
-            openai_api_base=settings.zhipu_base_url,
-            temperature=0.7,
-            max_tokens=800,
-        )
+        self.llm = llm_registry.get_llm()
 
     async def generate_answer(self, state: CardGenerationState) -> Dict[str, Any]:
         """生成答案节点"""
         try:
+            # 答案已预先生成（如批量打包生成）
+            if state.get("answer"):
+                return {}
+
+            cached = await self._cached_answer(state)
+            if cached:
+                return cached
+
             # 使用动态加载的 prompts
             system_prompt = prompt_loader.get_prompt(Prompts.CARD_GENERATION, Prompts.SYSTEM)
             user_prompt = prompt_loader.get_prompt(
@@ -39,17 +62,256 @@ class CardGenerationNodes:
                 HumanMessage(content=user_prompt)
             ]
 
-            response = await self.llm.ainvoke(messages)
+            async def generate():
+                response, usage = await invoke_llm(
+                    self.llm, messages, SamplingProfiles.GENERATION, "generate_answer"
+                )
+                await answer_cache.set(state['question'], served_model(response), response.content, usage.total_tokens)
+                return response, usage
+
+            # 同一问题正在生成时等待它的结果；跳过缓存的请求需要新的答案，不合并
+            if state.get("use_cache", True):
+                key = answer_cache.make_key(state['question'], settings.zhipu_model, answer_cache.prompt_version())
+                (response, usage), shared = await shared_call("generate_answer", key, generate)
+            else:
+                (response, usage), shared = await generate(), False
+
+            model = served_model(response)
+            if shared:
+                # 复用其他请求的调用，本请求没有token用量
+                return {
+                    "answer": response.content,
+                    "answer_cached": False,
+                    "model_name": model,
+                    "messages": [AIMessage(content=response.content)]
+                }
 
             return {
                 "answer": response.content,
+                "answer_cached": False,
+                "model_name": model,
                 "messages": [AIMessage(content=response.content)],
-                "tokens_used": state.get("tokens_used", 0) + 100  # 估算
+                "tokens_used": state.get("tokens_used", 0) + usage.total_tokens,
+                "token_usage": {"generate_answer": usage.model_dump()}
+            }
+
+        except Exception as error:
+            raise Exception(f"生成答案失败: {str(error)}")
+
+    async def generate_graded(self, state: CardGenerationState) -> Dict[str, Any]:
+        """快速模式：一次调用生成答案并自评，自评把握足够时作为质量检查结果"""
+        try:
+            if state.get("answer"):
+                return {}
+
+            cached = await self._cached_answer(state)
+            if cached:
+                return cached
+
+            system_prompt = prompt_loader.get_prompt(Prompts.CARD_GENERATION, Prompts.SYSTEM)
+            user_prompt = prompt_loader.get_prompt(
+                Prompts.CARD_GENERATION,
+                Prompts.GENERATE_GRADED,
+                question=state['question']
+            )
+
+            messages = [
+                SystemMessage(content=system_prompt),
+                HumanMessage(content=user_prompt)
+            ]
+
+            response, usage = await invoke_llm(
+                self.llm, messages, SamplingProfiles.GRADED_GENERATION, "generate_graded"
+            )
+
+            graded = self._parse_graded_response(response.content)
+            if graded is None:
+                # 回复不是完整的JSON（如被 max_tokens 截断）：不缓存，改用标准流程生成答案
+                fallback = await self.generate_answer(state)
+                return {
+                    **fallback,
+                    "tokens_used": fallback.get("tokens_used", state.get("tokens_used", 0)) + usage.total_tokens,
+                    "token_usage": merge_token_usage(
+                        {"generate_graded": usage.model_dump()}, fallback.get("token_usage")
+                    )
+                }
+
+            answer = graded.answer.strip()
+            model = served_model(response)
+            await answer_cache.set(state['question'], model, answer, usage.total_tokens)
+
+            # 自评把握不足或分数接近通过线时，仍由 check_quality 评估
+            quality_check = None
+            if (graded.confidence >= settings.fast_mode_min_confidence
+                    and abs(graded.score - 70) >= settings.fast_mode_score_margin):
+                quality_check = QualityCheckResult(
+                    passed=graded.score >= 70,
+                    score=graded.score,
+                    issues=graded.issues,
+                    suggestions=graded.suggestions
+                )
+
+            return {
+                "answer": answer,
+                "answer_cached": False,
+                "model_name": model,
+                "quality_check": quality_check,
+                "self_graded": quality_check is not None,
+                "score_history": [quality_check.score] if quality_check else [],
+                "messages": [AIMessage(content=answer)],
+                "tokens_used": state.get("tokens_used", 0) + usage.total_tokens,
+                "token_usage": {"generate_graded": usage.model_dump()}
+            }
+
+        except Exception as error:
+            raise Exception(f"生成答案失败: {str(error)}")
+
+    async def generate_candidates(self, state: CardGenerationState) -> Dict[str, Any]:
+        """
+        多候选模式：并发生成多个候选答案并并发质检，选分数最高的一个
+
+        生成和质检共用 best_of_n_latency_budget：生成最多等待一半预算，质检等待剩余时间，
+        超时后只使用已完成的候选（至少等到一个成功）。没有候选完成质检时交给 check_quality。
+        """
+        try:
+            if state.get("answer"):
+                return {}
+
+            cached = await self._cached_answer(state)
+            if cached:
+                return cached
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.best_of_n_latency_budget
+            count = max(1, settings.best_of_n_candidates)
+
+            system_prompt = prompt_loader.get_prompt(Prompts.CARD_GENERATION, Prompts.SYSTEM)
+            user_prompt = prompt_loader.get_prompt(
+                Prompts.CARD_GENERATION,
+                Prompts.GENERATE_ANSWER,
+                question=state['question']
+            )
+            messages = [
+                SystemMessage(content=system_prompt),
+                HumanMessage(content=user_prompt)
+            ]
+
+            generated = await gather_within(
+                [
+                    invoke_llm(self.llm, messages, SamplingProfiles.CANDIDATE_GENERATION, "generate_candidates")
+                    for _ in range(count)
+                ],
+                settings.best_of_n_latency_budget / 2
+            )
+            responses = [
+                item for item in generated
+                if item is not None and not isinstance(item, BaseException) and (item[0].content or "").strip()
+            ]
+            if not responses:
+                errors = [item for item in generated if isinstance(item, BaseException)]
+                raise errors[0] if errors else ValueError("模型没有返回答案")
+
+            generation_usage = TokenUsage()
+            for _, usage in responses:
+                generation_usage.add(usage)
+
+            cards = [
+                AnkiCard(
+                    front=state['question'],
+                    back=response.content.strip(),
+                    tags=state.get('tags', []),
+                    deck_name=state.get('deck_name', 'Default'),
+                    card_type=state.get('card_type', 'basic')
+                )
+                for response, _ in responses
+            ]
+            graded = await gather_within([self._grade_card(card) for card in cards], deadline - loop.time())
+
+            grading_usage = TokenUsage()
+            candidates = []
+            for index, ((response, _), item) in enumerate(zip(responses, graded)):
+                quality_check = None
+                if item is not None and not isinstance(item, BaseException):
+                    quality_check, usage = item
+                    if usage is not None:
+                        grading_usage.add(usage)
+                candidates.append({
+                    "index": index,
+                    "response": response,
+                    "quality_check": quality_check
+                })
+
+            # 分数最高的候选；都没有完成质检时取第一个，由 check_quality 评估
+            scored = [candidate for candidate in candidates if candidate["quality_check"] is not None]
+            best = max(scored, key=lambda candidate: candidate["quality_check"].score) if scored else candidates[0]
+
+            response = best["response"]
+            answer = response.content.strip()
+            model = served_model(response)
+            await answer_cache.set(state['question'], model, answer, generation_usage.total_tokens)
+
+            token_usage = {"generate_candidates": generation_usage.model_dump()}
+            if grading_usage.calls:
+                token_usage["check_quality"] = grading_usage.model_dump()
+
+            return {
+                "answer": answer,
+                "answer_cached": False,
+                "model_name": model,
+                "quality_check": best["quality_check"],
+                "candidates": [
+                    {
+                        "score": candidate["quality_check"].score if candidate["quality_check"] else None,
+                        "selected": candidate is best
+                    }
+                    for candidate in candidates
+                ],
+                "messages": [AIMessage(content=answer)],
+                "tokens_used": (
+                    state.get("tokens_used", 0) + generation_usage.total_tokens + grading_usage.total_tokens
+                ),
+                "token_usage": token_usage
             }
 
         except Exception as error:
             raise Exception(f"生成答案失败: {str(error)}")
 
+    async def _cached_answer(self, state: CardGenerationState) -> Optional[Dict[str, Any]]:
+        """命中答案缓存时返回状态更新"""
+        if not state.get("use_cache", True):
+            return None
+
+        cached = await answer_cache.get(state['question'], settings.zhipu_model)
+        if not cached:
+            return None
+        return {
+            "answer": cached.answer,
+            "answer_cached": True,
+            "model_name": settings.zhipu_model,
+            "semantic_match": {
+                "matched_question": cached.matched_question,
+                "similarity": cached.similarity
+            } if cached.semantic else None,
+            "messages": [AIMessage(content=cached.answer)]
+        }
+
+    async def route_generation(self, state: CardGenerationState) -> str:
+        """按请求的模式选择生成节点"""
+        mode = state.get("mode")
+        if mode == "fast":
+            return "generate_graded"
+        if mode == "best_of_n":
+            return "generate_candidates"
+        return "generate_answer"
+
+    async def route_quality(self, state: CardGenerationState) -> str:
+        """卡片创建后：已有可信的自评时跳过 check_quality，多候选模式已质检时直接结束"""
+        if state.get("mode") == "best_of_n" and state.get("quality_check"):
+            return "create_final"
+        if state.get("self_graded") and state.get("quality_check"):
+            return await self.should_improve(state)
+        return "check_quality"
+
     async def create_card(self, state: CardGenerationState) -> Dict[str, Any]:
         """创建卡片节点"""
         try:
@@ -70,51 +332,82 @@ class CardGenerationNodes:
     async def check_quality(self, state: CardGenerationState) -> Dict[str, Any]:
         """质量检查节点"""
         try:
-            card = state['card']
-
-            # 使用动态加载的 prompts
-            system_prompt = prompt_loader.get_prompt(Prompts.QUALITY_CHECK, Prompts.SYSTEM)
-            user_prompt = prompt_loader.get_prompt(
-                Prompts.QUALITY_CHECK,
-                Prompts.CHECK_QUALITY,
-                front=card.front,
-                back=card.back
-            )
-
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ]
-
-            # 降低温度以获得更稳定的评估
-            self.llm.temperature = 0.3
-            response = await self.llm.ainvoke(messages)
-            self.llm.temperature = 0.7
-
-            quality_result = self._parse_quality_response(response.content)
+            quality_result, usage = await self._grade_card(state['card'])
+            score_history = (state.get("score_history") or []) + [quality_result.score]
+            if usage is None:
+                return {"quality_check": quality_result, "score_history": score_history}
 
             return {
                 "quality_check": quality_result,
-                "tokens_used": state.get("tokens_used", 0) + 150  # 估算
+                "score_history": score_history,
+                "tokens_used": state.get("tokens_used", 0) + usage.total_tokens,
+                "token_usage": {"check_quality": usage.model_dump()}
             }
 
         except Exception as error:
             raise Exception(f"质量检查失败: {str(error)}")
 
+    async def _grade_card(self, card: AnkiCard) -> Tuple[QualityCheckResult, Optional[TokenUsage]]:
+        """评估卡片质量：依次使用缓存、预评分和LLM质检，未调用LLM（或复用了进行中的相同质检）时用量为 None"""
+        cached = quality_cache.get(card, settings.zhipu_model)
+        if cached:
+            return cached, None
+
+        prescored = quality_prescorer.check(card)
+        if prescored:
+            return prescored, None
+
+        # 使用动态加载的 prompts
+        system_prompt = prompt_loader.get_prompt(Prompts.QUALITY_CHECK, Prompts.SYSTEM)
+        user_prompt = prompt_loader.get_prompt(
+            Prompts.QUALITY_CHECK,
+            Prompts.CHECK_QUALITY,
+            front=card.front,
+            back=card.back
+        )
+
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+
+        # 与旧接口 AIService.quality_check 共用合并键，结果形状必须一致：(质检结果, 用量)
+        async def grade():
+            response, usage = await invoke_llm(
+                self.llm, messages, SamplingProfiles.GRADING, "check_quality"
+            )
+            quality_result = self._parse_quality_response(response.content)
+            quality_cache.set(card, served_model(response), quality_result)
+            return quality_result, usage
+
+        (quality_result, usage), shared = await shared_call(
+            "check_quality", quality_cache.make_key(card, settings.zhipu_model), grade
+        )
+        if shared:
+            return quality_result.model_copy(deep=True), None
+        return quality_result, usage
+
     async def should_improve(self, state: CardGenerationState) -> str:
         """判断是否需要改进的条件节点"""
         quality_check = state.get('quality_check')
         if not quality_check:
             return "create_final"
 
-        # 如果质量分数低于70分且改进次数未达到上限，则改进
-        if (quality_check.score < 70 and
-            state.get('improvement_count', 0) < state.get('max_improvements', 2)):
+        # 多候选模式用并发候选代替串行改进
+        if state.get("mode") == "best_of_n":
+            return "create_final"
+
+        # 质量分数低于70分、改进次数未达到上限且上一轮改进有效果时，继续改进
+        if stop_reason(state) is None:
             return "improve"
 
         # 否则创建最终结果
         return "create_final"
 
+    async def route_improvement(self, state: CardGenerationState) -> str:
+        """改进后：卡片没有变化时跳过重新质检"""
+        return "create_final" if state.get("card_unchanged") else "check_quality"
+
     async def improve_card(self, state: CardGenerationState) -> Dict[str, Any]:
         """改进卡片节点"""
         try:
@@ -138,18 +431,14 @@ class CardGenerationNodes:
                 suggestions=suggestions_text
             )
 
-            # 使用较低的温度值以获得更稳定的改进结果
-            self.llm.temperature = 0.3
-
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
 
-            response = await self.llm.ainvoke(messages)
-
-            # 恢复温度值
-            self.llm.temperature = 0.7
+            response, usage = await invoke_llm(
+                self.llm, messages, SamplingProfiles.IMPROVEMENT, "improve_card"
+            )
 
             # 解析改进结果
             improved_front, improved_back = self._parse_improvement_response(response.content, card)
@@ -164,11 +453,17 @@ class CardGenerationNodes:
                 card_type=card.card_type
             )
 
+            # 回复无法解析或内容完全相同时保留原卡片和原质量检查结果
+            unchanged = same_text(card, improved_card)
+
             return {
-                "card": improved_card,
+                "card": card if unchanged else improved_card,
                 "improvement_count": improvement_count,
+                "card_unchanged": unchanged,
+                "self_graded": state.get("self_graded", False) if unchanged else False,  # 改进后的卡片由 check_quality 重新评估
                 "messages": [AIMessage(content=f"卡片改进 (第{improvement_count}次): {response.content}")],
-                "tokens_used": state.get("tokens_used", 0) + 200  # 估算
+                "tokens_used": state.get("tokens_used", 0) + usage.total_tokens,
+                "token_usage": {"improve_card": usage.model_dump()}
             }
 
         except Exception as error:
@@ -176,11 +471,26 @@ class CardGenerationNodes:
 
     async def create_final(self, state: CardGenerationState) -> Dict[str, Any]:
         """创建最终结果节点"""
+        improvement = None
+        if state.get("mode") != "best_of_n" and state.get("quality_check") is not None:
+            improvement = summarize(state)
+            improvement_metrics.record(improvement)
+
         return {
             "final_card": state.get('card'),
-            "final_quality_check": state.get('quality_check')
+            "final_quality_check": state.get('quality_check'),
+            "improvement": improvement
         }
 
+    def _parse_graded_response(self, response: str) -> Optional[SelfGradedAnswer]:
+        """解析快速模式的JSON回复（JSON模式），不是完整的JSON或答案为空时返回 None"""
+        try:
+            graded = SelfGradedAnswer.model_validate_json((response or "").strip())
+        except ValidationError as error:
+            print(f"Error parsing graded response: {error}")
+            return None
+        return graded if graded.answer.strip() else None
+
     def _parse_quality_response(self, response: str) -> QualityCheckResult:
         """解析质量检查回复"""
         try:
@@ -224,6 +534,7 @@ class CardGenerationNodes:
 
         except Exception as error:
             print(f"Error parsing quality check response: {error}")
+            mark_degraded(f"unparseable quality check response: {error}")
             return QualityCheckResult(
                 passed=False,
                 score=0,
@@ -258,74 +569,111 @@ class BatchGenerationNodes:
 
     def __init__(self):
         self.card_nodes = CardGenerationNodes()
+        self.packer = PackedAnswerGenerator()
+        self._card_graph = None
 
     async def process_batch(self, state: BatchGenerationState) -> Dict[str, Any]:
-        """处理批量生成"""
-        from langgraph.graph import StateGraph
-
+        """处理批量生成，单卡子图以有界并发执行"""
         questions = state['questions']
-        settings = state.get('settings') or {}
+        batch_settings = state.get('settings') or {}
         cards = []
         errors = []
         total_tokens = 0
+        token_usage = {}
 
         # 处理settings对象
-        if hasattr(settings, 'tags'):
-            tags = settings.tags or []
-            deck_name = settings.deck_name or "Default"
-            card_type = settings.card_type or "basic"
+        if hasattr(batch_settings, 'tags'):
+            tags = batch_settings.tags or []
+            deck_name = batch_settings.deck_name or "Default"
+            card_type = batch_settings.card_type or "basic"
+            use_cache = batch_settings.use_cache is not False
+            pack_size = batch_settings.pack_size
         else:
-            tags = settings.get("tags", [])
-            deck_name = settings.get("deck_name", "Default")
-            card_type = settings.get("card_type", "basic")
-
-        # 创建子图来处理单个卡片
-        card_graph = self._create_card_graph()
-
-        for i, question in enumerate(questions):
-            try:
-                # 初始化状态
-                from .states import CardGenerationState
-                initial_state = CardGenerationState(
-                    question=question,
-                    tags=tags,
-                    deck_name=deck_name,
-                    card_type=card_type,
-                    improvement_count=0,
-                    max_improvements=2,
-                    tokens_used=0,
-                    model_name="gpt-3.5-turbo",
-                    messages=[],
-                    answer=None,
-                    card=None,
-                    quality_check=None,
-                    final_card=None,
-                    final_quality_check=None
-                )
+            tags = batch_settings.get("tags", [])
+            deck_name = batch_settings.get("deck_name", "Default")
+            card_type = batch_settings.get("card_type", "basic")
+            use_cache = batch_settings.get("use_cache", True) is not False
+            pack_size = batch_settings.get("pack_size")
+
+        # 批次内的重复问题只生成一次，结果按原始顺序展开
+        unique_questions, positions = collapse(questions, normalize_question)
+        singleflight.record_collapsed("batch", len(questions) - len(unique_questions))
+
+        # 打包生成答案，解析失败的条目在子图中逐个生成
+        pack_size = resolve_pack_size(pack_size)
+        answers = [None] * len(unique_questions)
+        if pack_size > 1:
+            answers, pack_usage = await self.packer.generate(unique_questions, pack_size, use_cache)
+            if pack_usage.calls:
+                total_tokens += pack_usage.total_tokens
+                token_usage = merge_token_usage(token_usage, {"generate_batch": pack_usage.model_dump()})
+
+        card_graph = self.compile()
+
+        async def run_card(index: int, question: str) -> Dict[str, Any]:
+            initial_state = CardGenerationState(
+                question=question,
+                tags=tags,
+                deck_name=deck_name,
+                card_type=card_type,
+                use_cache=use_cache,
+                answer_cached=False,
+                improvement_count=0,
+                max_improvements=2,
+                tokens_used=0,
+                token_usage={},
+                model_name=settings.zhipu_model,
+                messages=[],
+                answer=answers[index],
+                card=None,
+                quality_check=None,
+                final_card=None,
+                final_quality_check=None
+            )
 
-                # 运行卡片生成工作流
-                result = await card_graph.ainvoke(initial_state)
+            # 运行卡片生成工作流
+            return await card_graph.ainvoke(initial_state)
 
-                if result.get('final_card') and result.get('final_quality_check'):
-                    cards.append({
-                        "card": result['final_card'].model_dump(),
-                        "quality_check": result['final_quality_check'].model_dump()
-                    })
-                    total_tokens += result.get('tokens_used', 0)
+        # 滑动窗口并发执行，单个问题失败不影响其他问题，结果保持原始顺序
+        unique_results = await run_bounded(unique_questions, run_card, settings.batch_concurrency)
+        results = expand(unique_results, positions)
+        counted = set()
 
-            except Exception as error:
+        for i, (question, result) in enumerate(zip(questions, results)):
+            if isinstance(result, Exception):
                 errors.append({
                     "index": i,
                     "question": question,
-                    "error": str(error)
+                    "error": str(result)
+                })
+            elif result.get('final_card') and result.get('final_quality_check'):
+                card = result['final_card']
+                if card.front == unique_questions[positions[i]]:
+                    # 重复问题保留各自的原始写法
+                    card = card.model_copy(update={"front": question})
+                cards.append({
+                    "card": card.model_dump(),
+                    "quality_check": result['final_quality_check'].model_dump()
                 })
+                # 重复问题的用量只计一次
+                if positions[i] not in counted:
+                    counted.add(positions[i])
+                    total_tokens += result.get('tokens_used', 0)
+                    token_usage = merge_token_usage(token_usage, result.get('token_usage'))
 
         return {
             "cards": cards,
             "errors": errors,
-            "tokens_used": total_tokens
+            "tokens_used": total_tokens,
+            "token_usage": token_usage
         }
 
+    def compile(self):
+        """编译单个卡片生成的子图（只编译一次）"""
+        if self._card_graph is None:
+            self._card_graph = self._create_card_graph()
+        return self._card_graph
+
     def _create_card_graph(self):
         """创建单个卡片生成的子图"""
         from langgraph.graph import StateGraph
@@ -354,7 +702,15 @@ class BatchGenerationNodes:
             }
         )
 
-        workflow.add_edge("improve", "check_quality")  # 改进后重新检查质量
+        # 改进后重新检查质量，卡片没有变化时直接结束
+        workflow.add_conditional_edges(
+            "improve",
+            self.card_nodes.route_improvement,
+            {
+                "check_quality": "check_quality",
+                "create_final": "create_final"
+            }
+        )
         workflow.add_edge("create_final", END)
 
         return workflow.compile()
\ No newline at end of file
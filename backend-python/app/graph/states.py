@@ -1,7 +1,8 @@
-from typing import TypedDict, List, Optional, Annotated
+from typing import TypedDict, List, Optional, Annotated, Dict
 from langgraph.graph import add_messages
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 from ..schemas.card import AnkiCard, QualityCheckResult
+from ..core.usage import merge_token_usage
 
 
 class CardGenerationState(TypedDict):
@@ -13,15 +14,24 @@ class CardGenerationState(TypedDict):
     tags: List[str]
     deck_name: str
     card_type: str
+    use_cache: bool
+    mode: str  # standard、fast 或 best_of_n
 
     # 中间结果
     answer: Optional[str]
+    answer_cached: bool
+    semantic_match: Optional[dict]
     card: Optional[AnkiCard]
     quality_check: Optional[QualityCheckResult]
+    self_graded: bool  # quality_check 是否来自快速模式的自评
+    candidates: Optional[List[dict]]  # 多候选模式各候选的评分
 
     # 改进相关
     improvement_count: int
     max_improvements: int
+    score_history: List[int]  # 每次质量检查的分数
+    card_unchanged: bool  # 最近一轮改进是否没有改变卡片
+    improvement: Optional[dict]  # 改进循环摘要：停止原因、轮数、省下的轮数
 
     # 最终结果
     final_card: Optional[AnkiCard]
@@ -29,6 +39,7 @@ class CardGenerationState(TypedDict):
 
     # 元数据
     tokens_used: int
+    token_usage: Annotated[Dict[str, dict], merge_token_usage]  # 按节点统计的真实token用量
     model_name: str
 
 
@@ -46,4 +57,5 @@ class BatchGenerationState(TypedDict):
     total_count: int
 
     # 元数据
-    tokens_used: int
\ No newline at end of file
+    tokens_used: int
+    token_usage: Dict[str, dict]
@@ -1,9 +1,12 @@
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
-from typing import Dict, Any
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.graph.state import CompiledStateGraph
+from typing import Dict, Any, Optional
+from uuid import uuid4
 
 from .states import CardGenerationState, BatchGenerationState
 from .nodes import CardGenerationNodes, BatchGenerationNodes
+from .checkpoint import checkpoint_manager
 
 
 class CardGenerationWorkflow:
@@ -12,7 +15,12 @@ class CardGenerationWorkflow:
     def __init__(self):
         self.nodes = CardGenerationNodes()
         self.workflow = self._create_workflow()
-        self.memory = MemorySaver()
+        self._compiled: Dict[Optional[int], CompiledStateGraph] = {}
+
+    @property
+    def memory(self) -> BaseCheckpointSaver:
+        """当前配置的检查点存储"""
+        return checkpoint_manager.saver
 
     def _create_workflow(self) -> StateGraph:
         """创建工作流图"""
@@ -20,15 +28,37 @@ class CardGenerationWorkflow:
 
         # 添加节点
         workflow.add_node("generate_answer", self.nodes.generate_answer)
+        workflow.add_node("generate_graded", self.nodes.generate_graded)
+        workflow.add_node("generate_candidates", self.nodes.generate_candidates)
         workflow.add_node("create_card", self.nodes.create_card)
         workflow.add_node("check_quality", self.nodes.check_quality)
         workflow.add_node("improve", self.nodes.improve_card)
         workflow.add_node("create_final", self.nodes.create_final)
 
         # 添加边
-        workflow.add_edge(START, "generate_answer")
+        workflow.add_conditional_edges(
+            START,
+            self.nodes.route_generation,
+            {
+                "generate_answer": "generate_answer",
+                "generate_graded": "generate_graded",
+                "generate_candidates": "generate_candidates"
+            }
+        )
         workflow.add_edge("generate_answer", "create_card")
-        workflow.add_edge("create_card", "check_quality")
+        workflow.add_edge("generate_graded", "create_card")
+        workflow.add_edge("generate_candidates", "create_card")
+
+        # 快速模式的自评可信或多候选模式已质检时跳过质量检查
+        workflow.add_conditional_edges(
+            "create_card",
+            self.nodes.route_quality,
+            {
+                "check_quality": "check_quality",
+                "improve": "improve",
+                "create_final": "create_final"
+            }
+        )
 
         # 添加条件边
         workflow.add_conditional_edges(
@@ -40,27 +70,52 @@ class CardGenerationWorkflow:
             }
         )
 
-        workflow.add_edge("improve", "check_quality")  # 改进后重新检查质量
+        # 改进后重新检查质量，卡片没有变化时直接结束
+        workflow.add_conditional_edges(
+            "improve",
+            self.nodes.route_improvement,
+            {
+                "check_quality": "check_quality",
+                "create_final": "create_final"
+            }
+        )
         workflow.add_edge("create_final", END)
 
         return workflow
 
-    def compile(self, use_memory: bool = False):
-        """编译工作流"""
-        if use_memory:
-            return self.workflow.compile(checkpointer=self.memory)
-        return self.workflow.compile()
-
-    async def run(self, initial_state: CardGenerationState, use_memory: bool = False):
-        """运行工作流"""
+    def compile(self, use_memory: bool = False) -> CompiledStateGraph:
+        """编译工作流，按使用的检查点存储分别缓存编译结果"""
+        checkpointer = self.memory if use_memory else None
+        key = id(checkpointer) if checkpointer is not None else None
+        if key not in self._compiled:
+            self._compiled[key] = self.workflow.compile(checkpointer=checkpointer)
+        return self._compiled[key]
+
+    async def run(self, initial_state: CardGenerationState, use_memory: bool = False, thread_id: Optional[str] = None):
+        """
+        运行工作流
+
+        使用检查点时，如果该 thread 已有同一问题的检查点：未执行完的从最后完成的节点继续，
+        已执行完的直接返回保存的结果，不重复调用模型。
+        """
         app = self.compile(use_memory=use_memory)
-        if use_memory:
-            from langgraph.types import RunnableConfig
-            config = RunnableConfig(configurable={"thread_id": "card-generation"})
-            result = await app.ainvoke(initial_state, config=config)
-        else:
-            result = await app.ainvoke(initial_state)
-        return result
+        if not use_memory:
+            return await app.ainvoke(initial_state)
+
+        from langgraph.types import RunnableConfig
+        config = RunnableConfig(configurable={"thread_id": thread_id or uuid4().hex})
+
+        snapshot = await app.aget_state(config)
+        if snapshot.values:
+            if snapshot.values.get("question") == initial_state.get("question"):
+                if snapshot.values.get("final_card") is not None:
+                    return snapshot.values
+                return await app.ainvoke(None, config=config, durability="sync")
+            # thread 被复用于其他问题，丢弃旧的检查点
+            await self.memory.adelete_thread(config["configurable"]["thread_id"])
+
+        # 每个节点完成后同步写入检查点，进程中途退出时已完成的节点不会丢失
+        return await app.ainvoke(initial_state, config=config, durability="sync")
 
 
 class BatchGenerationWorkflow:
@@ -69,6 +124,7 @@ class BatchGenerationWorkflow:
     def __init__(self):
         self.nodes = BatchGenerationNodes()
         self.workflow = self._create_workflow()
+        self._compiled: Optional[CompiledStateGraph] = None
 
     def _create_workflow(self) -> StateGraph:
         """创建批量生成工作流"""
@@ -83,9 +139,12 @@ class BatchGenerationWorkflow:
 
         return workflow
 
-    def compile(self):
-        """编译工作流"""
-        return self.workflow.compile()
+    def compile(self) -> CompiledStateGraph:
+        """编译工作流和单卡子图（只编译一次）"""
+        if self._compiled is None:
+            self.nodes.compile()
+            self._compiled = self.workflow.compile()
+        return self._compiled
 
     async def run(self, initial_state: BatchGenerationState):
         """运行批量生成工作流"""
@@ -105,6 +164,7 @@ class QualityCheckWorkflow:
         state = CardGenerationState(
             card=card,
             tokens_used=0,
+            token_usage={},
             messages=[],
             question="",
             tags=[],
@@ -128,6 +188,7 @@ class ImprovementWorkflow:
     def __init__(self):
         self.nodes = CardGenerationNodes()
         self.workflow = self._create_improvement_workflow()
+        self._compiled: Optional[CompiledStateGraph] = None
 
     def _create_improvement_workflow(self) -> StateGraph:
         """创建改进工作流"""
@@ -144,9 +205,11 @@ class ImprovementWorkflow:
 
         return workflow
 
-    def compile(self):
-        """编译工作流"""
-        return self.workflow.compile()
+    def compile(self) -> CompiledStateGraph:
+        """编译工作流（只编译一次）"""
+        if self._compiled is None:
+            self._compiled = self.workflow.compile()
+        return self._compiled
 
     async def run_improvement(self, card, issues: list, suggestions: list):
         """运行改进工作流"""
@@ -165,7 +228,8 @@ class ImprovementWorkflow:
             "quality_check": temp_quality,
             "improvement_count": 0,
             "max_improvements": 1,
-            "tokens_used": 0
+            "tokens_used": 0,
+            "token_usage": {}
         }
 
         app = self.compile()
@@ -174,5 +238,6 @@ class ImprovementWorkflow:
         return {
             "improved_card": result.get("card"),
             "quality_check": result.get("quality_check"),
-            "tokens_used": result.get("tokens_used", 0)
+            "tokens_used": result.get("tokens_used", 0),
+            "token_usage": result.get("token_usage", {})
         }
\ No newline at end of file
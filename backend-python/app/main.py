@@ -5,6 +5,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from .api.v1.api import api_router
 from .core.config import settings
 from .core.database import init_db
+from .core.llm import llm_registry
+from .graph.checkpoint import checkpoint_manager
+from .services.answer_cache import answer_cache
+from .services.idempotency import idempotency_store
+from .services.job_service import job_service
+from .services.langgraph_service import langgraph_service
+from .services.semantic_cache import semantic_cache
 
 
 @asynccontextmanager
@@ -19,10 +26,36 @@ async def lifespan(app: FastAPI):
     await init_db()
     print("Database initialized successfully")
 
+    # 清理过期的答案缓存
+    pruned = await answer_cache.prune()
+    if pruned:
+        print(f"Pruned {pruned} stale answer cache entries")
+
+    # 清理过期的幂等键记录
+    pruned = await idempotency_store.prune()
+    if pruned:
+        print(f"Pruned {pruned} expired idempotency records")
+
+    # 打开工作流检查点存储（需在编译工作流之前）
+    await checkpoint_manager.open()
+    print(f"Workflow checkpoints: {checkpoint_manager.backend}")
+
+    # 预先编译LangGraph工作流
+    langgraph_service.warmup()
+
+    # 恢复未完成的批量任务
+    resumed = await job_service.resume()
+    if resumed:
+        print(f"Resumed {resumed} unfinished generation jobs")
+
     yield
 
     # 关闭时
     print("Application is shutting down...")
+    await job_service.shutdown()
+    await checkpoint_manager.close()
+    semantic_cache.save()
+    await llm_registry.aclose()
 
 
 # 创建FastAPI应用
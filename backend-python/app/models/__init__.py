@@ -1,4 +1,7 @@
 """Models module"""
 from .card import Card, GenerationHistory
+from .cache import AnswerCacheEntry
+from .idempotency import IdempotencyRecord
+from .job import GenerationJob, GenerationJobItem
 
-__all__ = ["Card", "GenerationHistory"]
\ No newline at end of file
+__all__ = ["Card", "GenerationHistory", "AnswerCacheEntry", "IdempotencyRecord", "GenerationJob", "GenerationJobItem"]
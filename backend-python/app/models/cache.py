@@ -0,0 +1,22 @@
+"""
+缓存数据模型
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class AnswerCacheEntry(Base):
+    """答案缓存表"""
+    __tablename__ = "answer_cache"
+
+    key = Column(String(64), primary_key=True, comment="缓存键（问题+模型+提示词版本的哈希）")
+    question = Column(Text, nullable=False, comment="规范化后的问题")
+    model = Column(String(100), nullable=False, comment="模型名称")
+    prompt_version = Column(String(32), nullable=False, index=True, comment="提示词模板哈希")
+    answer = Column(Text, nullable=False, comment="生成的答案")
+    tokens_used = Column(Integer, nullable=False, default=0, comment="生成时消耗的token数")
+    created_at = Column(DateTime, server_default=func.now(), comment="创建时间")
+
+    def __repr__(self):
+        return f"<AnswerCacheEntry(key={self.key[:8]}, model={self.model})>"
@@ -0,0 +1,21 @@
+"""
+幂等键数据模型
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class IdempotencyRecord(Base):
+    """已完成请求的响应，按幂等键重放"""
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String(64), primary_key=True, comment="接口+幂等键的哈希")
+    scope = Column(String(100), nullable=False, comment="接口")
+    fingerprint = Column(String(64), nullable=False, comment="请求体哈希，同一幂等键不能用于不同的请求")
+    status_code = Column(Integer, nullable=False, default=200, comment="响应状态码")
+    response = Column(Text, nullable=False, comment="响应JSON")
+    created_at = Column(DateTime, server_default=func.now(), index=True, comment="创建时间")
+
+    def __repr__(self):
+        return f"<IdempotencyRecord(key={self.key[:8]}, scope={self.scope})>"
@@ -0,0 +1,55 @@
+"""
+批量生成任务数据模型
+"""
+import json
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+
+class GenerationJob(Base):
+    """批量生成任务表"""
+    __tablename__ = "generation_jobs"
+
+    id = Column(String(32), primary_key=True, comment="任务ID")
+    status = Column(String(20), nullable=False, default="pending", index=True,
+                    comment="状态：pending/running/completed/cancelled/failed")
+    _settings = Column("settings", Text, nullable=False, default="{}", comment="生成设置JSON")
+    total = Column(Integer, nullable=False, default=0, comment="问题总数")
+    error = Column(Text, nullable=True, comment="任务级错误信息")
+    created_at = Column(DateTime, server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), comment="更新时间")
+    finished_at = Column(DateTime, nullable=True, comment="结束时间")
+
+    @property
+    def settings(self) -> dict:
+        """获取生成设置"""
+        return json.loads(self._settings or "{}")
+
+    @settings.setter
+    def settings(self, value: dict):
+        """设置生成设置"""
+        self._settings = json.dumps(value or {}, ensure_ascii=False)
+
+    def __repr__(self):
+        return f"<GenerationJob(id={self.id}, status={self.status}, total={self.total})>"
+
+
+class GenerationJobItem(Base):
+    """批量生成任务条目表"""
+    __tablename__ = "generation_job_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String(32), ForeignKey("generation_jobs.id", ondelete="CASCADE"), nullable=False, index=True,
+                    comment="所属任务ID")
+    position = Column(Integer, nullable=False, comment="问题在任务中的序号")
+    question = Column(Text, nullable=False, comment="问题")
+    status = Column(String(20), nullable=False, default="pending", index=True,
+                    comment="状态：pending/running/done/failed/cancelled")
+    result = Column(Text, nullable=True, comment="生成结果JSON（卡片和质量检查）")
+    error = Column(Text, nullable=True, comment="错误信息")
+    tokens_used = Column(Integer, nullable=False, default=0, comment="消耗的token数")
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), comment="更新时间")
+
+    def __repr__(self):
+        return f"<GenerationJobItem(job={self.job_id}, position={self.position}, status={self.status})>"
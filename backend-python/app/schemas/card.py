@@ -35,6 +35,8 @@ class BatchSettings(BaseModel):
     deck_name: Optional[str] = "Default"
     tags: Optional[List[str]] = []
     card_type: Optional[str] = "basic"
+    use_cache: Optional[bool] = True  # 设为False时跳过答案缓存
+    pack_size: Optional[int] = Field(None, ge=1, description="每次LLM调用打包的问题数，默认使用服务端配置")
 
 
 class CardGenerationRequest(BaseModel):
@@ -44,6 +46,12 @@ class CardGenerationRequest(BaseModel):
     tags: Optional[List[str]] = []
     deck_name: Optional[str] = "Default"
     llm_provider: Optional[Literal['openai', 'claude', 'zhipu']] = 'zhipu'
+    use_cache: Optional[bool] = True  # 设为False时跳过答案缓存
+    thread_id: Optional[str] = Field(None, max_length=128, description="工作流检查点ID，使用相同ID重试时从上次中断的节点继续")
+    mode: Literal['standard', 'fast', 'best_of_n'] = Field(
+        'standard',
+        description="LangGraph 工作流模式：fast 为一次调用生成答案并自评，best_of_n 为并发生成多个候选并选最好的一个"
+    )
 
 
 class QualityCheckResult(BaseModel):
@@ -62,6 +70,9 @@ class LLMResponse(BaseModel):
     error: Optional[str] = None
     tokens_used: Optional[int] = None
     model: Optional[str] = None
+    cached: Optional[bool] = False
+    matched_question: Optional[str] = None  # 语义缓存命中时匹配到的问题
+    similarity: Optional[float] = None
 
 
 class ApiResponse(BaseModel, Generic[T]):
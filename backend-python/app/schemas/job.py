@@ -0,0 +1,42 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Literal
+from datetime import datetime
+
+from .card import BatchSettings
+
+JobState = Literal['pending', 'running', 'completed', 'cancelled', 'failed']
+JobItemState = Literal['pending', 'running', 'done', 'failed', 'cancelled']
+
+
+class JobCreateRequest(BaseModel):
+    """创建批量生成任务请求"""
+    questions: List[str] = Field(..., min_length=1, description="问题列表")
+    settings: Optional[BatchSettings] = None
+
+
+class JobItemResult(BaseModel):
+    """任务条目结果"""
+    index: int
+    question: str
+    status: JobItemState
+    card: Optional[Dict[str, Any]] = None
+    quality_check: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    tokens_used: int = 0
+
+
+class JobStatus(BaseModel):
+    """任务状态与进度"""
+    id: str
+    status: JobState
+    total: int
+    completed: int
+    failed: int
+    pending: int
+    progress: float = Field(..., description="已处理比例（0-1）")
+    tokens_used: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    items: Optional[List[JobItemResult]] = None
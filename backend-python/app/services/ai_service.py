@@ -1,30 +1,18 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
 import json
 import re
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.callbacks import BaseCallbackHandler
 
 from ..core.config import settings
+from ..core.llm import llm_registry, SamplingProfiles, invoke_llm, served_model, stream_llm
+from ..core.usage import record_usage
+from ..core.prompt_loader import prompt_loader
+from ..core.prompts import Prompts
 from ..schemas.card import AnkiCard, QualityCheckResult, LLMResponse
-
-
-class TokenUsageHandler(BaseCallbackHandler):
-    """Token使用量跟踪器"""
-    def __init__(self):
-        self.tokens_used = 0
-        self.model_name = None
-
-    def on_llm_end(self, response: Any, **kwargs: Any) -> Any:
-        """LLM结束时调用"""
-        if hasattr(response, 'llm_output') and response.llm_output:
-            usage = response.llm_output.get('token_usage', {})
-            self.tokens_used = usage.get('total_tokens', 0)
-
-        if hasattr(response, 'generations') and response.generations:
-            gen = response.generations[0][0] if response.generations[0] else None
-            if gen and hasattr(gen, 'generation_info'):
-                self.model_name = gen.generation_info.get('model_name')
+from .answer_cache import answer_cache
+from .idempotency import mark_degraded, shared_call
+from .quality_cache import quality_cache
+from .prescorer import quality_prescorer
 
 
 class AIService:
@@ -32,66 +20,64 @@ class AIService:
 
     def __init__(self):
         """初始化AI服务"""
-        self.llm = ChatOpenAI(
-            model=settings.zhipu_model,
-            openai_api_key=settings.zhipu_api_key,
-            openai_api_base=settings.zhipu_base_url,
-            temperature=0.7,
-            max_tokens=800,
-            callbacks=[TokenUsageHandler()]
-        )
+        self.llm = llm_registry.get_llm()
 
-    async def generate_answer(self, question: str) -> LLMResponse:
+    async def generate_answer(self, question: str, use_cache: bool = True) -> LLMResponse:
         """
         基于问题生成回答
 
         Args:
             question: 问题文本
+            use_cache: 是否使用答案缓存
 
         Returns:
             LLMResponse: 生成的回答
         """
         try:
-            system_prompt = "你是一个专业的学习卡片设计师，擅长创建高质量、易记的Anki卡片。"
-            user_prompt = f"""
-请基于以下问题生成一个高质量的Anki学习卡片回答：
-
-问题：{question}
-
-要求：
-1. 回答要准确、简洁明了
-2. 适合记忆和理解
-3. 重点突出关键概念
-4. 可以适当举例说明
-5. 长度控制在100-300字之间
-
-请直接给出回答内容，不要包含其他格式说明。
-"""
+            if use_cache:
+                cached = await answer_cache.get(question, settings.zhipu_model)
+                if cached:
+                    return LLMResponse(
+                        success=True,
+                        answer=cached.answer,
+                        tokens_used=0,
+                        model=settings.zhipu_model,
+                        cached=True,
+                        matched_question=cached.matched_question,
+                        similarity=cached.similarity
+                    )
+
+            system_prompt = prompt_loader.get_prompt(Prompts.CARD_GENERATION, Prompts.SYSTEM)
+            user_prompt = prompt_loader.get_prompt(
+                Prompts.CARD_GENERATION,
+                Prompts.GENERATE_ANSWER,
+                question=question
+            )
 
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
 
-            response = await self.llm.ainvoke(messages)
-
-            # 获取token使用量
-            tokens_used = 0
-            model = settings.zhipu_model
+            async def generate():
+                response, usage = await invoke_llm(
+                    self.llm, messages, SamplingProfiles.GENERATION, "generate_answer"
+                )
+                await answer_cache.set(question, served_model(response), response.content, usage.total_tokens)
+                return response, usage
 
-            if hasattr(self.llm, 'callbacks') and self.llm.callbacks:
-                for callback in self.llm.callbacks:
-                    if isinstance(callback, TokenUsageHandler):
-                        tokens_used = callback.tokens_used
-                        if callback.model_name:
-                            model = callback.model_name
-                        break
+            # 同一问题正在生成时等待它的结果；跳过缓存的请求需要新的答案，不合并
+            if use_cache:
+                key = answer_cache.make_key(question, settings.zhipu_model, answer_cache.prompt_version())
+                (response, usage), shared = await shared_call("generate_answer", key, generate)
+            else:
+                (response, usage), shared = await generate(), False
 
             return LLMResponse(
                 success=True,
                 answer=response.content,
-                tokens_used=tokens_used,
-                model=model
+                tokens_used=0 if shared else usage.total_tokens,
+                model=served_model(response)
             )
 
         except Exception as error:
@@ -101,6 +87,47 @@ class AIService:
                 error=str(error)
             )
 
+    async def stream_answer(self, question: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """
+        流式生成回答，逐段返回模型输出的文本
+
+        Args:
+            question: 问题文本
+            use_cache: 是否使用答案缓存（命中时一次性返回完整答案）
+
+        Yields:
+            str: 回答文本片段
+        """
+        if use_cache:
+            cached = await answer_cache.get(question, settings.zhipu_model)
+            if cached:
+                yield cached.answer
+                return
+
+        system_prompt = prompt_loader.get_prompt(Prompts.CARD_GENERATION, Prompts.SYSTEM)
+        user_prompt = prompt_loader.get_prompt(
+            Prompts.CARD_GENERATION,
+            Prompts.GENERATE_ANSWER,
+            question=question
+        )
+
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+
+        aggregate = None
+        # 超时、重试和备用模型只在输出第一个片段前生效，见 stream_llm
+        async for chunk in stream_llm(self.llm, messages, SamplingProfiles.GENERATION, "generate_answer"):
+            aggregate = chunk if aggregate is None else aggregate + chunk
+            if chunk.content:
+                yield chunk.content
+
+        if aggregate is not None:
+            model = served_model(aggregate)
+            usage = record_usage("generate_answer", aggregate, model=model)
+            await answer_cache.set(question, model, aggregate.content, usage.total_tokens)
+
     async def quality_check(self, card: AnkiCard) -> QualityCheckResult:
         """
         质检Agent：检查生成的卡片质量
@@ -112,52 +139,55 @@ class AIService:
             QualityCheckResult: 质量检查结果
         """
         try:
-            system_prompt = "你是一个专业的Anki卡片质量评估师，擅长评估学习卡片的质量。"
-            user_prompt = f"""
-请对这个Anki学习卡片进行质量评估：
-
-卡片内容：
-正面：{card.front}
-背面：{card.back}
-
-请从以下维度评估（0-100分）：
-1. **准确性** (30分)：内容是否准确无误
-2. **清晰度** (25分)：表达是否清楚易懂
-3. **简洁性** (20分)：内容是否简洁不冗余
-4. **学习价值** (15分)：是否有助于学习和记忆
-5. **完整性** (10分)：信息是否相对完整
-
-请按以下格式回复：
-总分：XX分
-是否通过：是/否（总分≥70分通过）
-存在的问题：
-1. 问题描述
-2. 问题描述
-
-改进建议：
-1. 建议内容
-2. 建议内容
-"""
+            cached = quality_cache.get(card, settings.zhipu_model)
+            if cached:
+                return cached
+
+            prescored = quality_prescorer.check(card)
+            if prescored:
+                return prescored
+
+            system_prompt = prompt_loader.get_prompt(Prompts.QUALITY_CHECK, Prompts.SYSTEM)
+            user_prompt = prompt_loader.get_prompt(
+                Prompts.QUALITY_CHECK,
+                Prompts.CHECK_QUALITY,
+                front=card.front,
+                back=card.back
+            )
 
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
 
-            response = await self.llm.ainvoke(messages)
-
-            if not response.content:
-                return QualityCheckResult(
-                    passed=False,
-                    score=0,
-                    issues=['质量检查失败'],
-                    suggestions=[]
+            # 与 LangGraph 质检节点共用合并键，结果形状必须一致：(质检结果, 用量)
+            async def grade():
+                response, usage = await invoke_llm(
+                    self.llm, messages, SamplingProfiles.GRADING, "check_quality"
                 )
 
-            return self._parse_quality_check_response(response.content)
+                if not response.content:
+                    mark_degraded("empty quality check response")
+                    return QualityCheckResult(
+                        passed=False,
+                        score=0,
+                        issues=['质量检查失败'],
+                        suggestions=[]
+                    ), usage
+
+                quality_result = self._parse_quality_check_response(response.content)
+                quality_cache.set(card, served_model(response), quality_result)
+                return quality_result, usage
+
+            # 相同卡片正在质检时等待它的结果
+            (quality_result, _), _ = await shared_call(
+                "check_quality", quality_cache.make_key(card, settings.zhipu_model), grade
+            )
+            return quality_result.model_copy(deep=True)
 
         except Exception as error:
             print(f"Error in quality check: {error}")
+            mark_degraded(f"quality check failed: {error}")
             return QualityCheckResult(
                 passed=False,
                 score=0,
@@ -204,26 +234,24 @@ class AIService:
 改进说明：[简要说明改进点]
 """
 
-            # 使用较低的温度值以获得更稳定的改进结果
-            self.llm.temperature = 0.3
-
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
 
-            response = await self.llm.ainvoke(messages)
-
-            # 恢复温度值
-            self.llm.temperature = 0.7
+            response, _ = await invoke_llm(
+                self.llm, messages, SamplingProfiles.IMPROVEMENT_WITH_SUMMARY, "improve_card"
+            )
 
             if not response.content:
+                mark_degraded("empty improvement response")
                 return card.front, card.back, "改进失败"
 
             return self._parse_improved_card_response(response.content, card)
 
         except Exception as error:
             print(f"Error improving card: {error}")
+            mark_degraded(f"improvement failed: {error}")
             return card.front, card.back, f"改进失败: {str(error)}"
 
     def _parse_quality_check_response(self, response: str) -> QualityCheckResult:
@@ -269,6 +297,7 @@ class AIService:
 
         except Exception as error:
             print(f"Error parsing quality check response: {error}")
+            mark_degraded(f"unparseable quality check response: {error}")
             return QualityCheckResult(
                 passed=False,
                 score=0,
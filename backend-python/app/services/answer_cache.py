@@ -0,0 +1,176 @@
+"""
+答案缓存服务
+
+两级缓存：内存LRU（带TTL） + SQLite 持久化表。
+缓存键由规范化问题、模型名称和 card_generation 提示词版本组成，
+修改提示词模板后旧条目自然失效。
+精确匹配未命中时，可选地再查询语义近似问题缓存（见 semantic_cache）。
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete
+
+from ..core.cache import TTLCache, normalize_question
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.prompt_loader import prompt_loader
+from ..core.prompts import Prompts
+from ..models.cache import AnswerCacheEntry
+from .semantic_cache import semantic_cache
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    """缓存的答案"""
+    answer: str
+    tokens_used: int = 0
+    # 语义缓存命中时记录匹配到的问题和相似度
+    matched_question: Optional[str] = None
+    similarity: Optional[float] = None
+
+    @property
+    def semantic(self) -> bool:
+        return self.matched_question is not None
+
+
+class AnswerCache:
+    """generate_answer 的两级缓存"""
+
+    def __init__(self):
+        self.memory = TTLCache(
+            maxsize=settings.answer_cache_max_entries,
+            ttl=settings.answer_cache_ttl
+        )
+        self.disk_hits = 0
+        self.disk_errors = 0
+
+    @staticmethod
+    def prompt_version() -> str:
+        """当前 card_generation 提示词版本"""
+        return prompt_loader.get_category_hash(Prompts.CARD_GENERATION)
+
+    @staticmethod
+    def make_key(question: str, model: str, prompt_version: str) -> str:
+        """生成缓存键"""
+        raw = "\x00".join([normalize_question(question), model, prompt_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, question: str, model: str) -> Optional[CachedAnswer]:
+        """查询缓存，未命中返回 None"""
+        if not settings.answer_cache_enabled:
+            return None
+
+        prompt_version = self.prompt_version()
+        cached = await self._get_exact(self.make_key(question, model, prompt_version))
+        if cached is not None:
+            return cached
+
+        match = semantic_cache.lookup(question, model, prompt_version)
+        if match:
+            entry, similarity = match
+            return CachedAnswer(
+                answer=entry["answer"],
+                tokens_used=entry["tokens_used"],
+                matched_question=entry["question"],
+                similarity=round(similarity, 4)
+            )
+        return None
+
+    async def _get_exact(self, key: str) -> Optional[CachedAnswer]:
+        """精确匹配：先查内存，再查SQLite"""
+        cached = self.memory.get(key)
+        if cached is not None:
+            return cached
+
+        if not settings.answer_cache_persist:
+            return None
+
+        try:
+            async with AsyncSessionLocal() as db:
+                entry = await db.get(AnswerCacheEntry, key)
+                if entry is None:
+                    return None
+
+                if entry.created_at and entry.created_at < _utcnow() - timedelta(seconds=settings.answer_cache_ttl):
+                    await db.delete(entry)
+                    await db.commit()
+                    return None
+
+                cached = CachedAnswer(answer=entry.answer, tokens_used=entry.tokens_used)
+        except Exception as error:
+            # 持久化层不可用时退化为纯内存缓存
+            self.disk_errors += 1
+            print(f"Error reading answer cache: {error}")
+            return None
+
+        self.disk_hits += 1
+        self.memory.set(key, cached)
+        return cached
+
+    async def set(self, question: str, model: str, answer: str, tokens_used: int = 0):
+        """写入缓存"""
+        if not settings.answer_cache_enabled or not answer:
+            return
+
+        prompt_version = self.prompt_version()
+        key = self.make_key(question, model, prompt_version)
+        self.memory.set(key, CachedAnswer(answer=answer, tokens_used=tokens_used))
+        semantic_cache.add(question, answer, model, prompt_version, tokens_used)
+
+        if not settings.answer_cache_persist:
+            return
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.merge(AnswerCacheEntry(
+                    key=key,
+                    question=normalize_question(question),
+                    model=model,
+                    prompt_version=prompt_version,
+                    answer=answer,
+                    tokens_used=tokens_used,
+                    created_at=_utcnow()
+                ))
+                await db.commit()
+        except Exception as error:
+            self.disk_errors += 1
+            print(f"Error writing answer cache: {error}")
+
+    async def prune(self) -> int:
+        """删除过期和旧提示词版本的持久化条目，返回删除数量"""
+        cutoff = _utcnow() - timedelta(seconds=settings.answer_cache_ttl)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(AnswerCacheEntry).where(
+                    (AnswerCacheEntry.created_at < cutoff) |
+                    (AnswerCacheEntry.prompt_version != self.prompt_version())
+                )
+            )
+            await db.commit()
+            return result.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        memory_stats = self.memory.stats()
+        hits = memory_stats["hits"] + self.disk_hits
+        return {
+            "enabled": settings.answer_cache_enabled,
+            "prompt_version": self.prompt_version(),
+            "hits": hits,
+            "misses": memory_stats["misses"] - self.disk_hits,
+            "memory": memory_stats,
+            "disk_hits": self.disk_hits,
+            "disk_errors": self.disk_errors,
+            "semantic": semantic_cache.stats(),
+        }
+
+
+# 创建全局实例
+answer_cache = AnswerCache()
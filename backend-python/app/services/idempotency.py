@@ -0,0 +1,254 @@
+"""
+生成接口的幂等键
+
+前端和代理在超时后会重试生成请求。请求带 Idempotency-Key 请求头时：
+- 同一接口、同一幂等键的请求已完成：直接返回保存的响应，不再调用模型
+- 原请求仍在执行：等待原请求的结果，不再开始第二次执行
+- 同一幂等键用于不同的请求体：拒绝
+
+成功的响应保存到 SQLite（idempotency_keys 表），保存 settings.idempotency_ttl 秒。
+失败的请求，以及LLM调用失败后返回降级结果（见 mark_degraded）的请求不保存，重试时重新执行；
+通过 shared_call 合并的调用返回降级结果时，等待同一调用的其他请求同样不保存。
+执行中的请求只在当前进程内合并。
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from pydantic import BaseModel
+from sqlalchemy import delete
+
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..core.singleflight import singleflight
+from ..models.idempotency import IdempotencyRecord
+
+
+T = TypeVar("T")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# 当前请求的执行结果标记，子任务复制上下文后共享同一个字典
+_outcome: ContextVar[Optional[Dict[str, Any]]] = ContextVar("idempotency_outcome", default=None)
+
+
+def mark_degraded(reason: str):
+    """
+    标记当前请求返回的是降级结果（如LLM调用失败后返回的默认评分或原卡片）
+
+    接口仍正常返回，但幂等键不保存该响应，重试时重新执行。
+    """
+    outcome = _outcome.get()
+    if outcome is not None:
+        outcome.setdefault("degraded", reason)
+
+
+async def shared_call(namespace: str, key: str, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+    """
+    通过 singleflight 合并相同调用，并把调用中的降级标记带给每个等待者
+
+    合并后的调用在发起者的任务中执行，其中的 mark_degraded 只会记到发起者的请求上；
+    这里把降级原因随结果一起返回，由每个等待者各自标记。
+
+    Returns:
+        (结果, 是否复用了其他请求的调用)
+    """
+    async def run() -> Tuple[T, Optional[str]]:
+        outcome: Dict[str, Any] = {}
+        token = _outcome.set(outcome)
+        try:
+            return await call(), outcome.get("degraded")
+        finally:
+            _outcome.reset(token)
+
+    (result, degraded), shared = await singleflight.do(namespace, key, run)
+    if degraded:
+        mark_degraded(degraded)
+    return result, shared
+
+
+class IdempotencyConflict(Exception):
+    """同一幂等键用于不同的请求"""
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """保存的响应"""
+    status_code: int
+    content: Any
+
+
+class IdempotencyStore:
+    """按幂等键保存和重放响应"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Tuple[str, asyncio.Task]] = {}
+        self.counters: Dict[str, int] = {
+            "executed": 0, "replayed": 0, "attached": 0, "conflicts": 0, "degraded": 0, "store_errors": 0
+        }
+
+    @staticmethod
+    def make_key(scope: str, idempotency_key: str) -> str:
+        """生成记录键"""
+        return hashlib.sha256(f"{scope}\x00{idempotency_key}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def fingerprint(payload: Any) -> str:
+        """请求体哈希"""
+        if isinstance(payload, BaseModel):
+            raw = payload.model_dump_json()
+        else:
+            raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def run(
+        self,
+        scope: str,
+        idempotency_key: str,
+        payload: Any,
+        call: Callable[[], Awaitable[Any]],
+        serialize: Callable[[Any], Any],
+        status_code: int = 200
+    ) -> Any:
+        """
+        按幂等键执行请求
+
+        Args:
+            scope: 接口名称，不同接口的幂等键互不影响
+            idempotency_key: 客户端提供的幂等键
+            payload: 请求体，用于检查幂等键是否被用于不同的请求
+            call: 实际执行请求
+            serialize: 把 call 的结果转换为可保存的JSON
+            status_code: 接口成功时的状态码，重放时原样返回
+
+        Returns:
+            call 的结果；已完成的请求返回 StoredResponse
+
+        Raises:
+            IdempotencyConflict: 同一幂等键用于不同的请求体
+        """
+        key = self.make_key(scope, idempotency_key)
+        fingerprint = self.fingerprint(payload)
+
+        inflight = self._inflight.get(key)
+        # 其他事件循环留下的任务（如测试之间）不能复用
+        if inflight is not None and inflight[1].get_loop() is not asyncio.get_running_loop():
+            inflight = None
+
+        if inflight is not None:
+            if inflight[0] != fingerprint:
+                self._count("conflicts")
+                raise IdempotencyConflict(f"Idempotency-Key {idempotency_key!r} is in use by a different request")
+            self._count("attached")
+            task = inflight[1]
+        else:
+            # 在独立任务中执行：原请求的连接断开后仍继续执行，重试可以等待它的结果
+            task = asyncio.ensure_future(self._execute(
+                key, scope, fingerprint, idempotency_key, call, serialize, status_code
+            ))
+            self._inflight[key] = (fingerprint, task)
+            task.add_done_callback(lambda _, done=task: self._remove(key, done))
+
+        return await asyncio.shield(task)
+
+    async def _execute(
+        self,
+        key: str,
+        scope: str,
+        fingerprint: str,
+        idempotency_key: str,
+        call: Callable[[], Awaitable[Any]],
+        serialize: Callable[[Any], Any],
+        status_code: int
+    ) -> Any:
+        stored = await self._load(key)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                self._count("conflicts")
+                raise IdempotencyConflict(f"Idempotency-Key {idempotency_key!r} was used for a different request")
+            self._count("replayed")
+            return StoredResponse(status_code=stored.status_code, content=json.loads(stored.response))
+
+        outcome: Dict[str, Any] = {}
+        _outcome.set(outcome)
+        result = await call()
+        self._count("executed")
+        if outcome.get("degraded"):
+            # 降级结果不保存，重试时重新执行
+            self._count("degraded")
+            print(f"Not storing degraded response for {scope}: {outcome['degraded']}")
+            return result
+
+        await self._save(IdempotencyRecord(
+            key=key,
+            scope=scope,
+            fingerprint=fingerprint,
+            status_code=status_code,
+            response=json.dumps(serialize(result), ensure_ascii=False),
+            created_at=_utcnow()
+        ))
+        return result
+
+    def _remove(self, key: str, task: asyncio.Task):
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[1] is task:
+            del self._inflight[key]
+
+    async def _load(self, key: str) -> Optional[IdempotencyRecord]:
+        """读取有效期内的记录"""
+        try:
+            async with AsyncSessionLocal() as db:
+                record = await db.get(IdempotencyRecord, key)
+        except Exception as error:
+            self._count("store_errors")
+            print(f"Error reading idempotency record: {error}")
+            return None
+
+        if record is None or record.created_at < _utcnow() - timedelta(seconds=settings.idempotency_ttl):
+            return None
+        return record
+
+    async def _save(self, record: IdempotencyRecord):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.merge(record)
+                await db.commit()
+        except Exception as error:
+            self._count("store_errors")
+            print(f"Error writing idempotency record: {error}")
+
+    async def prune(self) -> int:
+        """删除过期的记录，返回删除数量"""
+        cutoff = _utcnow() - timedelta(seconds=settings.idempotency_ttl)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff))
+            await db.commit()
+            return result.rowcount
+
+    def _count(self, event: str):
+        with self._lock:
+            self.counters[event] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息：replayed 为直接返回保存结果的重试，attached 为等待执行中请求的重试"""
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "enabled": settings.idempotency_enabled,
+            "ttl": settings.idempotency_ttl,
+            "in_flight": len(self._inflight),
+            **counters,
+        }
+
+
+# 创建全局实例
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,310 @@
+"""
+异步批量生成任务服务
+
+任务和每个问题的状态持久化在 SQLite 中（generation_jobs / generation_job_items），
+后台以有界并发逐个运行单卡生成工作流。进程重启后，未完成的任务从未完成的条目继续执行。
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+from uuid import uuid4
+
+from sqlalchemy import func, select, update
+
+from ..core.concurrency import run_bounded
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal
+from ..models.job import GenerationJob, GenerationJobItem
+from ..schemas.card import BatchSettings, CardGenerationRequest
+from ..schemas.job import JobItemResult, JobStatus
+from .langgraph_service import LangGraphService, langgraph_service
+
+# 已结束的任务状态
+FINISHED_STATES = ("completed", "cancelled", "failed")
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobService:
+    """批量生成任务的创建、执行、查询和取消"""
+
+    def __init__(self, generator: Optional[LangGraphService] = None):
+        # 默认与接口共用同一个服务实例，工作流只编译一次
+        self.generator = generator or langgraph_service
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+
+    async def create_job(self, questions: List[str], batch_settings: Optional[BatchSettings] = None) -> JobStatus:
+        """创建任务并立即在后台开始执行"""
+        job_id = uuid4().hex
+        async with AsyncSessionLocal() as db:
+            job = GenerationJob(id=job_id, status="pending", total=len(questions))
+            job.settings = (batch_settings or BatchSettings()).model_dump()
+            db.add(job)
+            db.add_all([
+                GenerationJobItem(job_id=job_id, position=i, question=question, status="pending")
+                for i, question in enumerate(questions)
+            ])
+            await db.commit()
+
+        self._start(job_id)
+        return await self.get_job(job_id)
+
+    async def get_job(
+        self,
+        job_id: str,
+        include_items: bool = False,
+        offset: int = 0,
+        limit: int = 100,
+        status: Optional[str] = None
+    ) -> Optional[JobStatus]:
+        """
+        获取任务进度，可选地附带条目结果（分页）
+
+        Args:
+            job_id: 任务ID
+            include_items: 是否返回条目结果
+            offset: 条目偏移
+            limit: 条目数量
+            status: 只返回指定状态的条目
+        """
+        async with AsyncSessionLocal() as db:
+            job = await db.get(GenerationJob, job_id)
+            if job is None:
+                return None
+
+            counts = await self._count_items(db, [job_id])
+            items = None
+            if include_items:
+                query = select(GenerationJobItem).where(GenerationJobItem.job_id == job_id)
+                if status:
+                    query = query.where(GenerationJobItem.status == status)
+                query = query.order_by(GenerationJobItem.position).offset(offset).limit(limit)
+                result = await db.execute(query)
+                items = [self._to_item_result(item) for item in result.scalars().all()]
+
+        return self._to_status(job, counts.get(job_id, {}), items)
+
+    async def list_jobs(self, skip: int = 0, limit: int = 20) -> List[JobStatus]:
+        """按创建时间倒序列出任务"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(GenerationJob).order_by(GenerationJob.created_at.desc()).offset(skip).limit(limit)
+            )
+            jobs = result.scalars().all()
+            counts = await self._count_items(db, [job.id for job in jobs])
+
+        return [self._to_status(job, counts.get(job.id, {})) for job in jobs]
+
+    async def cancel_job(self, job_id: str) -> Optional[JobStatus]:
+        """取消任务：未开始的条目标记为 cancelled，正在执行的条目完成后保留结果"""
+        self._cancelled.add(job_id)
+        async with AsyncSessionLocal() as db:
+            job = await db.get(GenerationJob, job_id)
+            if job is None:
+                self._cancelled.discard(job_id)
+                return None
+
+            if job.status not in FINISHED_STATES:
+                job.status = "cancelled"
+                job.finished_at = _utcnow()
+                await db.execute(
+                    update(GenerationJobItem)
+                    .where(GenerationJobItem.job_id == job_id, GenerationJobItem.status == "pending")
+                    .values(status="cancelled")
+                )
+                await db.commit()
+
+        if job_id not in self._tasks:
+            self._cancelled.discard(job_id)
+        return await self.get_job(job_id)
+
+    async def resume(self) -> int:
+        """恢复进程重启前未完成的任务，返回恢复的任务数"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(GenerationJob.id).where(GenerationJob.status.in_(["pending", "running"]))
+            )
+            job_ids = result.scalars().all()
+
+        for job_id in job_ids:
+            self._start(job_id)
+        return len(job_ids)
+
+    async def shutdown(self):
+        """停止后台任务，未完成的条目在下次启动时恢复"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, job_id: str):
+        """在后台运行任务"""
+        if job_id not in self._tasks:
+            self._tasks[job_id] = asyncio.create_task(self._run(job_id))
+
+    async def _run(self, job_id: str):
+        """执行任务中所有未完成的条目"""
+        try:
+            async with AsyncSessionLocal() as db:
+                job = await db.get(GenerationJob, job_id)
+                if job is None or job.status in FINISHED_STATES:
+                    return
+
+                job.status = "running"
+                # 上次执行中断的条目重新执行
+                await db.execute(
+                    update(GenerationJobItem)
+                    .where(GenerationJobItem.job_id == job_id, GenerationJobItem.status == "running")
+                    .values(status="pending")
+                )
+                result = await db.execute(
+                    select(GenerationJobItem.id, GenerationJobItem.question)
+                    .where(GenerationJobItem.job_id == job_id, GenerationJobItem.status == "pending")
+                    .order_by(GenerationJobItem.position)
+                )
+                items = result.all()
+                batch_settings = BatchSettings(**job.settings)
+                await db.commit()
+
+            await run_bounded(
+                items,
+                lambda index, item: self._process_item(job_id, item.id, item.question, batch_settings),
+                settings.job_concurrency
+            )
+
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(GenerationJob)
+                    .where(GenerationJob.id == job_id, GenerationJob.status == "running")
+                    .values(status="completed", finished_at=_utcnow())
+                )
+                await db.commit()
+
+        except asyncio.CancelledError:
+            # 进程关闭：保持 running 状态，重启后恢复
+            raise
+        except Exception as error:
+            print(f"Error running job {job_id}: {error}")
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(GenerationJob)
+                    .where(GenerationJob.id == job_id)
+                    .values(status="failed", error=str(error), finished_at=_utcnow())
+                )
+                await db.commit()
+        finally:
+            self._tasks.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+    async def _process_item(self, job_id: str, item_id: int, question: str, batch_settings: BatchSettings):
+        """生成单个条目并保存结果"""
+        if job_id in self._cancelled:
+            return
+
+        await self._update_item(item_id, status="running")
+
+        try:
+            request = CardGenerationRequest(
+                question=question,
+                tags=batch_settings.tags or [],
+                deck_name=batch_settings.deck_name or "Default",
+                card_type=batch_settings.card_type or "basic",
+                use_cache=batch_settings.use_cache is not False,
+                # 使用持久化检查点时，重启后从条目中断的节点继续
+                thread_id=f"job-{job_id}-{item_id}"
+            )
+            result = await self.generator.generate_card(request)
+        except Exception as error:
+            result = {"success": False, "error": str(error)}
+
+        if result["success"] and result.get("card"):
+            quality_check = result.get("quality_check")
+            await self._update_item(
+                item_id,
+                status="done",
+                result=json.dumps({
+                    "card": result["card"].model_dump(mode="json"),
+                    "quality_check": quality_check.model_dump(mode="json") if quality_check else None
+                }, ensure_ascii=False),
+                error=None,
+                tokens_used=result.get("tokens_used", 0)
+            )
+        else:
+            await self._update_item(
+                item_id,
+                status="failed",
+                error=result.get("error") or "Failed to generate card"
+            )
+
+    async def _update_item(self, item_id: int, **values):
+        """更新条目"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(GenerationJobItem).where(GenerationJobItem.id == item_id).values(**values))
+            await db.commit()
+
+    @staticmethod
+    async def _count_items(db, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """按任务统计各状态的条目数和token用量"""
+        if not job_ids:
+            return {}
+
+        result = await db.execute(
+            select(
+                GenerationJobItem.job_id,
+                GenerationJobItem.status,
+                func.count(),
+                func.coalesce(func.sum(GenerationJobItem.tokens_used), 0)
+            )
+            .where(GenerationJobItem.job_id.in_(job_ids))
+            .group_by(GenerationJobItem.job_id, GenerationJobItem.status)
+        )
+
+        counts: Dict[str, Dict[str, Any]] = {}
+        for job_id, status, count, tokens in result.all():
+            job_counts = counts.setdefault(job_id, {"tokens_used": 0})
+            job_counts[status] = count
+            job_counts["tokens_used"] += tokens
+        return counts
+
+    @staticmethod
+    def _to_status(job: GenerationJob, counts: Dict[str, Any], items: Optional[List[JobItemResult]] = None) -> JobStatus:
+        """转换为任务状态"""
+        completed = counts.get("done", 0)
+        failed = counts.get("failed", 0)
+        return JobStatus(
+            id=job.id,
+            status=job.status,
+            total=job.total,
+            completed=completed,
+            failed=failed,
+            pending=counts.get("pending", 0) + counts.get("running", 0),
+            progress=round((completed + failed) / job.total, 4) if job.total else 1.0,
+            tokens_used=counts.get("tokens_used", 0),
+            error=job.error,
+            created_at=job.created_at,
+            updated_at=job.updated_at,
+            finished_at=job.finished_at,
+            items=items
+        )
+
+    @staticmethod
+    def _to_item_result(item: GenerationJobItem) -> JobItemResult:
+        """转换为条目结果"""
+        result = json.loads(item.result) if item.result else {}
+        return JobItemResult(
+            index=item.position,
+            question=item.question,
+            status=item.status,
+            card=result.get("card"),
+            quality_check=result.get("quality_check"),
+            error=item.error,
+            tokens_used=item.tokens_used
+        )
+
+
+# 创建全局实例
+job_service = JobService()
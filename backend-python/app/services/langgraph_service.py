@@ -1,6 +1,9 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
 from uuid import uuid4
 
+from pydantic import BaseModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+
 from ..schemas.card import (
     AnkiCard,
     CardGenerationRequest,
@@ -10,6 +13,8 @@ from ..schemas.card import (
     ImproveCardRequest,
     BatchSettings
 )
+from ..core.config import settings as app_settings
+from ..core.usage import merge_token_usage
 from ..graph.workflows import (
     CardGenerationWorkflow,
     BatchGenerationWorkflow,
@@ -27,8 +32,16 @@ class LangGraphService:
         self.quality_workflow = QualityCheckWorkflow()
         self.improvement_workflow = ImprovementWorkflow()
 
+    def warmup(self):
+        """预先编译所有工作流（应用启动时调用），请求中直接复用编译结果"""
+        self.card_workflow.compile()
+        self.card_workflow.compile(use_memory=True)
+        self.batch_workflow.compile()
+        self.improvement_workflow.compile()
+
     async def generate_card(self, request: CardGenerationRequest) -> Dict[str, Any]:
-        """生成单个卡片"""
+        """生成单个卡片，失败时结果中同样带 thread_id，便于使用相同的 thread_id 从检查点重试"""
+        thread_id = request.thread_id or uuid4().hex
         try:
             # 验证问题不为空
             if not request.question or request.question.strip() == "":
@@ -38,20 +51,10 @@ class LangGraphService:
                 }
 
             # 初始化状态
-            initial_state = {
-                "question": request.question,
-                "tags": request.tags or [],
-                "deck_name": request.deck_name or "Default",
-                "card_type": request.card_type or "basic",
-                "improvement_count": 0,
-                "max_improvements": 2,  # 最多改进2次
-                "tokens_used": 0,
-                "model_name": "gpt-3.5-turbo",
-                "messages": []
-            }
+            initial_state = self._build_card_state(request)
 
-            # 运行工作流
-            result = await self.card_workflow.run(initial_state)
+            # 运行工作流，每个节点完成后写入检查点
+            result = await self.card_workflow.run(initial_state, use_memory=True, thread_id=thread_id)
 
             # 设置卡片ID
             if result.get('final_card'):
@@ -61,15 +64,142 @@ class LangGraphService:
                 "success": True,
                 "card": result.get('final_card'),
                 "quality_check": result.get('final_quality_check'),
-                "tokens_used": result.get('tokens_used', 0)
+                "tokens_used": result.get('tokens_used', 0),
+                "token_usage": result.get('token_usage', {}),
+                "cached": result.get('answer_cached', False),
+                "semantic_match": result.get('semantic_match'),
+                "model": result.get('model_name'),
+                "self_graded": result.get('self_graded', False),
+                "candidates": result.get('candidates'),
+                "improvement": result.get('improvement'),
+                "thread_id": thread_id
             }
 
         except Exception as error:
             return {
                 "success": False,
-                "error": str(error)
+                "error": str(error),
+                "thread_id": thread_id
             }
 
+    async def stream_card(self, request: CardGenerationRequest) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        流式生成单个卡片
+
+        生成答案的调用失败重试（或改用备用模型）时，之前推送的片段作废，
+        先推送 reset 事件，客户端收到后应清空已显示的答案，再接收新一次调用的片段。
+
+        Yields:
+            (事件名, 数据)：token（答案片段）、reset、card、quality_check、done
+        """
+        app = self.card_workflow.compile()
+        answer_streamed = False
+        answer_run = None
+        tokens_used = 0
+        token_usage = {}
+
+        async for mode, chunk in app.astream(
+            self._build_card_state(request),
+            # 对冲请求的增量输出会与原请求交错，流式输出时关闭对冲
+            config={"configurable": {"llm_hedging": False}},
+            stream_mode=["messages", "updates"]
+        ):
+            if mode == "messages":
+                message, metadata = chunk
+                # 只转发生成答案节点的增量输出，改进节点的输出不属于答案
+                if (isinstance(message, AIMessageChunk) and message.content
+                        and metadata.get("langgraph_node") == "generate_answer"):
+                    # 每次模型调用的片段 id 不同，id 变化说明前一次调用中途失败后重新调用
+                    if answer_streamed and message.id != answer_run:
+                        yield "reset", {}
+                    answer_streamed = True
+                    answer_run = message.id
+                    yield "token", {"content": message.content}
+                continue
+
+            for node, update in chunk.items():
+                update = update or {}
+                tokens_used = update.get("tokens_used", tokens_used)
+                token_usage = merge_token_usage(token_usage, update.get("token_usage"))
+
+                if (node in ("generate_answer", "generate_graded", "generate_candidates")
+                        and not answer_streamed and update.get("answer")):
+                    # 命中缓存、快速模式（回复为JSON）或多候选模式时没有增量输出，一次性返回完整答案
+                    yield "token", {"content": update["answer"]}
+                elif node == "create_final":
+                    card = update.get("final_card")
+                    quality_check = update.get("final_quality_check")
+                    if card:
+                        card.id = uuid4()
+                        yield "card", card.model_dump(mode="json")
+                    if quality_check:
+                        yield "quality_check", quality_check.model_dump(mode="json")
+
+        yield "done", {"tokens_used": tokens_used, "token_usage": token_usage}
+
+    async def stream_workflow(self, request: CardGenerationRequest) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        流式执行工作流，每个节点完成后立即产出其状态更新
+
+        只执行一次图：最终结果取自最后一次完整状态，不再重新调用。
+
+        Yields:
+            (事件名, 数据)：step（每个节点一次）、final
+        """
+        app = self.card_workflow.compile(use_memory=True)
+        # 每个请求使用独立的 thread，结束后删除其检查点
+        thread_id = f"stream-{uuid4().hex}"
+        config = {"configurable": {"thread_id": thread_id}}
+
+        steps = 0
+        final_state: Dict[str, Any] = {}
+        try:
+            async for mode, chunk in app.astream(
+                self._build_card_state(request),
+                config=config,
+                stream_mode=["updates", "values"]
+            ):
+                if mode == "values":
+                    final_state = chunk
+                    continue
+
+                for node, update in chunk.items():
+                    steps += 1
+                    update = update or {}
+                    yield "step", {
+                        "step": node,
+                        "data": self._to_jsonable(update),
+                        "tokens_used": update.get("tokens_used", final_state.get("tokens_used", 0))
+                    }
+        finally:
+            await self.card_workflow.memory.adelete_thread(thread_id)
+
+        final_card = final_state.get("final_card")
+        if final_card:
+            final_card.id = uuid4()
+        final_quality_check = final_state.get("final_quality_check")
+
+        yield "final", {
+            "steps": steps,
+            "final_card": final_card.model_dump(mode="json") if final_card else None,
+            "final_quality_check": final_quality_check.model_dump(mode="json") if final_quality_check else None,
+            "total_tokens_used": final_state.get("tokens_used", 0),
+            "token_usage": final_state.get("token_usage", {})
+        }
+
+    @classmethod
+    def _to_jsonable(cls, value: Any) -> Any:
+        """将状态更新转换为可JSON序列化的数据"""
+        if isinstance(value, BaseMessage):
+            return {"type": value.type, "content": value.content}
+        if isinstance(value, BaseModel):
+            return value.model_dump(mode="json")
+        if isinstance(value, dict):
+            return {key: cls._to_jsonable(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [cls._to_jsonable(item) for item in value]
+        return value
+
     async def generate_cards_batch(self, request: BatchGenerationRequest) -> Dict[str, Any]:
         """批量生成卡片"""
         try:
@@ -91,7 +221,8 @@ class LangGraphService:
                 "errors": [],
                 "current_index": 0,
                 "total_count": len(request.questions),
-                "tokens_used": 0
+                "tokens_used": 0,
+                "token_usage": {}
             }
 
             # 运行批量工作流
@@ -106,7 +237,8 @@ class LangGraphService:
                 "success": True,
                 "cards": result.get('cards', []),
                 "errors": result.get('errors', []),
-                "tokens_used": result.get('tokens_used', 0)
+                "tokens_used": result.get('tokens_used', 0),
+                "token_usage": result.get('token_usage', {})
             }
 
         except Exception as error:
@@ -115,6 +247,27 @@ class LangGraphService:
                 "error": str(error)
             }
 
+    def _build_card_state(self, request: CardGenerationRequest) -> Dict[str, Any]:
+        """构建单个卡片工作流的初始状态"""
+        return {
+            "question": request.question,
+            "tags": request.tags or [],
+            "deck_name": request.deck_name or "Default",
+            "card_type": request.card_type or "basic",
+            "use_cache": request.use_cache is not False,
+            "mode": request.mode,
+            "self_graded": False,
+            "candidates": None,
+            "score_history": [],
+            "card_unchanged": False,
+            "improvement_count": 0,
+            "max_improvements": 2,  # 最多改进2次
+            "tokens_used": 0,
+            "token_usage": {},
+            "model_name": app_settings.zhipu_model,
+            "messages": []
+        }
+
     async def check_card_quality(self, card: AnkiCard) -> QualityCheckResult:
         """检查卡片质量"""
         return await self.quality_workflow.run_quality_check(card)
@@ -137,11 +290,16 @@ class LangGraphService:
                 "success": True,
                 "improved_card": result.get('improved_card'),
                 "quality_check": result.get('quality_check'),
-                "tokens_used": result.get('tokens_used', 0)
+                "tokens_used": result.get('tokens_used', 0),
+                "token_usage": result.get('token_usage', {})
             }
 
         except Exception as error:
             return {
                 "success": False,
                 "error": str(error)
-            }
\ No newline at end of file
+            }
+
+
+# 创建全局实例
+langgraph_service = LangGraphService()
@@ -0,0 +1,159 @@
+"""
+打包批量生成
+
+把多个问题放进一次LLM调用，按JSON数组格式拆分回答。
+max_tokens 按问题数放大；回复被截断时保留已经完整的条目，
+解析失败或缺失的条目返回 None，由调用方只对这些条目回退到逐个生成。
+"""
+import asyncio
+import json
+import re
+from typing import Any, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from ..core.config import settings
+from ..core.llm import llm_registry, SamplingProfiles, invoke_llm, served_model
+from ..core.prompt_loader import prompt_loader
+from ..core.prompts import Prompts
+from ..core.usage import TokenUsage
+from .answer_cache import answer_cache
+
+
+class PackedAnswer(BaseModel):
+    """打包生成中的单个回答"""
+    index: int
+    answer: str
+
+
+_decoder = json.JSONDecoder(strict=False)
+
+
+def resolve_pack_size(pack_size: Optional[int]) -> int:
+    """请求未指定时使用全局配置，并限制在合理范围内"""
+    size = pack_size if pack_size is not None else settings.batch_pack_size
+    return max(1, min(size, settings.batch_pack_size_max))
+
+
+class PackedAnswerGenerator:
+    """打包生成答案"""
+
+    def __init__(self):
+        self.llm = llm_registry.get_llm()
+
+    async def generate(
+        self,
+        questions: List[str],
+        pack_size: int,
+        use_cache: bool = True
+    ) -> Tuple[List[Optional[str]], TokenUsage]:
+        """
+        为问题列表生成答案
+
+        Args:
+            questions: 问题列表
+            pack_size: 每次调用包含的问题数
+            use_cache: 是否使用答案缓存
+
+        Returns:
+            (与 questions 对齐的答案列表, 打包调用的总token用量)，
+            无法从打包结果中得到的条目为 None
+        """
+        answers: List[Optional[str]] = [None] * len(questions)
+        usage = TokenUsage()
+
+        pending = []
+        for i, question in enumerate(questions):
+            cached = await answer_cache.get(question, settings.zhipu_model) if use_cache else None
+            if cached:
+                answers[i] = cached.answer
+            else:
+                pending.append(i)
+
+        packs = [pending[i:i + pack_size] for i in range(0, len(pending), pack_size)]
+        results = await asyncio.gather(
+            *[self._generate_pack([questions[i] for i in pack]) for pack in packs],
+            return_exceptions=True
+        )
+
+        for pack, result in zip(packs, results):
+            if isinstance(result, Exception):
+                print(f"Error in packed generation: {result}")
+                continue
+            pack_answers, pack_usage = result
+            usage.add(pack_usage)
+            for i, answer in zip(pack, pack_answers):
+                answers[i] = answer
+
+        return answers, usage
+
+    async def _generate_pack(self, questions: List[str]) -> Tuple[List[Optional[str]], TokenUsage]:
+        """一次调用生成一组问题的答案"""
+        system_prompt = prompt_loader.get_prompt(Prompts.CARD_GENERATION, Prompts.SYSTEM)
+        user_prompt = prompt_loader.get_prompt(
+            Prompts.CARD_GENERATION,
+            Prompts.GENERATE_BATCH,
+            questions=questions,
+            count=len(questions)
+        )
+
+        messages = [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+
+        response, usage = await invoke_llm(
+            self.llm, messages, SamplingProfiles.BATCH_GENERATION.scaled(len(questions)), "generate_batch"
+        )
+
+        answers = self._parse_packed_response(response.content, len(questions))
+
+        # 按条目平摊token用量写入缓存
+        share = usage.total_tokens // len(questions)
+        model = served_model(response)
+        for question, answer in zip(questions, answers):
+            if answer:
+                await answer_cache.set(question, model, answer, share)
+
+        return answers, usage
+
+    def _parse_packed_response(self, response: str, count: int) -> List[Optional[str]]:
+        """
+        解析JSON数组格式的打包回答
+
+        逐个解析数组元素，回复被截断时保留截断前完整的条目；
+        序号越界、格式错误、为空或缺失的条目返回 None。
+        """
+        answers: List[Optional[str]] = [None] * count
+
+        # 去掉可能的代码块标记，从JSON数组开头逐个解析元素
+        text = re.sub(r"```(?:json)?", "", response or "")
+        start = text.find("[")
+        if start == -1:
+            return answers
+
+        for item in self._iter_array_items(text, start + 1):
+            try:
+                answer = PackedAnswer.model_validate(item)
+            except ValidationError:
+                continue
+            if 1 <= answer.index <= count and answer.answer.strip():
+                answers[answer.index - 1] = answer.answer.strip()
+
+        return answers
+
+    @staticmethod
+    def _iter_array_items(text: str, pos: int) -> Iterator[Any]:
+        """从 pos 开始逐个解码数组元素，遇到数组结尾或无法解码（如被截断）时停止"""
+        while True:
+            while pos < len(text) and (text[pos].isspace() or text[pos] == ","):
+                pos += 1
+            if pos >= len(text) or text[pos] == "]":
+                return
+            try:
+                item, pos = _decoder.raw_decode(text, pos)
+            except ValueError as error:
+                print(f"Packed response truncated or invalid, keeping parsed items: {error}")
+                return
+            yield item
@@ -0,0 +1,165 @@
+"""
+质量检查预评分
+
+在调用LLM质检之前用本地规则评估卡片：明显合格（长度适中、结构完整、没有重复）
+或明显有问题（背面为空、被截断、只是重复问题、内容大量重复）的卡片直接给出结果，
+不再调用LLM。把握不足的卡片仍交给LLM质检。
+
+阈值见 settings.prescore_*，可以用 scripts/calibrate_prescorer.py 对已保存的卡片校准。
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ..core.config import settings
+from ..schemas.card import AnkiCard, QualityCheckResult
+
+# 预评分结论
+PASS = "pass"
+FAIL = "fail"
+
+# 句末标点和闭合符号：背面以这些字符结尾时视为完整
+_TERMINAL_CHARS = set("。！？.!?）)」』】]}>\"'`*|")
+# 明显的截断标记：背面以这些字符结尾
+_TRUNCATION_SUFFIXES = ("...", "…", "，", ",", "、", "：", ":", "；", ";", "（", "(", "-", "=")
+_NORMALIZE_PATTERN = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+@dataclass
+class Prescore:
+    """预评分结果"""
+    verdict: Optional[str] = None  # pass、fail，无把握时为 None
+    confidence: float = 0.0
+    score: int = 0
+    issues: List[str] = field(default_factory=list)
+    suggestions: List[str] = field(default_factory=list)
+    features: Dict[str, Any] = field(default_factory=dict)
+
+    def to_result(self) -> QualityCheckResult:
+        """转换为质量检查结果"""
+        return QualityCheckResult(
+            passed=self.verdict == PASS,
+            score=self.score,
+            issues=list(self.issues),
+            suggestions=list(self.suggestions)
+        )
+
+
+def _normalize(text: str) -> str:
+    """去掉空白和标点并转小写，用于比较内容"""
+    return _NORMALIZE_PATTERN.sub("", text).lower()
+
+
+def _ngrams(text: str, n: int) -> List[str]:
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+def repetition_ratio(text: str) -> float:
+    """重复程度：重复行占比和重复4字片段占比中的较大值"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    line_ratio = 1 - len(set(lines)) / len(lines) if len(lines) >= 3 else 0.0
+
+    grams = _ngrams(_normalize(text), 4)
+    gram_ratio = 1 - len(set(grams)) / len(grams) if len(grams) >= 20 else 0.0
+    return max(line_ratio, gram_ratio)
+
+
+def overlap_ratio(question: str, answer: str) -> float:
+    """背面中同时出现在问题里的2字片段占比，接近 1 表示答案只是重复问题"""
+    answer_grams = set(_ngrams(_normalize(answer), 2))
+    if not answer_grams:
+        return 0.0
+    question_grams = set(_ngrams(_normalize(question), 2))
+    return len(answer_grams & question_grams) / len(answer_grams)
+
+
+def truncation(text: str) -> Optional[str]:
+    """截断判断：hard 为明显截断（未闭合的代码块、省略号等结尾），soft 为没有句末标点"""
+    if text.count("```") % 2 == 1 or text.endswith(_TRUNCATION_SUFFIXES):
+        return "hard"
+    if text[-1] not in _TERMINAL_CHARS:
+        return "soft"
+    return None
+
+
+class QualityPrescorer:
+    """基于规则的质量预评分"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"evaluated": 0, "skipped_pass": 0, "skipped_fail": 0, "deferred": 0}
+
+    def features(self, card: AnkiCard) -> Dict[str, Any]:
+        """提取预评分使用的特征"""
+        question = (card.front or "").strip()
+        answer = (card.back or "").strip()
+        return {
+            "question_chars": len(question),
+            "answer_chars": len(answer),
+            "repetition": round(repetition_ratio(answer), 3) if answer else 0.0,
+            "overlap": round(overlap_ratio(question, answer), 3) if answer else 0.0,
+            "truncation": truncation(answer) if answer else None,
+        }
+
+    def evaluate(self, card: AnkiCard) -> Prescore:
+        """评估卡片，返回结论和把握程度（不受 prescore_enabled 影响，校准脚本直接使用）"""
+        features = self.features(card)
+        answer_chars = features["answer_chars"]
+
+        if answer_chars == 0:
+            return Prescore(FAIL, 1.0, 0, ["卡片背面为空"], ["重新生成答案"], features)
+
+        if (features["overlap"] >= settings.prescore_echo_overlap
+                and answer_chars <= features["question_chars"] * 1.5):
+            return Prescore(FAIL, 0.95, 20, ["答案只是重复了问题"], ["直接回答问题的核心内容"], features)
+
+        if features["truncation"] == "hard":
+            return Prescore(FAIL, 0.9, 40, ["答案疑似被截断"], ["补全答案的结尾"], features)
+
+        if features["repetition"] >= settings.prescore_max_repetition:
+            return Prescore(FAIL, 0.9, 40, ["答案内容大量重复"], ["删除重复的内容"], features)
+
+        if answer_chars < settings.prescore_min_chars:
+            # 很短的答案也可能是正确的（如计算题），把握较低
+            return Prescore(FAIL, 0.6, 50, ["答案过短"], ["补充必要的解释"], features)
+
+        if (settings.prescore_pass_min_chars <= answer_chars <= settings.prescore_pass_max_chars
+                and features["repetition"] <= settings.prescore_pass_max_repetition
+                and features["overlap"] <= settings.prescore_pass_max_overlap
+                and features["truncation"] is None):
+            return Prescore(PASS, 0.9, settings.prescore_pass_score, features=features)
+
+        return Prescore(features=features)
+
+    def check(self, card: AnkiCard) -> Optional[QualityCheckResult]:
+        """
+        把握足够时直接返回质量检查结果，否则返回 None（需要调用LLM质检）
+
+        Args:
+            card: 待检查的卡片
+        """
+        if not settings.prescore_enabled:
+            return None
+
+        prescore = self.evaluate(card)
+        confident = prescore.verdict is not None and prescore.confidence >= settings.prescore_min_confidence
+        with self._lock:
+            self.counters["evaluated"] += 1
+            self.counters[f"skipped_{prescore.verdict}" if confident else "deferred"] += 1
+        return prescore.to_result() if confident else None
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息：skipped_* 为省掉的LLM质检调用数"""
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "enabled": settings.prescore_enabled,
+            "min_confidence": settings.prescore_min_confidence,
+            "llm_calls_avoided": counters["skipped_pass"] + counters["skipped_fail"],
+            **counters,
+        }
+
+
+# 创建全局实例
+quality_prescorer = QualityPrescorer()
@@ -0,0 +1,57 @@
+"""
+质量检查结果缓存
+
+以卡片内容（正面、背面）、quality_check 提示词版本和模型为键，
+相同卡片不再重复调用LLM评估。
+"""
+import hashlib
+from typing import Any, Dict, Optional
+
+from ..core.cache import TTLCache
+from ..core.config import settings
+from ..core.prompt_loader import prompt_loader
+from ..core.prompts import Prompts
+from ..schemas.card import AnkiCard, QualityCheckResult
+
+
+class QualityCheckCache:
+    """质量检查结果的内存LRU缓存"""
+
+    def __init__(self):
+        self.memory = TTLCache(
+            maxsize=settings.quality_cache_max_entries,
+            ttl=settings.quality_cache_ttl
+        )
+
+    @staticmethod
+    def make_key(card: AnkiCard, model: str) -> str:
+        """生成缓存键"""
+        prompt_version = prompt_loader.get_category_hash(Prompts.QUALITY_CHECK)
+        raw = "\x00".join([card.front.strip(), card.back.strip(), prompt_version, model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, card: AnkiCard, model: str) -> Optional[QualityCheckResult]:
+        """查询缓存，返回结果副本"""
+        if not settings.quality_cache_enabled:
+            return None
+
+        cached = self.memory.get(self.make_key(card, model))
+        return cached.model_copy(deep=True) if cached else None
+
+    def set(self, card: AnkiCard, model: str, result: QualityCheckResult):
+        """写入缓存"""
+        if not settings.quality_cache_enabled:
+            return
+
+        self.memory.set(self.make_key(card, model), result.model_copy(deep=True))
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {
+            "enabled": settings.quality_cache_enabled,
+            **self.memory.stats()
+        }
+
+
+# 创建全局实例
+quality_cache = QualityCheckCache()
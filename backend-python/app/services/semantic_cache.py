@@ -0,0 +1,202 @@
+"""
+语义近似问题缓存
+
+在本地CPU上用字符n-gram哈希向量表示问题，按余弦相似度查找已缓存的近似问题，
+例如"解释一下RESTful API"与"什么是RESTful API?"。
+索引保存在内存矩阵中，并持久化到磁盘（.npz）。依赖可选包 numpy，未安装时自动禁用。
+"""
+import json
+import re
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖
+    np = None
+
+from ..core.cache import normalize_question
+from ..core.config import settings
+
+# 常见的提问套话，去掉后只保留问题主体
+_FILLER_PATTERN = re.compile(
+    r"(请|请你|简单|简要|详细|能否|可以)?"
+    r"(解释一下|解释|介绍一下|介绍|说明一下|说明|讲一下|讲讲|谈谈|什么是|是什么|什么叫|何为|"
+    r"的作用是什么|的作用|有什么用|有哪些|的区别|的含义|的概念|"
+    r"what is|what are|explain|describe|define|tell me about)"
+)
+_ASCII_WORD = re.compile(r"[a-z0-9_+#.]+")
+
+
+def _strip_fillers(text: str) -> str:
+    """去掉提问套话和标点"""
+    text = _FILLER_PATTERN.sub(" ", text).replace("的", "")
+    text = re.sub(r"[^\w\s+#.]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class SemanticAnswerCache:
+    """基于哈希向量和余弦相似度的近似问题缓存"""
+
+    def __init__(self, path: Optional[str] = None, dim: Optional[int] = None):
+        self.path = Path(path or settings.semantic_cache_path)
+        self.dim = dim or settings.semantic_cache_dim
+        self._lock = threading.Lock()
+        self._vectors = None  # shape: (n, dim)
+        self._entries: List[Dict[str, Any]] = []
+        self._loaded = False
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.semantic_cache_enabled and np is not None
+
+    def embed(self, question: str):
+        """将问题编码为L2归一化的哈希向量"""
+        text = _strip_fillers(normalize_question(question))
+        compact = text.replace(" ", "")
+
+        features = [compact[i:i + n] for n in (2, 3) for i in range(len(compact) - n + 1)]
+        features.extend(_ASCII_WORD.findall(text))
+        if not features and compact:
+            features.append(compact)
+
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+
+        # 次线性词频，削弱重复片段的权重
+        vector = np.sign(vector) * np.sqrt(np.abs(vector))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question: str, model: str, prompt_version: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        查找相似度超过阈值的已缓存问题
+
+        Returns:
+            (缓存条目, 相似度)，未命中返回 None
+        """
+        if not self.enabled:
+            return None
+
+        query = self.embed(question)
+        with self._lock:
+            self._ensure_loaded()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            mask = np.array([
+                entry["model"] == model and entry["prompt_version"] == prompt_version
+                for entry in self._entries
+            ])
+            similarities = np.where(mask, self._vectors @ query, -1.0)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+            if similarity < settings.semantic_cache_threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return dict(self._entries[best]), similarity
+
+    def add(self, question: str, answer: str, model: str, prompt_version: str, tokens_used: int = 0):
+        """加入索引，超过上限时淘汰最早的条目"""
+        if not self.enabled:
+            return
+
+        vector = self.embed(question)
+        entry = {
+            "question": question,
+            "answer": answer,
+            "model": model,
+            "prompt_version": prompt_version,
+            "tokens_used": tokens_used,
+        }
+
+        with self._lock:
+            self._ensure_loaded()
+
+            # 同一问题只保留最新的答案
+            for i, existing in enumerate(self._entries):
+                if (existing["question"] == question and existing["model"] == model
+                        and existing["prompt_version"] == prompt_version):
+                    self._entries[i] = entry
+                    self._vectors[i] = vector
+                    break
+            else:
+                self._entries.append(entry)
+                self._vectors = np.vstack([self._vectors, vector[None, :]])
+
+                overflow = len(self._entries) - settings.semantic_cache_max_entries
+                if overflow > 0:
+                    self._entries = self._entries[overflow:]
+                    self._vectors = self._vectors[overflow:]
+
+            self._unsaved += 1
+            should_save = self._unsaved >= settings.semantic_cache_save_every
+
+        if should_save:
+            self.save()
+
+    def _ensure_loaded(self):
+        """首次使用时从磁盘加载索引，调用方需持有锁"""
+        if self._loaded:
+            return
+
+        self._loaded = True
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        if not self.path.exists():
+            return
+
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                vectors = data["vectors"]
+                entries = json.loads(str(data["entries"]))
+            if vectors.shape[1] == self.dim and len(entries) == vectors.shape[0]:
+                self._vectors = vectors.astype(np.float32)
+                self._entries = entries
+        except Exception as error:
+            print(f"Error loading semantic cache: {error}")
+
+    def save(self):
+        """持久化索引到磁盘"""
+        if np is None:
+            return
+
+        with self._lock:
+            if not self._loaded:
+                return
+            vectors = self._vectors.copy()
+            entries = json.dumps(self._entries, ensure_ascii=False)
+            self._unsaved = 0
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp.npz")
+            np.savez(tmp_path, vectors=vectors, entries=np.array(entries))
+            tmp_path.replace(self.path)
+        except Exception as error:
+            print(f"Error saving semantic cache: {error}")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        return {
+            "enabled": self.enabled,
+            "numpy_available": np is not None,
+            "size": len(self._entries),
+            "threshold": settings.semantic_cache_threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# 创建全局实例
+semantic_cache = SemanticAnswerCache()
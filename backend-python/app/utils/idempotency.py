@@ -0,0 +1,77 @@
+"""
+接口幂等键（Idempotency-Key 请求头）
+"""
+import functools
+import inspect
+from typing import Optional
+
+from fastapi import Header, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from ..core.config import settings
+from ..services.idempotency import IdempotencyConflict, StoredResponse, idempotency_store
+
+# 重放保存的响应时附加的响应头
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def idempotent(scope: str, payload: str = "request", status_code: int = 200):
+    """
+    为接口添加 Idempotency-Key 请求头支持
+
+    相同幂等键的重试直接返回保存的响应（带 Idempotent-Replayed: true 响应头），
+    原请求仍在执行时等待它的结果。不带请求头时照常执行。
+
+    Args:
+        scope: 接口名称，不同接口的幂等键互不影响
+        payload: 请求体参数名，同一幂等键用于不同请求体时返回 422
+        status_code: 接口成功时的状态码（与路由的 status_code 一致），重放时使用
+    """
+    def decorator(endpoint):
+        signature = inspect.signature(endpoint)
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, idempotency_key: Optional[str] = None, **kwargs):
+            if not settings.idempotency_enabled or not idempotency_key:
+                return await endpoint(*args, **kwargs)
+
+            if len(idempotency_key) > settings.idempotency_key_max_length:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Idempotency-Key must be at most {settings.idempotency_key_max_length} characters"
+                )
+
+            try:
+                result = await idempotency_store.run(
+                    scope,
+                    idempotency_key,
+                    kwargs.get(payload),
+                    lambda: endpoint(*args, **kwargs),
+                    jsonable_encoder,
+                    status_code
+                )
+            except IdempotencyConflict as error:
+                raise HTTPException(status_code=422, detail=str(error))
+
+            if isinstance(result, StoredResponse):
+                return JSONResponse(
+                    content=result.content,
+                    status_code=result.status_code,
+                    headers={REPLAYED_HEADER: "true"}
+                )
+            return result
+
+        # FastAPI 按签名解析参数：在原接口参数之后追加 Idempotency-Key 请求头
+        wrapper.__signature__ = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter(
+                "idempotency_key",
+                inspect.Parameter.KEYWORD_ONLY,
+                default=Header(None, alias="Idempotency-Key", description="幂等键，相同的重试直接返回保存的结果"),
+                annotation=Optional[str]
+            )
+        ])
+        return wrapper
+
+    return decorator
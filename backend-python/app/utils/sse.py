@@ -0,0 +1,24 @@
+"""
+Server-Sent Events 工具
+"""
+import json
+from typing import Any
+
+from fastapi.responses import StreamingResponse
+
+# 禁止代理缓冲，保证事件及时送达
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: str, data: Any) -> str:
+    """格式化为一条SSE消息"""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def sse_response(events) -> StreamingResponse:
+    """将异步事件生成器包装为 text/event-stream 响应"""
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+LangGraph 工作流编译开销基准测试
+
+对比每次请求都重新编译（旧实现）与复用启动时编译结果（当前实现）的单次请求开销。
+使用零延迟的假模型，测得的时间只包含图编译和执行本身的开销。
+
+用法（在 backend-python 目录下）：
+    python scripts/benchmark_graph_compile.py [--requests 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("ZHIPU_API_KEY", "benchmark")
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+os.environ.setdefault("QUALITY_CACHE_ENABLED", "false")
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel  # noqa: E402
+
+from app.graph.workflows import CardGenerationWorkflow  # noqa: E402
+from app.schemas.card import CardGenerationRequest  # noqa: E402
+from app.services.langgraph_service import LangGraphService  # noqa: E402
+
+ANSWER = "装饰器是一个接收函数并返回新函数的函数"
+QUALITY = "总分：85分\n是否通过：是\n存在的问题：\n改进建议：\n1. 补充示例"
+
+
+def timed(func, repeat: int) -> float:
+    """返回平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+async def timed_async(func, repeat: int) -> float:
+    """返回平均耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+async def main(requests: int):
+    service = LangGraphService()
+    service.card_workflow.nodes.llm = FakeListChatModel(responses=[ANSWER, QUALITY])
+    state = service._build_card_state(CardGenerationRequest(question="什么是装饰器？"))
+    workflow: CardGenerationWorkflow = service.card_workflow
+
+    print(f"requests per case: {requests}")
+
+    # 仅编译
+    uncached = timed(workflow.workflow.compile, requests)
+    workflow.compile()
+    cached = timed(workflow.compile, requests)
+    print(f"compile only        uncached {uncached:8.3f} ms   cached {cached:8.3f} ms")
+
+    # 批量子图：旧实现每个批次都重建并编译 StateGraph
+    nodes = service.batch_workflow.nodes
+    uncached = timed(nodes._create_card_graph, requests)
+    cached = timed(nodes.compile, requests)
+    print(f"batch card subgraph uncached {uncached:8.3f} ms   cached {cached:8.3f} ms")
+
+    # 完整请求：编译 + 执行
+    uncached = await timed_async(lambda: workflow.workflow.compile().ainvoke(state), requests)
+    cached = await timed_async(lambda: workflow.compile().ainvoke(state), requests)
+    print(f"full request        uncached {uncached:8.3f} ms   cached {cached:8.3f} ms")
+    print(f"per-request overhead saved: {uncached - cached:.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="每种情况的请求次数")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+质量检查预评分校准
+
+读取已保存的卡片（cards 表中带 quality_score 的卡片，以及批量任务中已完成条目的质检结果），
+用当前的预评分规则重新评估，并与LLM质检的结论（总分≥70为通过）对比：
+- 覆盖率：预评分把握达到阈值、可以跳过LLM质检的卡片占比
+- 一致率：跳过的卡片中，预评分结论与LLM结论一致的占比
+
+阈值通过环境变量（PRESCORE_*）调整，确认一致率满足要求后再设置 PRESCORE_ENABLED=true。
+
+用法（在 backend-python 目录下）：
+    python scripts/calibrate_prescorer.py [--db ./anki.db] [--pass-score 70] [--show-mismatches 10]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("ZHIPU_API_KEY", "calibration")
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import DATABASE_URL  # noqa: E402
+from app.schemas.card import AnkiCard  # noqa: E402
+from app.services.prescorer import PASS, quality_prescorer  # noqa: E402
+
+CONFIDENCE_LEVELS = (0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 1.0)
+
+
+def load_samples(db_path: str):
+    """读取 (问题, 答案, LLM质检分数)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        samples = []
+        if "cards" in tables:
+            samples += conn.execute(
+                "SELECT question, answer, quality_score FROM cards WHERE quality_score IS NOT NULL"
+            ).fetchall()
+        if "generation_job_items" in tables:
+            for (result,) in conn.execute(
+                "SELECT result FROM generation_job_items WHERE status = 'done' AND result IS NOT NULL"
+            ):
+                data = json.loads(result)
+                card, quality_check = data.get("card") or {}, data.get("quality_check") or {}
+                if card and quality_check.get("score") is not None:
+                    samples.append((card.get("front", ""), card.get("back", ""), quality_check["score"]))
+        return samples
+    finally:
+        conn.close()
+
+
+def main(db_path: str, pass_score: float, show_mismatches: int):
+    samples = load_samples(db_path)
+    if not samples:
+        print(f"No graded cards found in {db_path}")
+        return
+
+    evaluated = []
+    for question, answer, score in samples:
+        prescore = quality_prescorer.evaluate(AnkiCard(front=question or "", back=answer or ""))
+        evaluated.append((question, answer, score, prescore))
+
+    llm_passed = sum(1 for _, _, score, _ in evaluated if score >= pass_score)
+    print(f"Samples: {len(evaluated)} (LLM passed {llm_passed}, failed {len(evaluated) - llm_passed})")
+    print(f"Current PRESCORE_MIN_CONFIDENCE={settings.prescore_min_confidence}\n")
+
+    print(f"{'confidence>=':>12} {'coverage':>9} {'agreement':>10} {'pass':>6} {'pass ok':>8} {'fail':>6} {'fail ok':>8}")
+    for level in CONFIDENCE_LEVELS:
+        decided = [item for item in evaluated if item[3].verdict and item[3].confidence >= level]
+        passes = [item for item in decided if item[3].verdict == PASS]
+        fails = [item for item in decided if item[3].verdict != PASS]
+        pass_ok = sum(1 for item in passes if item[2] >= pass_score)
+        fail_ok = sum(1 for item in fails if item[2] < pass_score)
+        agreement = (pass_ok + fail_ok) / len(decided) if decided else 0.0
+        print(
+            f"{level:>12.2f} {len(decided) / len(evaluated):>9.1%} {agreement:>10.1%} "
+            f"{len(passes):>6} {pass_ok:>8} {len(fails):>6} {fail_ok:>8}"
+        )
+
+    rules = Counter(
+        (item[3].issues[0] if item[3].issues else item[3].verdict or "deferred") for item in evaluated
+    )
+    print("\nBy rule:")
+    for rule, count in rules.most_common():
+        print(f"  {rule}: {count}")
+
+    if show_mismatches:
+        mismatches = [
+            item for item in evaluated
+            if item[3].verdict and item[3].confidence >= settings.prescore_min_confidence
+            and (item[3].verdict == PASS) != (item[2] >= pass_score)
+        ]
+        print(f"\nMismatches at current threshold: {len(mismatches)}")
+        for question, answer, score, prescore in mismatches[:show_mismatches]:
+            print(f"- [{prescore.verdict} / LLM {score:g}] {question[:40]!r} -> {answer[:60]!r} {prescore.features}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the quality pre-scorer against stored cards")
+    parser.add_argument("--db", default=DATABASE_URL.split("///", 1)[-1], help="SQLite 数据库路径")
+    parser.add_argument("--pass-score", type=float, default=70, help="LLM质检的通过分数")
+    parser.add_argument("--show-mismatches", type=int, default=10, help="显示的不一致样本数")
+    args = parser.parse_args()
+    main(args.db, args.pass_score, args.show_mismatches)
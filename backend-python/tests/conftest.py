@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""测试共用的假模型和夹具"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.core.config import settings
+
+
+class CountingFakeLLM(GenericFakeChatModel):
+    """按顺序返回回复并记录调用次数"""
+    calls: int = 0
+
+    def _generate(self, *args, **kwargs):
+        self.calls += 1
+        return super()._generate(*args, **kwargs)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    按提示词决定回复的假模型
+
+    reply(调用序号, 最后一条消息) 返回回复文本，抛出异常时模拟调用失败；
+    delay(调用序号, 最后一条消息) 为本次调用的耗时。同步和异步调用行为一致。
+    """
+    reply: Callable[[int, str], str]
+    delay: Callable[[int, str], float] = lambda index, prompt: 0.0
+    model_name: Optional[str] = None
+    calls: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def _start(self, messages: List[BaseMessage]) -> Tuple[int, str]:
+        index = self.calls
+        self.calls += 1
+        return index, messages[-1].content
+
+    def _respond(self, index: int, prompt: str) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply(index, prompt)))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        index, prompt = self._start(messages)
+        time.sleep(self.delay(index, prompt))
+        return self._respond(index, prompt)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        index, prompt = self._start(messages)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay(index, prompt))
+        finally:
+            self.in_flight -= 1
+        return self._respond(index, prompt)
+
+
+@pytest.fixture
+def fake_llm() -> Callable[..., CountingFakeLLM]:
+    """按顺序返回给定回复的假模型"""
+    def make(*contents: str) -> CountingFakeLLM:
+        return CountingFakeLLM(messages=iter([AIMessage(content=content) for content in contents]))
+    return make
+
+
+@pytest.fixture
+def scripted_llm() -> Callable[..., ScriptedChatModel]:
+    """
+    按提示词决定回复的假模型
+
+    reply 可以是固定文本，或 (调用序号, 最后一条消息) -> 回复；delay 可以是秒数或同样签名的函数。
+    """
+    def make(reply: Union[str, Callable[[int, str], str]],
+             delay: Union[float, Callable[[int, str], float]] = 0.0,
+             **fields: Any) -> ScriptedChatModel:
+        if isinstance(reply, str):
+            reply = lambda index, prompt, content=reply: content
+        if not callable(delay):
+            delay = lambda index, prompt, seconds=delay: seconds
+        return ScriptedChatModel(reply=reply, delay=delay, **fields)
+    return make
+
+
+@pytest.fixture
+def settings_overrides() -> Dict[str, Any]:
+    """service 夹具额外修改的设置，测试模块可以重新定义该夹具或直接参数化"""
+    return {}
+
+
+@pytest.fixture
+def service(monkeypatch, settings_overrides):
+    """关闭缓存的 LangGraphService，其他设置见 settings_overrides"""
+    overrides = {
+        "answer_cache_enabled": False,
+        "quality_cache_enabled": False,
+        "zhipu_api_key": settings.zhipu_api_key or "test-key",
+        **settings_overrides,
+    }
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings, name, value)
+
+    from app.services.langgraph_service import LangGraphService
+    return LangGraphService()
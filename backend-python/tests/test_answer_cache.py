@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""测试答案缓存"""
+
+import pytest
+from app.core.cache import TTLCache
+from app.core.database import init_db
+from app.core.prompt_loader import PromptLoader
+from app.services.answer_cache import AnswerCache, normalize_question
+
+
+def test_normalize_question():
+    """测试问题规范化"""
+    assert normalize_question("什么是Python的装饰器？") == normalize_question(" 什么是Python的装饰器? ")
+    assert normalize_question("What  is\tPython?") == "what is python"
+
+
+def test_ttl_cache_lru_eviction():
+    """测试LRU淘汰"""
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None, "最久未使用的条目应被淘汰"
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+
+def test_prompt_version_changes_with_template(tmp_path):
+    """测试修改模板后提示词版本变化"""
+    category = tmp_path / "card_generation"
+    category.mkdir()
+    template = category / "generate_answer.txt"
+    template.write_text("问题：{{ question }}", encoding="utf-8")
+
+    loader = PromptLoader(str(tmp_path))
+    version = loader.get_category_hash("card_generation")
+    assert loader.get_category_hash("card_generation") == version
+
+    template.write_text("新的问题模板：{{ question }}", encoding="utf-8")
+    assert loader.get_category_hash("card_generation") != version
+    assert loader.get_prompt("card_generation", "generate_answer", question="x").startswith("新的")
+
+
+@pytest.mark.asyncio
+async def test_two_tier_cache(monkeypatch):
+    """测试内存与持久化两级缓存"""
+    await init_db()
+    monkeypatch.setattr(AnswerCache, "prompt_version", staticmethod(lambda: "test-v1"))
+
+    cache = AnswerCache()
+    assert await cache.get("测试缓存问题？", "glm-4") is None
+
+    await cache.set("测试缓存问题？", "glm-4", "缓存的答案", tokens_used=42)
+    hit = await cache.get("测试缓存问题?", "glm-4")
+    assert hit.answer == "缓存的答案"
+    assert hit.tokens_used == 42
+
+    # 新实例只能从持久化层读取
+    fresh = AnswerCache()
+    hit = await fresh.get("测试缓存问题", "glm-4")
+    assert hit is not None and hit.answer == "缓存的答案"
+    assert fresh.stats()["disk_hits"] == 1
+
+    # 提示词版本变化后不再命中
+    monkeypatch.setattr(AnswerCache, "prompt_version", staticmethod(lambda: "test-v2"))
+    assert await AnswerCache().get("测试缓存问题", "glm-4") is None
+
+
+def test_quality_check_cache():
+    """测试质量检查结果缓存"""
+    from app.schemas.card import AnkiCard, QualityCheckResult
+    from app.services.quality_cache import QualityCheckCache
+
+    cache = QualityCheckCache()
+    card = AnkiCard(front="什么是GIL？", back="全局解释器锁")
+    result = QualityCheckResult(passed=True, score=85, issues=[], suggestions=["补充示例"])
+
+    assert cache.get(card, "glm-4") is None
+    cache.set(card, "glm-4", result)
+
+    hit = cache.get(card, "glm-4")
+    assert hit == result
+    hit.suggestions.append("被修改")
+    assert cache.get(card, "glm-4").suggestions == ["补充示例"], "缓存应返回副本"
+
+    changed = AnkiCard(front="什么是GIL？", back="全局解释器锁，限制多线程并行")
+    assert cache.get(changed, "glm-4") is None, "卡片内容变化后不应命中"
+    assert cache.get(card, "glm-4-flash") is None, "不同模型不应命中"
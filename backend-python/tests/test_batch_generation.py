@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""测试LangGraph批量生成的并发执行"""
+
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.graph.nodes import BatchGenerationNodes
+
+QUALITY = "总分：85分\n是否通过：是\n存在的问题：\n改进建议：\n1. 补充示例"
+
+
+def reply(index: int, prompt: str) -> str:
+    """问题中包含"失败"时模拟调用失败"""
+    if "失败" in prompt:
+        raise RuntimeError("模拟调用失败")
+    return QUALITY
+
+
+@pytest.fixture
+def nodes(monkeypatch, scripted_llm):
+    """使用假模型、关闭缓存的批量节点"""
+    monkeypatch.setattr(settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(settings, "quality_cache_enabled", False)
+    monkeypatch.setattr(settings, "batch_concurrency", 3)
+
+    batch_nodes = BatchGenerationNodes()
+    batch_nodes.card_nodes.llm = scripted_llm(reply, delay=0.1)
+    return batch_nodes
+
+
+@pytest.mark.asyncio
+async def test_process_batch_parallel(nodes):
+    """测试批量生成并发执行且结果保持原始顺序"""
+    questions = [f"问题{i}" for i in range(6)]
+
+    start = time.perf_counter()
+    result = await nodes.process_batch({"questions": questions, "settings": {}})
+    elapsed = time.perf_counter() - start
+
+    # 每个问题两次调用（生成 + 质量检查），串行约 1.2s，并发 3 约 0.4s
+    assert elapsed < 0.8, f"批量生成应并发执行，实际耗时 {elapsed:.2f}s"
+    assert [card["card"]["front"] for card in result["cards"]] == questions
+    assert result["errors"] == []
+
+
+@pytest.mark.asyncio
+async def test_process_batch_isolates_errors(nodes):
+    """测试单个问题失败不影响其他问题"""
+    questions = ["问题A", "会失败的问题", "问题B"]
+
+    result = await nodes.process_batch({"questions": questions, "settings": {}})
+
+    assert [card["card"]["front"] for card in result["cards"]] == ["问题A", "问题B"]
+    assert len(result["errors"]) == 1
+    assert result["errors"][0]["index"] == 1
+
+
+def test_fake_model_supports_sync_invoke(scripted_llm):
+    """测试假模型的同步调用与异步调用行为一致"""
+    llm = scripted_llm(reply)
+    assert llm.invoke("问题").content == QUALITY
+    with pytest.raises(RuntimeError):
+        llm.invoke("失败的问题")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""测试多候选模式：并发生成多个候选并选分数最高的一个"""
+
+import time
+from typing import Dict, List, Optional, Sequence
+
+import pytest
+
+from app.core.config import settings
+from app.schemas.card import CardGenerationRequest
+
+QUALITY_PROMPT_MARK = "正面："
+
+
+@pytest.fixture
+def settings_overrides():
+    """关闭预评分，固定候选数"""
+    return {"prescore_enabled": False, "best_of_n_candidates": 3}
+
+
+@pytest.fixture
+def candidate_llm(scripted_llm):
+    """按调用顺序返回候选答案；质检回复按答案给出分数，delays 为各候选的生成耗时"""
+    def make(answers: List[str], scores: Dict[str, int], delays: Sequence[float] = ()):
+        def grading(prompt: str) -> Optional[str]:
+            return next((answer for answer in scores if answer in prompt and QUALITY_PROMPT_MARK in prompt), None)
+
+        def reply(index: int, prompt: str) -> str:
+            graded = grading(prompt)
+            if graded:
+                return f"总分：{scores[graded]}分\n是否通过：{'是' if scores[graded] >= 70 else '否'}"
+            return answers[index % len(answers)]
+
+        def delay(index: int, prompt: str) -> float:
+            if grading(prompt) or index >= len(delays):
+                return 0.02
+            return delays[index]
+
+        return scripted_llm(reply, delay=delay)
+    return make
+
+
+@pytest.mark.asyncio
+async def test_best_candidate_selected_without_improvement(service, candidate_llm):
+    """测试选择分数最高的候选，生成和质检各并发一轮，不进入改进流程"""
+    llm = candidate_llm(
+        answers=["答案一：较差", "答案二：最好", "答案三：一般"],
+        scores={"答案一：较差": 40, "答案二：最好": 90, "答案三：一般": 65}
+    )
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？", mode="best_of_n"))
+
+    assert result["success"], result.get("error")
+    assert result["card"].back == "答案二：最好"
+    assert result["quality_check"].score == 90
+    assert llm.calls == 6, "3个候选各生成和质检一次"
+    assert llm.max_in_flight == 3, "候选应并发生成和质检"
+    assert [candidate["score"] for candidate in result["candidates"]] == [40, 90, 65]
+    assert [candidate["selected"] for candidate in result["candidates"]] == [False, True, False]
+    assert result["token_usage"]["generate_candidates"]["calls"] == 3
+    assert result["token_usage"]["check_quality"]["calls"] == 3
+    assert "improve_card" not in result["token_usage"]
+
+
+@pytest.mark.asyncio
+async def test_low_scores_do_not_trigger_serial_improvement(service, candidate_llm):
+    """测试所有候选都不通过时也直接返回最好的候选"""
+    llm = candidate_llm(answers=["答案甲", "答案乙", "答案丙"], scores={"答案甲": 50, "答案乙": 30, "答案丙": 60})
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？", mode="best_of_n"))
+
+    assert result["card"].back == "答案丙"
+    assert llm.calls == 6
+
+
+@pytest.mark.asyncio
+async def test_latency_budget_drops_slow_candidates(service, monkeypatch, candidate_llm):
+    """测试超出延迟预算的候选被取消，只使用已完成的候选"""
+    monkeypatch.setattr(settings, "best_of_n_latency_budget", 0.2)
+    llm = candidate_llm(
+        answers=["较快的答案", "很慢的答案", "最快的答案"],
+        scores={"较快的答案": 75, "很慢的答案": 99, "最快的答案": 80},
+        delays=[0.01, 5.0, 0.01]
+    )
+    service.card_workflow.nodes.llm = llm
+
+    start = time.monotonic()
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？", mode="best_of_n"))
+
+    assert time.monotonic() - start < 2, "不应等待慢候选"
+    assert result["success"], result.get("error")
+    assert result["card"].back == "最快的答案"
+    assert len(result["candidates"]) == 2
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""测试按模型的熔断和备用模型"""
+
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+from langchain_core.messages import HumanMessage
+from app.core.config import settings
+from app.core import llm as llm_module
+from app.core.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+from app.core.llm import SamplingProfiles, invoke_llm, served_model, stream_llm
+from app.core import resilience
+
+
+def answer_from(model_name: str, failing: bool = False):
+    """假模型的回复：failing 为真时返回 503"""
+    def reply(index: int, prompt: str) -> str:
+        if failing:
+            request = httpx.Request("POST", "https://example.com/chat/completions")
+            response = httpx.Response(503, request=request)
+            raise openai.InternalServerError("unavailable", response=response, body=None)
+        return f"answer from {model_name}"
+    return reply
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    """熔断阈值调小，关闭重试等待"""
+    monkeypatch.setattr(settings, "llm_breaker_enabled", True)
+    monkeypatch.setattr(settings, "llm_breaker_window", 4)
+    monkeypatch.setattr(settings, "llm_breaker_min_calls", 2)
+    monkeypatch.setattr(settings, "llm_breaker_failure_rate", 0.5)
+    monkeypatch.setattr(settings, "llm_breaker_open_seconds", 0.05)
+    monkeypatch.setattr(settings, "llm_breaker_slow_call_ratio", 0.5)
+    monkeypatch.setattr(settings, "llm_timeout", 2.0)
+    monkeypatch.setattr(settings, "llm_fallback_model", "glm-4-flash")
+    monkeypatch.setattr(settings, "llm_max_retries", 0)
+
+
+def test_breaker_opens_and_half_opens():
+    """测试失败占比超过阈值时熔断，熔断时长后放行一个探测请求"""
+    breaker = CircuitBreaker("glm-4")
+    breaker.record(True)
+    breaker.record(False, None)
+    assert breaker.state == OPEN, "失败占比达到阈值应该熔断"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow(), "熔断时长后应该放行探测请求"
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow(), "半开时只放行一个探测请求"
+
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_slow_calls_count_as_failures():
+    """测试过慢的成功调用计为失败"""
+    breaker = CircuitBreaker("glm-4")
+    breaker.record(True, 2.0)
+    breaker.record(True, 2.0)
+    assert breaker.state == OPEN
+    assert breaker.stats()["slow"] == 2
+
+
+@pytest.mark.asyncio
+async def test_slow_call_threshold_follows_node_timeout(monkeypatch):
+    """测试慢调用阈值按节点超时计算，耗时长的批量生成不会让模型熔断"""
+    monkeypatch.setattr(settings, "llm_node_timeouts", {"generate_answer": 0.2, "generate_batch": 2.0})
+    registry = CircuitBreakerRegistry()
+    monkeypatch.setattr(resilience, "circuit_breakers", registry)
+
+    async def slow_call():
+        await asyncio.sleep(0.15)
+        return "ok"
+
+    for _ in range(3):
+        await resilience.call_with_retry(slow_call, "generate_batch", model="glm-4")
+    assert registry.get("glm-4").state == CLOSED, "未超过批量生成节点的阈值，不应熔断"
+    assert registry.get("glm-4").stats()["slow"] == 0
+
+    for _ in range(2):
+        await resilience.call_with_retry(slow_call, "generate_answer", model="glm-4")
+    assert registry.get("glm-4").state == OPEN, "超过生成答案节点的阈值，应计为失败并熔断"
+
+
+def test_select_fallback():
+    """测试主模型熔断时选择备用模型，都熔断时返回 None"""
+    registry = CircuitBreakerRegistry()
+    assert registry.select("glm-4") == "glm-4"
+
+    for _ in range(2):
+        registry.record("glm-4", False)
+    assert registry.select("glm-4") == "glm-4-flash"
+
+    for _ in range(2):
+        registry.record("glm-4-flash", False)
+    assert registry.select("glm-4") is None
+
+
+@pytest.mark.asyncio
+async def test_invoke_llm_falls_back_and_reports_model(monkeypatch, scripted_llm):
+    """测试主模型失败时改用备用模型，熔断后不再等待主模型"""
+    registry = CircuitBreakerRegistry()
+    monkeypatch.setattr(llm_module, "circuit_breakers", registry)
+    monkeypatch.setattr(resilience, "circuit_breakers", registry)
+
+    primary = scripted_llm(answer_from("glm-4", failing=True), model_name="glm-4")
+    fallback = scripted_llm(answer_from("glm-4-flash"), model_name="glm-4-flash")
+    monkeypatch.setattr(llm_module.llm_registry, "get_llm", lambda model=None, base_url=None: fallback)
+    messages = [HumanMessage(content="问题")]
+
+    response, _ = await invoke_llm(primary, messages, SamplingProfiles.GENERATION, "generate_answer")
+    assert response.content == "answer from glm-4-flash"
+    assert served_model(response) == "glm-4-flash"
+    assert primary.calls == 1
+
+    await invoke_llm(primary, messages, SamplingProfiles.GENERATION, "generate_answer")
+    assert registry.get("glm-4").state == OPEN
+
+    response, _ = await invoke_llm(primary, messages, SamplingProfiles.GENERATION, "generate_answer")
+    assert served_model(response) == "glm-4-flash"
+    assert primary.calls == 2, "熔断期间不应再调用主模型"
+
+    # 主模型恢复后，半开探测成功即恢复使用主模型
+    primary.reply = answer_from("glm-4")
+    await asyncio.sleep(0.06)
+    response, _ = await invoke_llm(primary, messages, SamplingProfiles.GENERATION, "generate_answer")
+    assert served_model(response) == "glm-4"
+    assert registry.get("glm-4").state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_stream_llm_falls_back_before_first_chunk(monkeypatch, scripted_llm):
+    """测试流式调用在输出前失败时改用备用模型，合并后的消息记录实际使用的模型"""
+    registry = CircuitBreakerRegistry()
+    monkeypatch.setattr(llm_module, "circuit_breakers", registry)
+    monkeypatch.setattr(resilience, "circuit_breakers", registry)
+
+    primary = scripted_llm(answer_from("glm-4", failing=True), model_name="glm-4")
+    fallback = scripted_llm(answer_from("glm-4-flash"), model_name="glm-4-flash")
+    monkeypatch.setattr(llm_module.llm_registry, "get_llm", lambda model=None, base_url=None: fallback)
+
+    aggregate = None
+    async for chunk in stream_llm(primary, [HumanMessage(content="问题")], SamplingProfiles.GENERATION, "generate_answer"):
+        aggregate = chunk if aggregate is None else aggregate + chunk
+
+    assert aggregate.content == "answer from glm-4-flash"
+    assert served_model(aggregate) == "glm-4-flash"
+    assert primary.calls == 1 and fallback.calls == 1
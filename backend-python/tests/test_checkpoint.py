@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""测试工作流检查点的持久化、恢复和清理"""
+
+import time
+
+import pytest
+import pytest_asyncio
+from langgraph.checkpoint.base.id import uuid6
+
+from app.core.config import settings
+from app.graph import workflows
+from app.graph.checkpoint import BoundedMemorySaver, CheckpointManager, checkpoint_timestamp
+from app.graph.workflows import CardGenerationWorkflow
+
+QUALITY = "总分：85分\n是否通过：是\n存在的问题：\n改进建议：\n1. 补充示例"
+
+
+def initial_state(question: str) -> dict:
+    return {
+        "question": question,
+        "tags": [],
+        "deck_name": "Default",
+        "card_type": "basic",
+        "use_cache": False,
+        "improvement_count": 0,
+        "max_improvements": 2,
+        "tokens_used": 0,
+        "token_usage": {},
+        "messages": [],
+    }
+
+
+@pytest_asyncio.fixture
+async def sqlite_manager(monkeypatch, tmp_path):
+    """使用临时 SQLite 文件的检查点存储"""
+    monkeypatch.setattr(settings, "checkpoint_backend", "sqlite")
+    monkeypatch.setattr(settings, "checkpoint_db_path", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setattr(settings, "checkpoint_prune_interval", 0)
+    monkeypatch.setattr(settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(settings, "quality_cache_enabled", False)
+
+    managers = []
+
+    async def open_manager():
+        manager = CheckpointManager()
+        await manager.open()
+        monkeypatch.setattr(workflows, "checkpoint_manager", manager)
+        managers.append(manager)
+        return manager
+
+    yield open_manager
+    for manager in managers:
+        await manager.close()
+
+
+def test_checkpoint_timestamp():
+    """测试从检查点ID读取创建时间"""
+    assert abs(checkpoint_timestamp(str(uuid6())) - time.time()) < 1
+
+
+@pytest.mark.asyncio
+async def test_resume_after_restart(sqlite_manager, scripted_llm):
+    """测试进程重启后使用相同 thread_id 从最后完成的节点继续"""
+    manager = await sqlite_manager()
+    assert manager.backend == "sqlite"
+
+    workflow = CardGenerationWorkflow()
+    workflow.nodes.llm = scripted_llm(QUALITY)
+    app = workflow.compile(use_memory=True)
+    config = {"configurable": {"thread_id": "resume-test"}}
+
+    # 模拟在质量检查前中断
+    async for update in app.astream(initial_state("什么是装饰器？"), config=config,
+                                 stream_mode="updates", durability="sync"):
+        if "create_card" in update:
+            break
+    assert workflow.nodes.llm.calls == 1
+    await manager.close()
+
+    # 重启：新的检查点连接和工作流实例
+    await sqlite_manager()
+    restarted = CardGenerationWorkflow()
+    restarted.nodes.llm = scripted_llm(QUALITY)
+    result = await restarted.run(initial_state("什么是装饰器？"), use_memory=True, thread_id="resume-test")
+
+    assert result["final_card"].front == "什么是装饰器？"
+    assert result["final_quality_check"].score == 85
+    assert restarted.nodes.llm.calls == 1, "恢复后只应执行剩余的质量检查"
+
+    # 已完成的 thread 直接返回保存的结果
+    again = await restarted.run(initial_state("什么是装饰器？"), use_memory=True, thread_id="resume-test")
+    assert again["final_card"].back == result["final_card"].back
+    assert restarted.nodes.llm.calls == 1, "已完成的 thread 不应再次调用模型"
+
+
+@pytest.mark.asyncio
+async def test_prune_expired_threads(sqlite_manager, scripted_llm):
+    """测试按TTL清理检查点"""
+    manager = await sqlite_manager()
+    workflow = CardGenerationWorkflow()
+    workflow.nodes.llm = scripted_llm(QUALITY)
+    await workflow.run(initial_state("问题"), use_memory=True, thread_id="prune-test")
+
+    assert await manager.prune(ttl=3600) == 0, "未过期的 thread 不应被清理"
+    assert await manager.prune(ttl=0) == 1
+    snapshot = await workflow.compile(use_memory=True).aget_state({"configurable": {"thread_id": "prune-test"}})
+    assert not snapshot.values
+
+
+@pytest.fixture
+def bounded_manager(monkeypatch):
+    """使用小容量内存检查点的存储"""
+    monkeypatch.setattr(settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(settings, "quality_cache_enabled", False)
+
+    manager = CheckpointManager()
+    manager.saver = BoundedMemorySaver(max_threads=2, ttl=3600)
+    monkeypatch.setattr(workflows, "checkpoint_manager", manager)
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_bounded_memory_evicts_oldest_threads(bounded_manager, scripted_llm):
+    """测试内存检查点超过 thread 上限时淘汰最久未更新的 thread"""
+    workflow = CardGenerationWorkflow()
+    workflow.nodes.llm = scripted_llm(QUALITY)
+    for thread_id in ["t1", "t2", "t3"]:
+        await workflow.run(initial_state("问题"), use_memory=True, thread_id=thread_id)
+
+    saver = bounded_manager.saver
+    assert set(saver.storage) == {"t2", "t3"}
+    assert saver.evictions == 1
+    assert not any(key[0] == "t1" for key in saver.blobs), "被淘汰 thread 的数据应一并删除"
+
+    footprint = saver.footprint()
+    assert footprint["threads"] == 2
+    assert footprint["checkpoints"] > 0 and footprint["bytes"] > 0
+
+
+@pytest.mark.asyncio
+async def test_bounded_memory_evicts_expired_threads(bounded_manager, scripted_llm):
+    """测试内存检查点按TTL淘汰"""
+    saver = bounded_manager.saver
+    saver.ttl = 0.05
+    workflow = CardGenerationWorkflow()
+    workflow.nodes.llm = scripted_llm(QUALITY)
+
+    await workflow.run(initial_state("问题"), use_memory=True, thread_id="old")
+    time.sleep(0.1)
+    await workflow.run(initial_state("问题"), use_memory=True, thread_id="new")
+
+    assert set(saver.storage) == {"new"}
+
+
+@pytest.mark.asyncio
+async def test_unique_thread_per_request(bounded_manager, scripted_llm):
+    """测试未指定 thread_id 时每个请求使用独立的 thread，查询不存在的 thread 不留下空条目"""
+    workflow = CardGenerationWorkflow()
+    workflow.nodes.llm = scripted_llm(QUALITY)
+
+    first = await workflow.run(initial_state("问题A"), use_memory=True)
+    second = await workflow.run(initial_state("问题A"), use_memory=True)
+
+    assert len(first["messages"]) == len(second["messages"]), "不同请求的消息历史不应累积"
+    assert bounded_manager.saver.footprint()["threads"] == 2
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_requires_package(monkeypatch, tmp_path):
+    """测试配置 sqlite 后端但未安装 langgraph-checkpoint-sqlite 时启动失败，而不是回退到内存"""
+    from app.graph import checkpoint
+
+    monkeypatch.setattr(settings, "checkpoint_backend", "sqlite")
+    monkeypatch.setattr(settings, "checkpoint_db_path", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setattr(checkpoint, "AsyncSqliteSaver", None)
+
+    with pytest.raises(RuntimeError, match="langgraph-checkpoint-sqlite"):
+        await CheckpointManager().open()
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_fails_when_database_cannot_open(monkeypatch, tmp_path):
+    """测试 sqlite 后端无法打开数据库时启动失败并关闭连接，而不是回退到内存"""
+    monkeypatch.setattr(settings, "checkpoint_backend", "sqlite")
+    monkeypatch.setattr(settings, "checkpoint_db_path", str(tmp_path / "missing" / "checkpoints.db"))
+
+    manager = CheckpointManager()
+    with pytest.raises(RuntimeError, match="Error opening checkpoint database"):
+        await manager.open()
+    assert manager.backend == "memory"
+    assert manager._conn is None
+
+
+@pytest.mark.asyncio
+async def test_failed_generation_returns_thread_id(bounded_manager, monkeypatch):
+    """测试生成失败时结果中带 thread_id，便于从检查点重试"""
+    monkeypatch.setattr(settings, "zhipu_api_key", settings.zhipu_api_key or "test-key")
+    from app.schemas.card import CardGenerationRequest
+    from app.services.langgraph_service import LangGraphService
+
+    service = LangGraphService()
+
+    async def fail(*args, **kwargs):
+        raise RuntimeError("upstream unavailable")
+
+    monkeypatch.setattr(service.card_workflow, "run", fail)
+    result = await service.generate_card(CardGenerationRequest(question="问题A", thread_id="retry-me"))
+
+    assert result["success"] is False
+    assert result["thread_id"] == "retry-me"
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""测试有界并发调度"""
+
+import asyncio
+import time
+
+import pytest
+from app.core.concurrency import gather_within, run_bounded
+
+
+@pytest.mark.asyncio
+async def test_run_bounded_keeps_order_and_errors():
+    """测试结果按原始顺序返回，单个失败不影响其他条目"""
+    async def worker(index, item):
+        await asyncio.sleep(0.01 * (5 - index))
+        if item == "bad":
+            raise ValueError("失败")
+        return item.upper()
+
+    results = await run_bounded(["a", "b", "bad", "c", "d"], worker, 2)
+
+    assert results[:2] == ["A", "B"]
+    assert isinstance(results[2], ValueError), "失败的条目应返回异常"
+    assert results[3:] == ["C", "D"]
+
+
+@pytest.mark.asyncio
+async def test_run_bounded_sliding_window():
+    """测试慢任务不阻塞其余槽位，且并发数不超过上限"""
+    in_flight = 0
+    peak = 0
+
+    async def worker(index, delay):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(delay)
+        in_flight -= 1
+        return index
+
+    # 一个慢任务 + 8 个快任务；按块执行需要约 0.3s，滑动窗口约 0.2s
+    delays = [0.2] + [0.05] * 8
+    start = time.perf_counter()
+    results = await run_bounded(delays, worker, 3)
+    elapsed = time.perf_counter() - start
+
+    assert results == list(range(9))
+    assert peak == 3, "同时执行的任务数应达到且不超过上限"
+    assert elapsed < 0.28, f"慢任务不应阻塞其他槽位，实际耗时 {elapsed:.2f}s"
+
+
+@pytest.mark.asyncio
+async def test_run_bounded_empty():
+    """测试空列表"""
+    async def worker(index, item):
+        return item
+
+    assert await run_bounded([], worker, 5) == []
+
+
+@pytest.mark.asyncio
+async def test_gather_within_cancels_after_timeout():
+    """测试超时后取消未完成的任务，结果与输入顺序对齐"""
+    async def job(delay, value):
+        await asyncio.sleep(delay)
+        if value is None:
+            raise ValueError("失败")
+        return value
+
+    start = time.monotonic()
+    results = await gather_within([job(0.01, "a"), job(1.0, "b"), job(0.01, None)], 0.05)
+
+    assert time.monotonic() - start < 0.5, "超时后不应等待慢任务"
+    assert results[0] == "a"
+    assert results[1] is None, "被取消的任务应返回 None"
+    assert isinstance(results[2], ValueError)
+
+
+@pytest.mark.asyncio
+async def test_gather_within_waits_for_first_success():
+    """测试超时时还没有成功的任务，等到第一个成功为止"""
+    async def job(delay):
+        await asyncio.sleep(delay)
+        return delay
+
+    results = await gather_within([job(0.05), job(1.0)], 0.01)
+
+    assert results == [0.05, None]
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""测试改进循环的提前停止"""
+
+import pytest
+
+from app.graph.convergence import MAX_ROUNDS, STALLED, same_text, stop_reason
+from app.schemas.card import AnkiCard, CardGenerationRequest, QualityCheckResult
+
+ANSWER = "装饰器是一个函数。"
+
+
+def quality(score: int) -> str:
+    """质量检查回复"""
+    return f"总分：{score}分\n是否通过：{'是' if score >= 70 else '否'}\n存在的问题：\n1. 缺少示例\n改进建议：\n1. 补充示例"
+
+
+def improved(back: str) -> str:
+    """改进卡片回复"""
+    return f"改进的正面：什么是装饰器？\n改进的背面：{back}"
+
+
+@pytest.fixture
+def settings_overrides():
+    """关闭预评分，固定改进的最小分数提升"""
+    return {"prescore_enabled": False, "improvement_min_gain": 5}
+
+
+LONG_ANSWER = (
+    "二分查找在有序数组中查找目标值：每次比较中间元素，目标较小时在左半部分继续查找，"
+    "目标较大时在右半部分继续查找，直到找到目标或区间为空。由于每一步都把查找区间缩小一半，"
+    "最坏情况下的比较次数与数组长度的对数成正比，因此时间复杂度为O(n)，空间复杂度为O(1)。"
+    "它要求数组已经排好序，并且支持随机访问，因此不适合直接用于链表。"
+)
+FIXED_ANSWER = LONG_ANSWER.replace("时间复杂度为O(n)", "时间复杂度为O(log n)")
+
+
+def test_same_text():
+    """测试只有空白差异时视为相同，一个词的修正视为有变化"""
+    card = AnkiCard(front="问题", back=ANSWER)
+    assert same_text(card, AnkiCard(front="问题 ", back=f"{ANSWER}\n"))
+    assert not same_text(
+        AnkiCard(front="二分查找的复杂度？", back=LONG_ANSWER),
+        AnkiCard(front="二分查找的复杂度？", back=FIXED_ANSWER)
+    )
+
+
+def test_stop_reason():
+    """测试分数轨迹的判断"""
+    state = {"quality_check": QualityCheckResult(passed=False, score=50, issues=[], suggestions=[]), "improvement_count": 1,
+             "max_improvements": 3, "score_history": [40, 50]}
+    assert stop_reason(state) is None, "分数提升足够时继续改进"
+    assert stop_reason({**state, "score_history": [48, 50]}) == STALLED
+    assert stop_reason({**state, "improvement_count": 3}) == MAX_ROUNDS
+
+
+@pytest.mark.asyncio
+async def test_stalled_score_stops_early(service, fake_llm):
+    """测试一轮改进后分数没有明显提升时停止，并记录省下的轮数"""
+    llm = fake_llm(ANSWER, quality(40), improved("装饰器可以在不修改原函数的情况下扩展功能。"), quality(42))
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？"))
+
+    assert result["success"], result.get("error")
+    assert llm.calls == 4, "分数停滞时不应进行第二轮改进"
+    assert result["quality_check"].score == 42
+    assert result["improvement"] == {"reason": "stalled", "rounds": 1, "rounds_saved": 1, "score_history": [40, 42]}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("settings_overrides", [{"prescore_enabled": False, "improvement_min_gain": 1}])
+async def test_small_gain_continues_with_lower_threshold(service, fake_llm):
+    """测试降低最小分数提升后，小幅提升仍继续改进"""
+    llm = fake_llm(
+        ANSWER, quality(40),
+        improved("装饰器可以在不修改原函数的情况下扩展功能。"), quality(42),
+        improved("装饰器可以在不修改原函数的情况下扩展功能，例如 @cache。"), quality(45)
+    )
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？"))
+
+    assert llm.calls == 6
+    assert result["improvement"]["reason"] == "max_rounds"
+    assert result["improvement"]["score_history"] == [40, 42, 45]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_card_skips_recheck(service, fake_llm):
+    """测试改进回复无法解析（卡片没有变化）时跳过重新质检"""
+    llm = fake_llm(ANSWER, quality(40), "无法改进")
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？"))
+
+    assert result["success"], result.get("error")
+    assert llm.calls == 3, "卡片没有变化时不应重新质检"
+    assert result["card"].back == ANSWER
+    assert result["quality_check"].score == 40
+    assert result["improvement"]["reason"] == "unchanged"
+    assert result["improvement"]["rounds_saved"] == 1
+    assert "check_quality" in result["token_usage"] and result["token_usage"]["check_quality"]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_improving_scores_use_all_rounds(service, fake_llm):
+    """测试分数持续提升时仍按上限改进"""
+    llm = fake_llm(
+        ANSWER, quality(30),
+        improved("装饰器接收一个函数并返回新函数。"), quality(50),
+        improved("装饰器接收一个函数并返回新函数，例如 @cache 可以缓存结果。"), quality(65)
+    )
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？"))
+
+    assert llm.calls == 6
+    assert result["improvement"] == {"reason": "max_rounds", "rounds": 2, "rounds_saved": 0, "score_history": [30, 50, 65]}
+
+
+@pytest.mark.asyncio
+async def test_one_token_fix_is_kept(service, fake_llm):
+    """测试一个词的事实修正不会被当作没有变化而丢弃"""
+    llm = fake_llm(
+        LONG_ANSWER, quality(50),
+        f"改进的正面：二分查找的复杂度？\n改进的背面：{FIXED_ANSWER}", quality(90)
+    )
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="二分查找的复杂度？"))
+
+    assert result["success"], result.get("error")
+    assert result["card"].back == FIXED_ANSWER
+    assert result["quality_check"].score == 90
+    assert result["improvement"]["reason"] == "passed"
+
+
+@pytest.mark.asyncio
+async def test_improve_endpoint_keeps_one_token_fix(service, fake_llm):
+    """测试独立的改进工作流同样保留一个词的修正"""
+    service.improvement_workflow.nodes.llm = fake_llm(
+        f"改进的正面：二分查找的复杂度？\n改进的背面：{FIXED_ANSWER}", quality(90)
+    )
+
+    result = await service.improvement_workflow.run_improvement(
+        AnkiCard(front="二分查找的复杂度？", back=LONG_ANSWER), ["复杂度错误"], ["改为 O(log n)"]
+    )
+
+    assert result["improved_card"].back == FIXED_ANSWER
+    assert result["quality_check"].score == 90
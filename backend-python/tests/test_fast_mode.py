@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""测试快速模式：一次调用生成答案并自评"""
+
+import json
+
+import pytest
+
+from app.schemas.card import CardGenerationRequest
+
+ANSWER = "装饰器是一个接收函数并返回新函数的函数。"
+QUALITY = "总分：85分\n是否通过：是\n存在的问题：\n改进建议：\n1. 补充示例"
+
+
+def graded(score: int, confidence: float) -> str:
+    """快速模式的JSON回复"""
+    return json.dumps({
+        "answer": ANSWER,
+        "score": score,
+        "confidence": confidence,
+        "issues": [] if score >= 70 else ["缺少示例"],
+        "suggestions": []
+    }, ensure_ascii=False)
+
+
+@pytest.mark.asyncio
+async def test_confident_self_grade_skips_quality_check(service, fake_llm):
+    """测试自评可信时只调用一次模型"""
+    llm = fake_llm(graded(88, 0.9))
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？", mode="fast"))
+
+    assert result["success"], result.get("error")
+    assert llm.calls == 1, "自评可信时不应再调用质量检查"
+    assert result["card"].back == ANSWER
+    assert result["quality_check"].score == 88
+    assert result["self_graded"] is True
+    assert set(result["token_usage"]) == {"generate_graded"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("score, confidence", [(88, 0.3), (72, 0.9)])
+async def test_uncertain_self_grade_falls_back_to_quality_check(service, score, confidence, fake_llm):
+    """测试自评把握不足或分数接近通过线时仍调用质量检查"""
+    llm = fake_llm(graded(score, confidence), QUALITY)
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？", mode="fast"))
+
+    assert result["success"], result.get("error")
+    assert llm.calls == 2
+    assert result["quality_check"].score == 85, "应采用质量检查的评分"
+    assert result["self_graded"] is False
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reply", [
+    ANSWER,
+    graded(88, 0.9)[:40],  # 被 max_tokens 截断的JSON
+])
+async def test_unparseable_reply_falls_back_to_standard_generation(service, monkeypatch, reply, fake_llm):
+    """测试回复不是完整的JSON时不缓存该回复，改用标准流程生成答案并质检"""
+    from app.graph import nodes as nodes_module
+
+    cached = []
+
+    async def record_set(question, model, answer, tokens_used=0):
+        cached.append(answer)
+
+    monkeypatch.setattr(nodes_module.answer_cache, "set", record_set)
+    llm = fake_llm(reply, ANSWER, QUALITY)
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？", mode="fast"))
+
+    assert result["success"], result.get("error")
+    assert result["card"].back == ANSWER
+    assert llm.calls == 3
+    assert cached == [ANSWER], "无法解析的回复不应写入答案缓存"
+    assert set(result["token_usage"]) == {"generate_graded", "generate_answer", "check_quality"}
+    assert result["self_graded"] is False
+
+
+def test_graded_profile_uses_json_mode(fake_llm):
+    """测试快速模式的调用要求模型返回JSON对象"""
+    from app.core.llm import SamplingProfiles
+
+    bound = SamplingProfiles.GRADED_GENERATION.bind(fake_llm())
+    assert bound.kwargs["response_format"] == {"type": "json_object"}
+
+
+@pytest.mark.asyncio
+async def test_low_self_grade_triggers_improvement(service, fake_llm):
+    """测试自评可信但不通过时进入改进流程"""
+    improved = "改进的正面：什么是装饰器？\n改进的背面：装饰器用于在不修改函数的情况下扩展其功能。"
+    llm = fake_llm(graded(40, 0.9), improved, QUALITY)
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？", mode="fast"))
+
+    assert result["success"], result.get("error")
+    assert llm.calls == 3
+    assert result["quality_check"].score == 85
+    assert result["self_graded"] is False
+
+
+@pytest.mark.asyncio
+async def test_standard_mode_unchanged(service, fake_llm):
+    """测试默认模式仍分别生成和质检"""
+    llm = fake_llm(ANSWER, QUALITY)
+    service.card_workflow.nodes.llm = llm
+
+    result = await service.generate_card(CardGenerationRequest(question="什么是装饰器？"))
+
+    assert llm.calls == 2
+    assert set(result["token_usage"]) == {"generate_answer", "check_quality"}
+    assert result["self_graded"] is False
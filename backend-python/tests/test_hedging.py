@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""测试LLM请求对冲"""
+
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+from app.core.config import settings
+from app.core.hedging import HedgingController
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    """开启对冲并使用较小的样本要求"""
+    monkeypatch.setattr(settings, "llm_hedge_enabled", True)
+    monkeypatch.setattr(settings, "llm_hedge_nodes", ["generate_answer"])
+    monkeypatch.setattr(settings, "llm_hedge_percentile", 0.9)
+    monkeypatch.setattr(settings, "llm_hedge_min_samples", 5)
+    monkeypatch.setattr(settings, "llm_hedge_min_delay", 0.01)
+    monkeypatch.setattr(settings, "llm_hedge_budget_per_minute", 10)
+    controller = HedgingController()
+    for _ in range(10):
+        controller.record_latency("generate_answer", 0.02)
+    return controller
+
+
+def test_hedge_delay_needs_samples(controller):
+    """测试样本不足时不对冲，样本足够时使用分位数"""
+    assert controller.hedge_delay("check_quality") is None
+    assert controller.hedge_delay("generate_answer") == pytest.approx(0.02)
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_and_cancels_slow_call(controller):
+    """测试原请求过慢时对冲请求胜出，原请求被取消"""
+    delays = [5.0, 0.01]
+    cancelled = []
+
+    async def call():
+        delay = delays.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await controller.run(call, "generate_answer") == 0.01
+    assert loop.time() - started < 1.0, "对冲后应该不再等待慢请求"
+
+    await asyncio.sleep(0)
+    assert cancelled == [5.0], "落后的请求应该被取消"
+    assert controller.counters["generate_answer"] == {"calls": 1, "hedged": 1, "hedge_wins": 1}
+
+
+@pytest.mark.asyncio
+async def test_fast_call_is_not_hedged(controller):
+    """测试在分位数之前返回的请求不发出对冲"""
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        return "ok"
+
+    assert await controller.run(call, "generate_answer") == "ok"
+    assert calls == 1
+    assert "hedged" not in controller.counters["generate_answer"]
+
+
+@pytest.mark.asyncio
+async def test_hedge_budget(controller, monkeypatch):
+    """测试每分钟预算用完后不再对冲"""
+    monkeypatch.setattr(settings, "llm_hedge_budget_per_minute", 1)
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    await controller.run(call, "generate_answer")
+    await controller.run(call, "generate_answer")
+
+    assert calls == 3, "第二次调用超出预算，不应该发出对冲请求"
+    counters = controller.counters["generate_answer"]
+    assert counters["hedged"] == 1
+    assert counters["budget_exhausted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedge_falls_back_when_one_call_fails(controller):
+    """测试对冲请求失败时仍然等待原请求的结果"""
+    outcomes = [0.05, None]
+
+    async def call():
+        delay = outcomes.pop(0)
+        if delay is None:
+            raise RuntimeError("hedge failed")
+        await asyncio.sleep(delay)
+        return "primary"
+
+    assert await controller.run(call, "generate_answer") == "primary"
+    assert "hedge_wins" not in controller.counters["generate_answer"]
+
+
+@pytest.mark.asyncio
+async def test_disabled_for_other_nodes_and_streaming(controller):
+    """测试未配置的节点和流式调用不对冲"""
+    assert not controller.enabled_for("check_quality")
+    assert controller.enabled_for("generate_answer")
+
+    check = RunnableLambda(lambda _: controller.enabled_for("generate_answer"))
+    assert await check.ainvoke(None, config={"configurable": {"llm_hedging": False}}) is False
+
+
+@pytest.mark.asyncio
+async def test_invoke_llm_uses_hedging(controller, monkeypatch):
+    """测试 invoke_llm 经过对冲层"""
+    from app.core import llm as llm_module
+    from app.core.llm import SamplingProfiles, invoke_llm
+
+    monkeypatch.setattr(llm_module, "hedging", controller)
+    llm = FakeListChatModel(responses=["answer"])
+
+    response, _ = await invoke_llm(llm, [], SamplingProfiles.GENERATION, "generate_answer")
+    assert response.content == "answer"
+    assert controller.counters["generate_answer"]["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedge_takes_its_own_limiter_slot(controller, monkeypatch):
+    """测试对冲请求占用自己的并发槽位，原请求的延迟计入延迟统计"""
+    from app.core import hedging as hedging_module
+    from app.core.limiter import AdaptiveLimiter
+
+    monkeypatch.setattr(settings, "llm_limiter_enabled", True)
+    monkeypatch.setattr(settings, "llm_limiter_initial", 2)
+    limiter = AdaptiveLimiter()
+    monkeypatch.setattr(hedging_module, "llm_limiter", limiter)
+
+    delays = [0.2, 0.01]
+    inflight = []
+
+    async def call():
+        delay = delays.pop(0)
+        inflight.append(limiter.inflight)
+        await asyncio.sleep(delay)
+        return delay
+
+    async with limiter.slot("generate_answer"):
+        assert await controller.run(call, "generate_answer") == 0.01
+
+    assert inflight == [1, 2], "对冲请求应该占用一个新的槽位"
+    await asyncio.sleep(0)
+    assert limiter.inflight == 0, "对冲请求结束后应该归还槽位"
+    assert controller._latencies["generate_answer"][-1] >= 0.02, "应该记录原请求等待的时长，而不是对冲请求的延迟"
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_free_slot(controller, monkeypatch):
+    """测试并发窗口已满时不发出对冲请求，也不占用对冲预算"""
+    from app.core import hedging as hedging_module
+    from app.core.limiter import AdaptiveLimiter
+
+    monkeypatch.setattr(settings, "llm_limiter_enabled", True)
+    monkeypatch.setattr(settings, "llm_limiter_initial", 1)
+    limiter = AdaptiveLimiter()
+    monkeypatch.setattr(hedging_module, "llm_limiter", limiter)
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async with limiter.slot("generate_answer"):
+        assert await controller.run(call, "generate_answer") == "ok"
+
+    assert calls == 1, "窗口已满时不应该对冲"
+    counters = controller.counters["generate_answer"]
+    assert counters["no_slot"] == 1
+    assert "hedged" not in counters
+    assert controller.stats()["budget_used"] == 0
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""测试生成接口的幂等键"""
+
+import asyncio
+from uuid import uuid4
+
+import pytest
+import pytest_asyncio
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.database import init_db
+from app.services.idempotency import IdempotencyConflict, IdempotencyStore, StoredResponse
+
+ANSWER = "装饰器是一个接收函数并返回新函数的函数。"
+QUALITY = "总分：85分\n是否通过：是\n存在的问题：\n改进建议：\n1. 补充示例"
+
+
+@pytest.fixture(autouse=True)
+def disable_caches(monkeypatch):
+    """关闭缓存，保证没有幂等键时每次都调用模型"""
+    monkeypatch.setattr(settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(settings, "quality_cache_enabled", False)
+    monkeypatch.setattr(settings, "prescore_enabled", False)
+    monkeypatch.setattr(settings, "idempotency_enabled", True)
+
+
+@pytest_asyncio.fixture
+async def store():
+    """独立的幂等键存储"""
+    await init_db()
+    return IdempotencyStore()
+
+
+def test_retry_replays_stored_response(monkeypatch, fake_llm):
+    """测试相同幂等键的重试返回保存的响应，不再调用模型"""
+    from app.main import app
+    from app.api.v1.endpoints import cards
+
+    # 只够一次生成和质检，重新执行会因为没有回复而失败
+    monkeypatch.setattr(cards.ai_service, "llm", fake_llm(ANSWER, QUALITY))
+    headers = {"Idempotency-Key": uuid4().hex}
+    body = {"question": "什么是装饰器？"}
+
+    with TestClient(app) as client:
+        first = client.post("/api/v1/cards/generate", json=body, headers=headers)
+        retry = client.post("/api/v1/cards/generate", json=body, headers=headers)
+        conflict = client.post("/api/v1/cards/generate", json={"question": "什么是GIL？"}, headers=headers)
+
+    assert first.status_code == 200
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json(), "重试应返回与原请求相同的响应"
+    assert conflict.status_code == 422, "同一幂等键不能用于不同的请求"
+
+
+def test_failed_request_is_not_stored(monkeypatch, fake_llm):
+    """测试失败的请求不保存，重试时重新执行"""
+    from app.main import app
+    from app.api.v1.endpoints import cards
+
+    monkeypatch.setattr(cards.ai_service, "llm", fake_llm("", ANSWER, QUALITY))
+    headers = {"Idempotency-Key": uuid4().hex}
+
+    with TestClient(app) as client:
+        failed = client.post("/api/v1/cards/generate", json={"question": "什么是装饰器？"}, headers=headers)
+        retry = client.post("/api/v1/cards/generate", json={"question": "什么是装饰器？"}, headers=headers)
+
+    assert failed.status_code == 500
+    assert retry.status_code == 200
+    assert "Idempotent-Replayed" not in retry.headers
+    assert retry.json()["data"]["card"]["back"] == ANSWER
+
+
+def test_job_creation_retry_returns_same_job(monkeypatch):
+    """测试创建任务的重试返回原任务和 202 状态码，不重复创建"""
+    from app.main import app
+    from app.api.v1.endpoints import jobs
+    from app.schemas.job import JobStatus
+
+    created = []
+
+    async def create_job(questions, job_settings):
+        created.append(questions)
+        return JobStatus(id=uuid4().hex, status="pending", total=len(questions),
+                         completed=0, failed=0, pending=len(questions), progress=0.0)
+
+    monkeypatch.setattr(jobs.job_service, "create_job", create_job)
+    headers = {"Idempotency-Key": uuid4().hex}
+    body = {"questions": ["什么是装饰器？", "什么是GIL？"]}
+
+    with TestClient(app) as client:
+        first = client.post("/api/v1/jobs/", json=body, headers=headers)
+        retry = client.post("/api/v1/jobs/", json=body, headers=headers)
+
+    assert first.status_code == 202
+    assert retry.status_code == 202, "重放应保留原接口的状态码"
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["data"]["id"] == first.json()["data"]["id"]
+    assert len(created) == 1, "重试不应创建新任务"
+
+
+@pytest.mark.asyncio
+async def test_retry_attaches_to_in_flight_request(store):
+    """测试原请求仍在执行时，重试等待它的结果而不是再执行一次"""
+    executions = 0
+
+    async def call():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.05)
+        return {"answer": ANSWER}
+
+    key = uuid4().hex
+    first, retry = await asyncio.gather(
+        store.run("cards/generate", key, {"question": "问题"}, call, dict),
+        store.run("cards/generate", key, {"question": "问题"}, call, dict)
+    )
+
+    assert executions == 1
+    assert first == retry == {"answer": ANSWER}
+    assert store.stats()["attached"] == 1
+
+    replayed = await store.run("cards/generate", key, {"question": "问题"}, call, dict)
+    assert isinstance(replayed, StoredResponse) and replayed.content == {"answer": ANSWER}
+    assert executions == 1
+
+    with pytest.raises(IdempotencyConflict):
+        await store.run("cards/generate", key, {"question": "另一个问题"}, call, dict)
+
+    # 不同接口的幂等键互不影响
+    await store.run("cards-langgraph/generate", key, {"question": "问题"}, call, dict)
+    assert executions == 2
+
+
+@pytest.mark.asyncio
+async def test_expired_records_are_ignored(store, monkeypatch):
+    """测试超过保存时间的记录不再重放"""
+    executions = 0
+
+    async def call():
+        nonlocal executions
+        executions += 1
+        return {"count": executions}
+
+    key = uuid4().hex
+    await store.run("cards/quality-check", key, {"front": "问题"}, call, dict)
+    monkeypatch.setattr(settings, "idempotency_ttl", -1)
+
+    result = await store.run("cards/quality-check", key, {"front": "问题"}, call, dict)
+    assert result == {"count": 2}
+    assert await store.prune() >= 1
+
+
+@pytest.mark.asyncio
+async def test_degraded_result_reaches_singleflight_followers(store, monkeypatch, scripted_llm):
+    """测试合并后的质检返回降级结果时，发起者和等待者的请求都不保存"""
+    from app.services.ai_service import AIService
+    from app.schemas.card import AnkiCard
+
+    monkeypatch.setattr(settings, "singleflight_enabled", True)
+    monkeypatch.setattr(settings, "zhipu_api_key", settings.zhipu_api_key or "test-key")
+    service = AIService()
+    service.llm = scripted_llm("", delay=0.05)
+    card = AnkiCard(front=f"什么是装饰器？{uuid4().hex}", back=ANSWER)
+
+    async def check():
+        return (await service.quality_check(card)).model_dump()
+
+    leader, follower = await asyncio.gather(
+        store.run("cards/quality-check", uuid4().hex, card, check, dict),
+        store.run("cards/quality-check", uuid4().hex, card, check, dict)
+    )
+
+    assert service.llm.calls == 1, "相同卡片的质检应合并为一次调用"
+    assert leader["score"] == follower["score"] == 0
+    assert store.stats()["degraded"] == 2, "等待者拿到的同样是降级结果，也不应保存"
+
+
+def test_degraded_quality_check_is_not_stored(monkeypatch, scripted_llm):
+    """测试LLM调用失败后返回的降级结果（200，0分）不保存，重试时重新执行"""
+    from app.main import app
+    from app.api.v1.endpoints import cards
+
+    def fail_first(index: int, prompt: str) -> str:
+        if index == 0:
+            raise RuntimeError("模拟调用失败")
+        return QUALITY
+
+    monkeypatch.setattr(settings, "llm_max_retries", 0)
+    monkeypatch.setattr(settings, "llm_breaker_enabled", False)
+    monkeypatch.setattr(cards.ai_service, "llm", scripted_llm(fail_first))
+    headers = {"Idempotency-Key": uuid4().hex}
+    card = {"front": "什么是装饰器？", "back": ANSWER}
+
+    with TestClient(app) as client:
+        degraded = client.post("/api/v1/cards/quality-check", json=card, headers=headers)
+        retry = client.post("/api/v1/cards/quality-check", json=card, headers=headers)
+        replay = client.post("/api/v1/cards/quality-check", json=card, headers=headers)
+
+    assert degraded.status_code == 200 and degraded.json()["data"]["score"] == 0
+    assert "Idempotent-Replayed" not in retry.headers, "降级结果不应被重放"
+    assert retry.json()["data"]["score"] == 85
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert replay.json()["data"]["score"] == 85
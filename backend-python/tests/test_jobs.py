@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""测试异步批量生成任务"""
+
+import asyncio
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.core.database import Base
+from app.models.job import GenerationJob, GenerationJobItem
+from app.schemas.card import AnkiCard, QualityCheckResult
+from app.services import job_service as job_service_module
+from app.services.job_service import JobService
+
+
+class FakeGenerator:
+    """假的单卡生成服务，问题中包含"失败"时返回错误"""
+
+    def __init__(self, gate: asyncio.Event = None):
+        self.gate = gate
+        self.questions = []
+
+    async def generate_card(self, request):
+        self.questions.append(request.question)
+        if self.gate:
+            await self.gate.wait()
+        if "失败" in request.question:
+            return {"success": False, "error": "模拟生成失败"}
+        return {
+            "success": True,
+            "card": AnkiCard(front=request.question, back="答案", deck_name=request.deck_name),
+            "quality_check": QualityCheckResult(passed=True, score=90, issues=[], suggestions=[]),
+            "tokens_used": 10
+        }
+
+
+@pytest_asyncio.fixture
+async def job_db(tmp_path, monkeypatch):
+    """使用临时 SQLite 文件保存任务，测试结束后不在 anki.db 中留下数据"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(job_service_module, "AsyncSessionLocal", session_factory)
+    yield session_factory
+    await engine.dispose()
+
+
+async def wait_job(service: JobService, job_id: str):
+    """等待后台任务结束"""
+    task = service._tasks.get(job_id)
+    if task:
+        await task
+
+
+@pytest.mark.asyncio
+async def test_job_runs_all_items(job_db):
+    """测试任务执行全部条目并记录部分失败"""
+    service = JobService(generator=FakeGenerator())
+
+    questions = [f"问题{i}" for i in range(30)] + ["会失败的问题"]
+    job = await service.create_job(questions)
+    assert job.total == 31
+    await wait_job(service, job.id)
+
+    status = await service.get_job(job.id, include_items=True, limit=50)
+    assert status.status == "completed"
+    assert (status.completed, status.failed, status.pending) == (30, 1, 0)
+    assert status.progress == 1.0
+    assert status.tokens_used == 300
+    assert [item.question for item in status.items] == questions, "条目应保持原始顺序"
+    assert status.items[0].card["front"] == "问题0"
+    assert status.items[-1].error == "模拟生成失败"
+
+    failed = await service.get_job(job.id, include_items=True, status="failed")
+    assert [item.index for item in failed.items] == [30]
+
+
+@pytest.mark.asyncio
+async def test_cancel_job_keeps_partial_results(job_db, monkeypatch):
+    """测试取消任务：未开始的条目被取消，已完成的结果保留"""
+    monkeypatch.setattr(settings, "job_concurrency", 5)
+    gate = asyncio.Event()
+    generator = FakeGenerator(gate)
+    service = JobService(generator=generator)
+
+    job = await service.create_job([f"问题{i}" for i in range(20)])
+    while len(generator.questions) < 5:
+        await asyncio.sleep(0.01)
+
+    cancelled = await service.cancel_job(job.id)
+    assert cancelled.status == "cancelled"
+    gate.set()
+    await wait_job(service, job.id)
+
+    status = await service.get_job(job.id)
+    assert status.status == "cancelled", "取消后不应被标记为完成"
+    assert status.completed == len(generator.questions) == 5, "取消后不应再开始新的条目"
+    assert status.pending == 0
+
+    assert await service.cancel_job("missing") is None
+
+
+@pytest.mark.asyncio
+async def test_resume_unfinished_job(job_db):
+    """测试进程重启后从未完成的条目继续执行"""
+    async with job_db() as db:
+        job = GenerationJob(id="resume-test-job", status="running", total=3)
+        job.settings = {"deck_name": "恢复牌组"}
+        db.add(job)
+        db.add_all([
+            GenerationJobItem(job_id=job.id, position=0, question="已完成", status="done", tokens_used=10),
+            GenerationJobItem(job_id=job.id, position=1, question="执行中断", status="running"),
+            GenerationJobItem(job_id=job.id, position=2, question="未开始", status="pending"),
+        ])
+        await db.commit()
+
+    generator = FakeGenerator()
+    service = JobService(generator=generator)
+    assert await service.resume() == 1
+    await wait_job(service, "resume-test-job")
+
+    status = await service.get_job("resume-test-job", include_items=True)
+    assert status.status == "completed"
+    assert status.completed == 3
+    assert sorted(generator.questions) == sorted(["执行中断", "未开始"]), "已完成的条目不应重复生成"
+    assert status.items[1].card["deck_name"] == "恢复牌组"
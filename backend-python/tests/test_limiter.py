@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""测试LLM调用的自适应并发限制"""
+
+import asyncio
+
+import httpx
+import openai
+import pytest
+from app.core.config import settings
+from app.core import resilience
+from app.core.limiter import AdaptiveLimiter
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """初始窗口为 2 的限流器"""
+    monkeypatch.setattr(settings, "llm_limiter_enabled", True)
+    monkeypatch.setattr(settings, "llm_limiter_initial", 2)
+    monkeypatch.setattr(settings, "llm_limiter_min", 1)
+    monkeypatch.setattr(settings, "llm_limiter_max", 4)
+    monkeypatch.setattr(settings, "llm_limiter_cooldown", 0.0)
+    return AdaptiveLimiter()
+
+
+@pytest.mark.asyncio
+async def test_window_bounds_concurrency(limiter):
+    """测试并发数不超过窗口，超出的调用排队"""
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with limiter.slot("generate_answer"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+    tasks = [asyncio.create_task(call()) for _ in range(6)]
+    await asyncio.sleep(0.005)
+    assert limiter.stats()["queued"] == 4, "超出窗口的调用应该排队"
+
+    await asyncio.gather(*tasks)
+    assert peak == 2, f"并发数不应超过窗口: {peak}"
+    assert limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_additive_increase_and_multiplicative_decrease(limiter):
+    """测试成功时加性增长，限流时乘性减小"""
+    for _ in range(10):
+        async with limiter.slot("generate_answer") as slot:
+            slot.success(0.1)
+    assert limiter.window == 4, "连续成功后窗口应该增长到上限"
+
+    async with limiter.slot("generate_answer") as slot:
+        slot.overloaded("rate_limit")
+    assert limiter.window == 2
+    assert limiter.stats()["rate_limit"] == 1
+
+
+@pytest.mark.asyncio
+async def test_latency_inflation_and_headers(limiter):
+    """测试延迟升高和配额耗尽的响应头会减小窗口"""
+    limiter.limit = 4.0
+    async with limiter.slot("generate_answer") as slot:
+        slot.success(0.1)
+    async with limiter.slot("generate_answer") as slot:
+        slot.success(1.0)
+    assert limiter.window == 2, "延迟超过基线的倍数应该减小窗口"
+    assert limiter.counters["slow"] == 1
+
+    async with limiter.slot("check_quality") as slot:
+        slot.success(headers={"x-ratelimit-remaining-requests": "0", "x-ratelimit-limit-requests": "60"})
+    assert limiter.window == 1
+    assert limiter.stats()["rate_limit_headers"] == {"remaining_requests": 0, "limit_requests": 60}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak(limiter):
+    """测试排队中被取消的调用不占用槽位"""
+    limiter.limit = 1.0
+    release = asyncio.Event()
+
+    async def holder():
+        async with limiter.slot("generate_answer"):
+            await release.wait()
+
+    holding = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    release.set()
+    await asyncio.gather(holding, waiting, return_exceptions=True)
+
+    assert limiter.inflight == 0
+    assert limiter.stats()["queued"] == 0
+
+
+@pytest.mark.asyncio
+async def test_call_with_retry_reports_rate_limit(limiter, monkeypatch):
+    """测试重试层把 429 反馈给限流器"""
+    monkeypatch.setattr(resilience, "llm_limiter", limiter)
+    monkeypatch.setattr(settings, "llm_retry_base_delay", 0.001)
+    monkeypatch.setattr(settings, "llm_retry_max_delay", 0.01)
+    request = httpx.Request("POST", "https://example.com/chat/completions")
+    response = httpx.Response(429, request=request)
+    errors = [openai.RateLimitError("error", response=response, body=None)]
+
+    async def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert await resilience.call_with_retry(call, "generate_answer") == "ok"
+    assert limiter.counters["rate_limit"] == 1
+    assert limiter.counters["decreases"] == 1
+    assert limiter.inflight == 0
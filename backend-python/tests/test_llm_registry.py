@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""测试LLM客户端注册表"""
+
+import pytest
+from app.core.config import settings
+from app.core.llm import LLMClientRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """创建独立的注册表实例"""
+    monkeypatch.setattr(settings, "zhipu_api_key", "test-key")
+    return LLMClientRegistry()
+
+
+def test_shared_client_per_model(registry):
+    """测试同一模型复用同一个客户端"""
+    llm_a = registry.get_llm()
+    llm_b = registry.get_llm()
+    llm_flash = registry.get_llm("glm-4-flash")
+
+    assert llm_a is llm_b, "同一模型应复用同一个ChatOpenAI实例"
+    assert llm_a is not llm_flash, "不同模型应使用不同实例"
+    # 同一provider共享连接池
+    assert llm_a.http_async_client is llm_flash.http_async_client
+
+
+@pytest.mark.asyncio
+async def test_stats_and_close(registry):
+    """测试连接池统计与关闭"""
+    registry.get_llm()
+    stats = registry.stats()
+
+    assert settings.zhipu_model in stats["models"]
+    pool = stats["pools"][settings.zhipu_base_url]
+    assert pool["connections"] == 0
+    assert pool["requests"] == 0
+    assert stats["limits"]["max_connections"] == settings.llm_pool_max_connections
+
+    await registry.aclose()
+    assert registry.stats()["pools"] == {}
+
+
+def test_sampling_profile_does_not_mutate_shared_client(registry):
+    """测试采样配置按调用绑定，不修改共享实例"""
+    from app.core.llm import SamplingProfiles
+
+    llm = registry.get_llm()
+    bound = SamplingProfiles.GRADING.bind(llm)
+
+    assert bound.kwargs["temperature"] == 0.3
+    assert bound.kwargs["max_tokens"] == SamplingProfiles.GRADING.max_tokens
+    assert llm.temperature == 0.7, "共享实例的温度不应被修改"
+
+    with pytest.raises(Exception):
+        SamplingProfiles.GRADING.temperature = 1.0
+
+
+def test_sampling_profile_stop_sequences(registry):
+    """测试只有工作流的改进调用在改进说明处停止，评分的 max_tokens 足够容纳完整的问题和建议"""
+    from app.core.llm import SamplingProfiles
+
+    llm = registry.get_llm()
+    assert SamplingProfiles.IMPROVEMENT.bind(llm).kwargs["stop"] == ["改进说明"]
+    assert "stop" not in SamplingProfiles.IMPROVEMENT_WITH_SUMMARY.bind(llm).kwargs, "旧接口需要返回改进说明"
+    assert "stop" not in SamplingProfiles.GENERATION.bind(llm).kwargs, "答案结尾的标记需要保留"
+    assert SamplingProfiles.GRADING.max_tokens == 800
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""测试打包批量生成"""
+
+import pytest
+from langchain_core.messages import AIMessage
+from app.core.config import settings
+from app.core.llm import SamplingProfiles
+from app.core.usage import TokenUsage
+from app.services import packed_generation as packed_module
+from app.core.prompt_loader import prompt_loader
+from app.core.prompts import Prompts
+from app.services.packed_generation import PackedAnswerGenerator, resolve_pack_size
+
+
+@pytest.fixture
+def generator():
+    return PackedAnswerGenerator()
+
+
+def test_parse_packed_response(generator):
+    """测试解析JSON数组格式的回答"""
+    response = '[{"index": 1, "answer": "答案一"}, {"index": 2, "answer": "答案二"}]'
+    assert generator._parse_packed_response(response, 2) == ["答案一", "答案二"]
+
+
+def test_parse_packed_response_with_code_fence(generator):
+    """测试去掉代码块标记和前后说明文字"""
+    response = '以下是回答：\n```json\n[{"index": 2, "answer": "第二\n行"}, {"index": 1, "answer": "第一"}]\n```'
+    assert generator._parse_packed_response(response, 2) == ["第一", "第二\n行"]
+
+
+def test_parse_packed_response_partial(generator):
+    """测试缺失、越界和空白条目返回 None"""
+    response = '[{"index": 1, "answer": "答案一"}, {"index": 3, "answer": " "}, {"index": 9, "answer": "越界"}]'
+    assert generator._parse_packed_response(response, 3) == ["答案一", None, None]
+
+
+def test_parse_packed_response_invalid(generator):
+    """测试无效JSON或格式不符时全部回退"""
+    assert generator._parse_packed_response("抱歉，无法回答", 2) == [None, None]
+    assert generator._parse_packed_response('[{"index": 1, "answer": "未闭合"', 2) == [None, None]
+    assert generator._parse_packed_response('[{"idx": 1, "text": "字段错误"}]', 1) == [None]
+
+
+def test_parse_packed_response_truncated(generator):
+    """测试回复被截断时保留已经完整的条目"""
+    response = '```json\n[{"index": 1, "answer": "答案一"}, {"index": 2, "answer": "答案二"}, {"index": 3, "answer": "答案'
+    assert generator._parse_packed_response(response, 3) == ["答案一", "答案二", None]
+
+
+@pytest.mark.asyncio
+async def test_generate_scales_max_tokens_and_keeps_complete_items(monkeypatch, generator):
+    """测试 max_tokens 按问题数放大，截断的回复只让缺失的条目回退"""
+    monkeypatch.setattr(settings, "answer_cache_enabled", False)
+    profiles = []
+
+    async def fake_invoke(llm, messages, profile, node):
+        profiles.append(profile)
+        return AIMessage(content='[{"index": 1, "answer": "答案一"}, {"index": 2, "answer": "答'), TokenUsage()
+
+    monkeypatch.setattr(packed_module, "invoke_llm", fake_invoke)
+
+    answers, _ = await generator.generate(["问题一", "问题二", "问题三"], pack_size=3, use_cache=False)
+
+    assert answers == ["答案一", None, None], "只有缺失的条目返回 None，由调用方逐个生成"
+    assert profiles[0].max_tokens == SamplingProfiles.BATCH_GENERATION.max_tokens * 3
+    assert profiles[0].name == SamplingProfiles.BATCH_GENERATION.name
+
+
+def test_resolve_pack_size(monkeypatch):
+    """测试打包数量的默认值和上限"""
+    monkeypatch.setattr(settings, "batch_pack_size", 1)
+    monkeypatch.setattr(settings, "batch_pack_size_max", 10)
+
+    assert resolve_pack_size(None) == 1
+    assert resolve_pack_size(5) == 5
+    assert resolve_pack_size(50) == 10, "超过上限时应被截断"
+
+
+def test_generate_batch_prompt():
+    """测试打包提示词包含所有问题及序号"""
+    prompt = prompt_loader.get_prompt(
+        Prompts.CARD_GENERATION,
+        Prompts.GENERATE_BATCH,
+        questions=["问题A", "问题B"],
+        count=2
+    )
+    assert "1. 问题A" in prompt
+    assert "2. 问题B" in prompt
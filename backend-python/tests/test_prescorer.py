@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""测试质量检查预评分"""
+
+import pytest
+from app.core.config import settings
+from app.graph.nodes import CardGenerationNodes
+from app.schemas.card import AnkiCard
+from app.services.prescorer import FAIL, PASS, QualityPrescorer, repetition_ratio
+
+
+GOOD_ANSWER = "装饰器是一个接收函数并返回新函数的函数，常用于在不修改原函数的情况下添加日志、缓存或权限检查等功能。"
+
+
+@pytest.fixture
+def prescorer(monkeypatch):
+    """开启预评分"""
+    monkeypatch.setattr(settings, "prescore_enabled", True)
+    return QualityPrescorer()
+
+
+@pytest.mark.parametrize("back, verdict, issue", [
+    ("", FAIL, "卡片背面为空"),
+    ("什么是Python装饰器", FAIL, "答案只是重复了问题"),
+    ("装饰器是一个接收函数并返回新函数的函数，例如：", FAIL, "答案疑似被截断"),
+    ("示例如下：\n```python\n@cache\ndef f(): pass", FAIL, "答案疑似被截断"),
+    ("装饰器很有用。\n" * 6, FAIL, "答案内容大量重复"),
+    (GOOD_ANSWER, PASS, None),
+])
+def test_clear_cut_cards(prescorer, back, verdict, issue):
+    """测试明显合格和明显有问题的卡片"""
+    prescore = prescorer.evaluate(AnkiCard(front="什么是Python装饰器？", back=back))
+    assert prescore.verdict == verdict
+    assert prescore.confidence >= settings.prescore_min_confidence
+    if issue:
+        assert prescore.issues == [issue]
+        assert prescore.score < 70, "不通过的卡片分数应低于改进阈值"
+
+
+def test_uncertain_cards_are_deferred(prescorer):
+    """测试把握不足的卡片交给LLM质检"""
+    short = AnkiCard(front="1+1等于几？", back="2")
+    no_punctuation = AnkiCard(front="什么是GIL？", back="GIL是CPython中的全局解释器锁，同一时刻只允许一个线程执行字节码")
+
+    assert prescorer.check(short) is None, "很短的答案可能是正确的，不应直接判定"
+    assert prescorer.check(no_punctuation) is None, "没有句末标点时不应直接通过"
+    assert prescorer.stats()["deferred"] == 2
+    assert prescorer.stats()["llm_calls_avoided"] == 0
+
+
+def test_check_counts_avoided_calls(prescorer, monkeypatch):
+    """测试直接给出结果时计入省掉的LLM调用，关闭时不评估"""
+    result = prescorer.check(AnkiCard(front="什么是Python装饰器？", back=GOOD_ANSWER))
+    assert result.passed and result.score == settings.prescore_pass_score
+    assert prescorer.check(AnkiCard(front="问题", back="")).passed is False
+    assert prescorer.stats()["llm_calls_avoided"] == 2
+
+    monkeypatch.setattr(settings, "prescore_enabled", False)
+    assert prescorer.check(AnkiCard(front="问题", back="")) is None
+
+
+def test_repetition_ratio():
+    """测试重复程度"""
+    assert repetition_ratio(GOOD_ANSWER) < settings.prescore_pass_max_repetition
+    assert repetition_ratio("重复内容。" * 10) >= settings.prescore_max_repetition
+
+
+@pytest.mark.asyncio
+async def test_check_quality_node_skips_llm(prescorer, monkeypatch):
+    """测试质检节点在预评分有把握时不调用LLM"""
+    from app.graph import nodes as nodes_module
+
+    monkeypatch.setattr(nodes_module, "quality_prescorer", prescorer)
+    monkeypatch.setattr(settings, "quality_cache_enabled", False)
+
+    async def fail_invoke(*args, **kwargs):
+        raise AssertionError("不应调用LLM")
+
+    monkeypatch.setattr(nodes_module, "invoke_llm", fail_invoke)
+    nodes = CardGenerationNodes()
+    update = await nodes.check_quality({"card": AnkiCard(front="什么是Python装饰器？", back=GOOD_ANSWER)})
+
+    assert update["quality_check"].passed
+    assert "tokens_used" not in update
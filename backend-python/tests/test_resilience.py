@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""测试LLM调用的重试与超时"""
+
+import asyncio
+
+import httpx
+import openai
+import pytest
+from app.core.config import settings
+from app.core import resilience
+from app.core.resilience import LLMCallError, call_with_retry, classify_error, retry_after, stream_with_retry
+
+
+def api_error(status_code: int, headers: dict = None) -> openai.APIStatusError:
+    """构造指定状态码的 OpenAI SDK 错误"""
+    request = httpx.Request("POST", "https://example.com/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    error_class = {429: openai.RateLimitError, 400: openai.BadRequestError}.get(status_code, openai.InternalServerError)
+    return error_class("error", response=response, body=None)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    """缩短退避时间"""
+    monkeypatch.setattr(settings, "llm_retry_base_delay", 0.001)
+    monkeypatch.setattr(settings, "llm_retry_max_delay", 0.05)
+    monkeypatch.setattr(settings, "llm_max_retries", 3)
+
+
+def test_classify_error():
+    """测试错误分类"""
+    assert classify_error(api_error(429)) == resilience.RATE_LIMIT
+    assert classify_error(api_error(503)) == resilience.SERVER_ERROR
+    assert classify_error(api_error(400)) == resilience.CLIENT_ERROR
+    assert classify_error(asyncio.TimeoutError()) == resilience.TIMEOUT
+    assert classify_error(openai.APIConnectionError(request=httpx.Request("POST", "https://example.com"))) == resilience.CONNECTION
+
+
+def test_retry_after():
+    """测试解析 Retry-After 响应头"""
+    assert retry_after(api_error(429, {"retry-after": "2"})) == 2.0
+    assert retry_after(api_error(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(api_error(429)) is None
+    assert retry_after(ValueError()) is None
+
+
+@pytest.mark.asyncio
+async def test_retry_rate_limit_then_succeed():
+    """测试限流后按 Retry-After 等待并重试成功"""
+    errors = [api_error(429, {"retry-after": "0.02"}), api_error(502)]
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    assert await call_with_retry(call, "test_retry") == "ok"
+    assert calls == 3
+    assert loop.time() - start >= 0.02, "应至少等待 Retry-After 指定的时间"
+
+    counters = resilience.retry_metrics.stats()["by_node"]["test_retry"]
+    assert counters["retries"] == 2
+    assert counters["rate_limit"] == 1 and counters["server_error"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_error_not_retried():
+    """测试客户端错误不重试"""
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        raise api_error(400)
+
+    with pytest.raises(LLMCallError) as exc_info:
+        await call_with_retry(call, "test_client_error")
+    assert calls == 1
+    assert exc_info.value.kind == resilience.CLIENT_ERROR
+
+
+@pytest.mark.asyncio
+async def test_timeout_retried_then_fails():
+    """测试挂起的调用按超时中断并在重试用尽后失败"""
+    async def call():
+        await asyncio.sleep(10)
+
+    with pytest.raises(LLMCallError) as exc_info:
+        await call_with_retry(call, "test_timeout", timeout=0.01, max_retries=2)
+    assert exc_info.value.kind == resilience.TIMEOUT
+    assert exc_info.value.attempts == 3
+
+
+@pytest.mark.asyncio
+async def test_stream_retried_before_first_chunk():
+    """测试流式调用在输出第一个片段前出错时重试，片段之间按空闲时间超时"""
+    errors = [api_error(503)]
+
+    async def stream():
+        if errors:
+            raise errors.pop(0)
+        for token in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    chunks = [chunk async for chunk in stream_with_retry(stream, "test_stream", timeout=0.05)]
+    assert chunks == ["a", "b", "c"], "总耗时超过空闲超时也不应中断"
+    assert resilience.retry_metrics.stats()["by_node"]["test_stream"]["retries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_not_retried_after_first_chunk():
+    """测试已经输出片段后不再重试，空闲超时后中断"""
+    calls = 0
+
+    async def stream():
+        nonlocal calls
+        calls += 1
+        yield "a"
+        await asyncio.sleep(10)
+        yield "b"
+
+    chunks = []
+    with pytest.raises(LLMCallError) as exc_info:
+        async for chunk in stream_with_retry(stream, "test_stream_idle", timeout=0.01):
+            chunks.append(chunk)
+    assert chunks == ["a"]
+    assert calls == 1, "已经输出的片段无法撤回，不应重试"
+    assert exc_info.value.kind == resilience.TIMEOUT
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""测试语义近似问题缓存"""
+
+import pytest
+from app.core.config import settings
+from app.services.semantic_cache import SemanticAnswerCache
+
+pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """创建启用状态的语义缓存"""
+    monkeypatch.setattr(settings, "semantic_cache_enabled", True)
+    return SemanticAnswerCache(path=str(tmp_path / "semantic.npz"))
+
+
+def test_paraphrase_hit(cache):
+    """测试近似问题命中"""
+    cache.add("什么是RESTful API?", "REST风格的接口", "glm-4", "v1")
+
+    match = cache.lookup("解释一下RESTful API", "glm-4", "v1")
+    assert match is not None, "近似问题应命中"
+    entry, similarity = match
+    assert entry["answer"] == "REST风格的接口"
+    assert similarity >= settings.semantic_cache_threshold
+
+
+def test_unrelated_and_mismatched_miss(cache):
+    """测试不相关问题及不同模型/提示词版本不命中"""
+    cache.add("什么是机器学习？", "ML答案", "glm-4", "v1")
+
+    assert cache.lookup("什么是深度学习？", "glm-4", "v1") is None
+    assert cache.lookup("什么是机器学习", "glm-4-flash", "v1") is None
+    assert cache.lookup("什么是机器学习", "glm-4", "v2") is None
+    assert cache.stats()["misses"] == 3
+
+
+def test_persistence_and_eviction(cache, monkeypatch):
+    """测试持久化与容量淘汰"""
+    monkeypatch.setattr(settings, "semantic_cache_max_entries", 2)
+    cache.add("什么是TCP", "TCP答案", "glm-4", "v1")
+    cache.add("什么是UDP", "UDP答案", "glm-4", "v1")
+    cache.add("什么是HTTP", "HTTP答案", "glm-4", "v1")
+    cache.save()
+
+    reloaded = SemanticAnswerCache(path=str(cache.path))
+    assert reloaded.lookup("什么是TCP", "glm-4", "v1") is None, "最早的条目应被淘汰"
+    entry, _ = reloaded.lookup("HTTP是什么", "glm-4", "v1")
+    assert entry["answer"] == "HTTP答案"
+    assert reloaded.stats()["size"] == 2
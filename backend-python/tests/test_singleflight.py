@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""测试相同请求合并"""
+
+import asyncio
+
+import pytest
+
+from app.core import singleflight as singleflight_module
+from app.core.config import settings
+from app.core.singleflight import SingleFlight, collapse, expand
+from app.graph.nodes import BatchGenerationNodes
+from app.schemas.card import CardGenerationRequest
+
+ANSWER = "装饰器是一个接收函数并返回新函数的函数。"
+QUALITY = "总分：85分\n是否通过：是\n存在的问题：\n改进建议：\n1. 补充示例"
+
+
+def reply(index: int, prompt: str) -> str:
+    """质检提示返回评分，其他返回答案"""
+    return QUALITY if "正面：" in prompt else ANSWER
+
+
+@pytest.fixture
+def flights(monkeypatch):
+    """独立的合并实例"""
+    monkeypatch.setattr(settings, "singleflight_enabled", True)
+    monkeypatch.setattr(settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(settings, "quality_cache_enabled", False)
+    monkeypatch.setattr(settings, "prescore_enabled", False)
+    flights = SingleFlight()
+    monkeypatch.setattr(singleflight_module, "singleflight", flights)
+    from app.graph import nodes as nodes_module
+    from app.services import idempotency as idempotency_module
+    monkeypatch.setattr(nodes_module, "singleflight", flights)
+    monkeypatch.setattr(idempotency_module, "singleflight", flights)
+    return flights
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    """测试同时进行的相同调用只执行一次，完成后不再合并"""
+    flights = SingleFlight()
+    executions = 0
+
+    async def call():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.02)
+        return "结果"
+
+    results = await asyncio.gather(*[flights.do("generate_answer", "key", call) for _ in range(3)])
+
+    assert executions == 1
+    assert [result for result, _ in results] == ["结果"] * 3
+    assert [shared for _, shared in results] == [False, True, True]
+    assert flights.stats()["by_namespace"]["generate_answer"] == {"executions": 1, "shared": 2, "collapsed": 0}
+
+    await flights.do("generate_answer", "key", call)
+    assert executions == 2, "调用完成后相同的请求应重新执行"
+    assert flights.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_others():
+    """测试发起调用的请求被取消时，其他等待者仍得到结果"""
+    flights = SingleFlight()
+    started = asyncio.Event()
+
+    async def call():
+        started.set()
+        await asyncio.sleep(0.05)
+        return "结果"
+
+    leader = asyncio.create_task(flights.do("check_quality", "key", call))
+    await started.wait()
+    follower = asyncio.create_task(flights.do("check_quality", "key", call))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == ("结果", True)
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+@pytest.mark.asyncio
+async def test_errors_are_shared():
+    """测试调用失败时所有等待者都收到异常"""
+    flights = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("失败")
+
+    results = await asyncio.gather(
+        flights.do("generate_answer", "key", call),
+        flights.do("generate_answer", "key", call),
+        return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_collapse_and_expand():
+    """测试合并重复条目并按原始顺序展开"""
+    unique, positions = collapse(["a", "b", "A", "c", "b"], str.lower)
+    assert unique == ["a", "b", "c"]
+    assert positions == [0, 1, 0, 2, 1]
+    assert expand(["x", "y", "z"], positions) == ["x", "y", "x", "z", "y"]
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_share_llm_calls(flights, service, scripted_llm):
+    """测试两个相同的单卡请求同时进行时只调用一次生成和一次质检"""
+    llm = scripted_llm(reply, delay=0.05)
+    service.card_workflow.nodes.llm = llm
+
+    request = CardGenerationRequest(question="什么是装饰器？")
+    first, second = await asyncio.gather(service.generate_card(request), service.generate_card(request))
+
+    assert first["success"] and second["success"]
+    assert llm.calls == 2, "相同请求应共享生成和质检调用"
+    assert first["card"].back == second["card"].back == ANSWER
+    assert first["card"].id != second["card"].id
+    assert sorted("generate_answer" in result["token_usage"] for result in (first, second)) == [False, True], \
+        "只有实际发起调用的请求计入用量"
+
+
+@pytest.mark.asyncio
+async def test_batch_duplicates_collapsed(flights, scripted_llm):
+    """测试批次内的重复问题在调度前合并，结果按原始顺序返回"""
+    nodes = BatchGenerationNodes()
+    llm = scripted_llm(reply, delay=0.05)
+    nodes.card_nodes.llm = llm
+    questions = ["什么是装饰器？", "什么是GIL？", "什么是装饰器", "什么是装饰器？"]
+
+    result = await nodes.process_batch({"questions": questions, "settings": {}})
+
+    assert llm.calls == 4, "两个不同的问题各生成和质检一次"
+    assert [card["card"]["front"] for card in result["cards"]] == questions
+    assert flights.stats()["by_namespace"]["batch"]["collapsed"] == 2
+    assert result["token_usage"]["generate_answer"]["calls"] == 2, "重复问题的用量只计一次"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("legacy_first", [True, False])
+async def test_legacy_and_graph_quality_checks_share_one_call(flights, monkeypatch, scripted_llm, legacy_first):
+    """测试旧接口和LangGraph节点同时质检同一张卡片时共用一次调用，无论哪一方先发起"""
+    from app.services.ai_service import AIService
+    from app.graph.nodes import CardGenerationNodes
+    from app.schemas.card import AnkiCard
+
+    monkeypatch.setattr(settings, "zhipu_api_key", settings.zhipu_api_key or "test-key")
+    llm = scripted_llm(reply, delay=0.05)
+    legacy = AIService()
+    legacy.llm = llm
+    nodes = CardGenerationNodes()
+    nodes.llm = llm
+    card = AnkiCard(front="什么是装饰器？", back=ANSWER)
+
+    calls = [legacy.quality_check(card), nodes._grade_card(card)]
+    if not legacy_first:
+        calls.reverse()
+    results = await asyncio.gather(*calls)
+    legacy_result, (graph_result, _) = results if legacy_first else results[::-1]
+
+    assert llm.calls == 1, "相同卡片的质检应只调用一次"
+    assert legacy_result.score == graph_result.score == 85
+    assert flights.stats()["by_namespace"]["check_quality"]["shared"] == 1
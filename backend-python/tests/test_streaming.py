@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""测试流式生成接口"""
+
+import json
+
+import httpx
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+from app.core.config import settings
+from app.schemas.card import CardGenerationRequest
+
+ANSWER = "装饰器 是 一个 接收函数 并 返回新函数 的 函数"
+QUALITY = "总分：85分\n是否通过：是\n存在的问题：\n改进建议：\n1. 补充示例"
+
+
+def parse_sse(body: str) -> list:
+    """解析SSE响应体为 (事件, 数据) 列表"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture(autouse=True)
+def disable_caches(monkeypatch):
+    """关闭缓存，保证每次都调用模型"""
+    monkeypatch.setattr(settings, "answer_cache_enabled", False)
+    monkeypatch.setattr(settings, "quality_cache_enabled", False)
+
+
+def test_legacy_generate_stream(monkeypatch, fake_llm):
+    """测试 /cards/generate/stream 按顺序推送事件"""
+    from app.main import app
+    from app.api.v1.endpoints import cards
+
+    monkeypatch.setattr(cards.ai_service, "llm", fake_llm(ANSWER, QUALITY))
+
+    with TestClient(app) as client:
+        response = client.post("/api/v1/cards/generate/stream", json={"question": "什么是装饰器？"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+
+    assert names.count("token") > 1, "答案应分多个片段推送"
+    assert names[-3:] == ["card", "quality_check", "done"]
+    assert "".join(data["content"] for name, data in events if name == "token") == ANSWER
+    assert events[-2][1]["score"] == 85
+
+
+@pytest.mark.asyncio
+async def test_langgraph_stream_card(service, monkeypatch, fake_llm):
+    """测试LangGraph流式生成只推送答案节点的token"""
+    monkeypatch.setattr(service.card_workflow.nodes, "llm", fake_llm(ANSWER, QUALITY))
+
+    events = [item async for item in service.stream_card(CardGenerationRequest(question="什么是装饰器？"))]
+    names = [name for name, _ in events]
+
+    assert "".join(data["content"] for name, data in events if name == "token") == ANSWER
+    assert names[-3:] == ["card", "quality_check", "done"]
+    assert events[-2][1]["passed"] is True
+
+
+class MidStreamFailingLLM(GenericFakeChatModel):
+    """第一次流式调用输出两个片段后返回 503，之后正常输出"""
+    stream_calls: int = 0
+
+    async def _astream(self, *args, **kwargs):
+        self.stream_calls += 1
+        failing = self.stream_calls == 1
+        emitted = 0
+        async for chunk in super()._astream(*args, **kwargs):
+            if failing and emitted == 2:
+                request = httpx.Request("POST", "https://example.com/chat/completions")
+                raise openai.InternalServerError(
+                    "unavailable", response=httpx.Response(503, request=request), body=None
+                )
+            emitted += 1
+            yield chunk
+
+
+@pytest.mark.asyncio
+async def test_langgraph_stream_card_resets_on_retry(service, monkeypatch):
+    """测试生成答案中途失败重试时先推送 reset，reset 之后的片段组成完整答案"""
+    monkeypatch.setattr(settings, "llm_max_retries", 1)
+    monkeypatch.setattr(settings, "llm_retry_base_delay", 0.0)
+    monkeypatch.setattr(settings, "llm_breaker_enabled", False)
+    llm = MidStreamFailingLLM(messages=iter([AIMessage(content=ANSWER), AIMessage(content=ANSWER),
+                                             AIMessage(content=QUALITY)]))
+    monkeypatch.setattr(service.card_workflow.nodes, "llm", llm)
+
+    events = [item async for item in service.stream_card(CardGenerationRequest(question="什么是装饰器？"))]
+    names = [name for name, _ in events]
+
+    assert names.count("reset") == 1, "重试前应推送一次 reset"
+    reset_at = names.index("reset")
+    assert names[:reset_at] == ["token", "token"], "reset 之前是失败调用已经推送的片段"
+    assert "".join(data["content"] for name, data in events[reset_at:] if name == "token") == ANSWER
+    assert names[-3:] == ["card", "quality_check", "done"]
+
+
+@pytest.mark.asyncio
+async def test_stream_workflow_runs_graph_once(service, monkeypatch, fake_llm):
+    """测试工作流流式接口逐节点推送且只执行一次图"""
+    # 假模型只有两条回复，若图被执行两次会耗尽并报错
+    monkeypatch.setattr(service.card_workflow.nodes, "llm", fake_llm(ANSWER, QUALITY))
+
+    events = [item async for item in service.stream_workflow(CardGenerationRequest(question="什么是装饰器？"))]
+    steps = [data["step"] for name, data in events if name == "step"]
+
+    assert steps == ["generate_answer", "create_card", "check_quality", "create_final"]
+    name, final = events[-1]
+    assert name == "final"
+    assert final["steps"] == 4
+    assert final["final_card"]["back"] == ANSWER
+    assert final["final_quality_check"]["score"] == 85
+    json.dumps(events)  # 所有事件数据都应可序列化
+    assert not any(
+        str(thread_id).startswith("stream-") for thread_id in service.card_workflow.memory.storage
+    ), "流式请求结束后应删除其检查点"
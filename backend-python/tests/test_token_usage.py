@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""测试token用量统计"""
+
+import asyncio
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.core.usage import (
+    TokenUsage, merge_token_usage, record_usage, track_usage, usage_metrics
+)
+
+
+def make_message(prompt_tokens: int, completion_tokens: int) -> AIMessage:
+    """构造带用量元数据的模型回复"""
+    return AIMessage(
+        content="答案",
+        usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        },
+        response_metadata={"model_name": "glm-4"}
+    )
+
+
+def test_usage_from_message():
+    """测试从usage_metadata读取用量"""
+    usage = TokenUsage.from_message(make_message(120, 80))
+    assert usage.prompt_tokens == 120
+    assert usage.completion_tokens == 80
+    assert usage.total_tokens == 200
+    assert usage.calls == 1
+
+    assert TokenUsage.from_message(AIMessage(content="无用量")).total_tokens == 0
+
+
+def test_merge_token_usage():
+    """测试按节点合并用量"""
+    left = {"generate_answer": TokenUsage(total_tokens=100, calls=1).model_dump()}
+    right = {
+        "generate_answer": TokenUsage(total_tokens=50, calls=1).model_dump(),
+        "check_quality": TokenUsage(total_tokens=30, calls=1).model_dump()
+    }
+    merged = merge_token_usage(left, right)
+
+    assert merged["generate_answer"]["total_tokens"] == 150
+    assert merged["generate_answer"]["calls"] == 2
+    assert merged["check_quality"]["total_tokens"] == 30
+    assert left["generate_answer"]["total_tokens"] == 100, "不应修改输入"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_request_trackers():
+    """测试并发请求各自统计，批次跟踪器汇总子请求"""
+    before = usage_metrics.stats()["total"]["total_tokens"]
+
+    async def single_request(prompt_tokens: int):
+        with track_usage() as usage:
+            await asyncio.sleep(0)
+            record_usage("generate_answer", make_message(prompt_tokens, 10))
+            await asyncio.sleep(0)
+            record_usage("check_quality", make_message(5, 5))
+        return usage.total.total_tokens
+
+    with track_usage() as batch_usage:
+        totals = await asyncio.gather(single_request(100), single_request(200))
+
+    assert totals == [120, 220], "并发请求的用量不应互相覆盖"
+    assert batch_usage.total.total_tokens == 340
+    assert batch_usage.node_usage()["check_quality"]["calls"] == 2
+    assert usage_metrics.stats()["total"]["total_tokens"] - before == 340
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""测试工作流编译结果复用"""
+
+from app.services.langgraph_service import LangGraphService
+
+
+def test_compiled_graphs_are_reused():
+    """测试工作流只编译一次，按是否使用检查点分别缓存"""
+    service = LangGraphService()
+    service.warmup()
+
+    card_workflow = service.card_workflow
+    assert card_workflow.compile() is card_workflow.compile()
+    assert card_workflow.compile(use_memory=True) is card_workflow.compile(use_memory=True)
+    assert card_workflow.compile() is not card_workflow.compile(use_memory=True), "有无检查点应分别编译"
+    assert card_workflow.compile(use_memory=True).checkpointer is card_workflow.memory
+
+    assert service.batch_workflow.compile() is service.batch_workflow.compile()
+    assert service.batch_workflow.nodes.compile() is service.batch_workflow.nodes.compile()
+    assert service.improvement_workflow.compile() is service.improvement_workflow.compile()
+
+
+def test_services_share_one_instance():
+    """测试接口和批量任务服务共用同一个 LangGraphService"""
+    from app.api.v1.endpoints import cards_langgraph
+    from app.services.job_service import job_service
+    from app.services.langgraph_service import langgraph_service
+
+    assert cards_langgraph.langgraph_service is langgraph_service
+    assert job_service.generator is langgraph_service